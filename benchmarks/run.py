@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+benchmarks/run.py
+
+Headless benchmark suite for the desktop geometry and rendering paths, the
+server's NodeManager and the Flask routes. Runs on the Matplotlib Agg backend
+and never opens a Tk window.
+
+    python benchmarks/run.py                          run everything, save results
+    python benchmarks/run.py --sizes 1000 10000       only these network sizes
+    python benchmarks/run.py --save base.json         save to a chosen file
+    python benchmarks/run.py --compare base.json      run, then compare against a baseline
+
+Results are JSON: run metadata plus, per benchmark, the per-call min/median/mean
+in seconds, or in rows for the counts that carry a unit (how many rows one
+layout insert moves). --compare prints the median ratio for every benchmark present in
+both files and exits with status 1 when any slowed down by more than --threshold.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+import server
+import vsm_network
+from layout import Layout
+from node_store import NodeStore
+from response_cache import ResponseCache
+from style import OrgUnitRule, Style, SubtreeRule
+
+SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_OUTPUT = os.path.join(ROOT, 'benchmarks', 'results', 'latest.json')
+
+# -----------------------------------------------------------------------------
+# TIMING
+# -----------------------------------------------------------------------------
+
+def measure(fn, repeat=5, number=1):
+    """Time fn: repeat rounds of number calls. Returns per-call seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'repeat': repeat,
+        'number': number,
+    }
+
+def calls(items):
+    """A zero-argument callable that consumes one item per call."""
+    items = iter(items)
+    return lambda: next(items)()
+
+class Suite:
+    def __init__(self, only=None):
+        self.results = {}
+        self.only = only
+
+    def selected(self, name):
+        return not self.only or any(pattern in name for pattern in self.only)
+
+    def run(self, name, fn, repeat=5, number=1):
+        if self.selected(name):
+            self.report(name, measure(fn, repeat, number))
+
+    def record(self, name, seconds):
+        """Record a one-off timing taken by the caller (e.g. fixture construction)."""
+        if self.selected(name):
+            self.report(name, {'min': seconds, 'median': seconds, 'mean': seconds, 'repeat': 1, 'number': 1})
+
+    def count(self, name, values, unit='rows'):
+        """Record per-call counts taken by the caller (e.g. rows moved per insert)."""
+        if values and self.selected(name):
+            self.report(name, {'min': min(values), 'median': statistics.median(values),
+                               'mean': statistics.fmean(values), 'max': max(values),
+                               'repeat': len(values), 'number': 1, 'unit': unit})
+
+    def report(self, name, result):
+        self.results[name] = result
+        extra = ('max', result['max']) if 'unit' in result else ('min', result['min'])
+        print(f"{name:<48} {format_value(result, result['median']):>10}  "
+              f"({extra[0]} {format_value(result, extra[1])})")
+
+def format_value(result, value):
+    if 'unit' in result:
+        return f"{value:.0f} {result['unit']}"
+    return format_seconds(value)
+
+def format_seconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+# -----------------------------------------------------------------------------
+# FIXTURES
+# -----------------------------------------------------------------------------
+
+def build_store(size, poly_order=6):
+    """A fractal network of exactly size nodes, built breadth-first from the seed."""
+    store = NodeStore(capacity=size)
+    store.add('0/0/1', (0, 0), 0, poly_order=poly_order, org_unit='n/a')
+    frontier = np.array([0])
+    while store.size < size and len(frontier):
+        child_positions, _ = vsm_network.fractalise_objects(store.pos[frontier], store.layer[frontier],
+                                                            poly_order)
+        take = min(len(frontier) * poly_order, size - store.size)
+        parents = np.repeat(frontier, poly_order)[:take]
+        numbers = np.tile(np.arange(1, poly_order + 1), len(frontier))[:take]
+        tags = [f"{store.tags[p]}-{n}" for p, n in zip(parents.tolist(), numbers.tolist())]
+        frontier = store.add_many(tags, child_positions.reshape(-1, 2)[:take], store.layer[parents] + 1,
+                                  poly_order, parents, nodes=numbers)
+    return store
+
+def leaf_tags(store, count, rng):
+    live = store.live_rows()
+    leaves = np.setdiff1d(live, store.parent[live])
+    picked = rng.choice(leaves, size=min(count, len(leaves)), replace=False)
+    return [store.tags[row] for row in picked.tolist()]
+
+# -----------------------------------------------------------------------------
+# BENCHMARKS
+# -----------------------------------------------------------------------------
+
+def bench_geometry(suite):
+    node = {'pos': (0.1, 0.2), 'layer': 3}
+    direction = np.array([1.0, 0.5])
+    suite.run('geometry.forward', lambda: vsm_network.forward((0.1, 0.2), direction, 0.5), number=2000)
+    suite.run('geometry.turn', lambda: vsm_network.turn(direction, 60), number=2000)
+    suite.run('geometry.generate_polygon', lambda: vsm_network.generate_polygon((0.1, 0.2), 0.25, 6),
+              number=2000)
+    suite.run('geometry.fractalise_object', lambda: vsm_network.fractalise_object(node, 6, 0.2), number=2000)
+    for parents in (1000, 100000):
+        centers = np.random.default_rng(0).random((parents, 2))
+        layers = np.full(parents, 3)
+        suite.run(f'geometry.fractalise_objects[{parents}]',
+                  lambda: vsm_network.fractalise_objects(centers, layers, 6))
+
+def bench_desktop(suite, size, rng):
+    store = build_store(size)
+    start = time.perf_counter()
+    network = vsm_network.VSMNetwork(nodes=store)
+    suite.record(f'desktop.init[{size}]', time.perf_counter() - start)
+    leaves = leaf_tags(store, 10, rng)
+    suite.run(f'desktop.add_child_nodes[{size}]',
+              calls([lambda tag=tag: network.add_child_nodes(tag) for tag in leaves]), repeat=len(leaves))
+    suite.run(f'desktop.refresh_screen[{size}]', network.refresh_screen, repeat=3)
+    low, high = store.pos[store.live_rows()].min(axis=0), store.pos[store.live_rows()].max(axis=0)
+    points = rng.uniform(low, high, size=(5 * 1000, 2)).tolist()
+    suite.run(f'desktop.find_nearest_node[{size}]',
+              calls([lambda p=p: network.find_nearest_node(p) for p in points]), number=1000)
+    live = store.live_rows()
+    style = Style([OrgUnitRule(), SubtreeRule(['0/0/1-1'], color='orange', size_scale=1.5)])
+    suite.run(f'desktop.style_apply[{size}]', lambda: style.apply(store, live))
+    vsm_network.plt.close(network.fig)
+
+def bench_server(suite, size, rng):
+    manager = server.NodeManager(cache=ResponseCache())
+    manager.replace_nodes(build_store(size))
+    server.node_manager = manager
+    client = server.app.test_client()
+    leaves = leaf_tags(manager.nodes, 400, rng)
+    url_tags = [tag.replace('/', '|') for tag in leaves]
+
+    add = [lambda tag=tag: manager.add_child_nodes(tag, 6) for tag in leaves[:100]]
+    suite.run(f'manager.add_child_nodes[{size}]', calls(add), repeat=5, number=20)
+    suite.run(f'manager.get_node[{size}]', calls([lambda tag=tag: manager.get_node(tag) for tag in leaves]),
+              repeat=4, number=100)
+
+    posts = [lambda tag=tag: client.post(f'/nodes/children/{tag}', json={'count': 6})
+             for tag in url_tags[100:200]]
+    suite.run(f'http.post_children[{size}]', calls(posts), repeat=5, number=20)
+    batches = [lambda chunk=chunk: client.post('/nodes/batch', json={'expand': [[tag, 6] for tag in chunk]})
+               for chunk in (leaves[start:start + 20] for start in range(200, 400, 20))]
+    suite.run(f'http.post_batch_expand20[{size}]', calls(batches), repeat=10)
+    gets = [lambda tag=tag: client.get(f'/nodes/{tag}') for tag in url_tags]
+    suite.run(f'http.get_node[{size}]', calls(gets), repeat=4, number=100)
+    suite.run(f'http.get_node_cached[{size}]', lambda: client.get(f'/nodes/{url_tags[0]}'), number=200)
+    revision = manager.revision
+    suite.run(f'http.get_changes_since[{size}]', lambda: client.get(f'/nodes?since={revision - 5}'), repeat=5)
+    suite.run(f'http.get_page1000[{size}]', lambda: client.get('/nodes?limit=1000'), repeat=5)
+    if size <= 100000:
+        manager.cache = ResponseCache(0)
+        suite.run(f'http.get_all_nodes[{size}]', lambda: client.get('/nodes'), repeat=3)
+        manager.cache = ResponseCache()
+        suite.run(f'http.get_all_nodes_cached[{size}]', lambda: client.get('/nodes'), repeat=5)
+
+def bench_layout(suite, size, rng):
+    """
+    Layout passes, then single inserts: anywhere, and below the deepest layer
+    (a new level). Each insert is timed and counted by the rows it moves besides
+    the new node, on a relaid-out and on an adopted (classic fractal) network.
+    """
+    for mode in ('relayout', 'adopt'):
+        store = build_store(size)
+        layout = Layout(store)
+        start = time.perf_counter()
+        layout.relayout() if mode == 'relayout' else layout.adopt()
+        suite.record(f'layout.{mode}[{size}]', time.perf_counter() - start)
+        live = store.live_rows()
+        deepest = live[store.layer[live] == store.layer[live].max()]
+        for kind, parents in (('insert', live), ('insert_new_level', deepest)):
+            moved = []
+
+            def insert(parent):
+                tag = f"{store.tags[parent]}-b{store.size}"
+                row = store.add(tag, (0, 0), int(store.layer[parent]) + 1, parent=store.tags[parent],
+                                node=len(store.child_rows(parent)) + 1)
+                moved.append(len(layout.place([row])) - 1)
+
+            picked = rng.choice(parents, size=20).tolist()
+            suite.run(f'layout.{mode}.{kind}[{size}]',
+                      calls([lambda parent=parent: insert(parent) for parent in picked]), repeat=len(picked))
+            suite.count(f'layout.{mode}.{kind}_moved[{size}]', moved)
+
+# -----------------------------------------------------------------------------
+# BASELINES
+# -----------------------------------------------------------------------------
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+def compare(results, baseline, threshold):
+    """Print median ratios against baseline; returns the names that regressed."""
+    regressed = []
+    print(f"\n{'benchmark':<48} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['median'], result['median']
+        ratio = new / old if old else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  slower'
+            regressed.append(name)
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(f"{name:<48} {format_value(result, old):>10} {format_value(result, new):>10} {ratio:>6.2f}x{flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="VSM network benchmarks")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="network sizes to test")
+    parser.add_argument('--only', nargs='+', help="run only benchmarks whose name contains one of these")
+    parser.add_argument('--skip-desktop', action='store_true')
+    parser.add_argument('--skip-server', action='store_true')
+    parser.add_argument('--skip-layout', action='store_true')
+    parser.add_argument('--save', default=DEFAULT_OUTPUT, help="where to write the results")
+    parser.add_argument('--compare', help="baseline results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    suite = Suite(args.only)
+    bench_geometry(suite)
+    for size in args.sizes:
+        if not args.skip_desktop:
+            bench_desktop(suite, size, rng)
+        if not args.skip_server:
+            bench_server(suite, size, rng)
+        if not args.skip_layout:
+            bench_layout(suite, size, rng)
+
+    output = {'meta': metadata(), 'results': suite.results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+    with open(args.save, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressed = compare(suite.results, baseline['results'], args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+change_feed.py
+
+Bounded in-memory ring of the server's mutation events, streamed to clients
+by the /events Server-Sent Events route. Each event's id is the revision it
+produced, so a reconnecting client resumes from its Last-Event-ID.
+
+Subscribers share the ring and read it at their own pace rather than owning
+queues, so memory stays bounded however many clients are connected. A client
+that falls so far behind that the events it needs have left the ring gets a
+single resync event instead, and catches up with GET /nodes?since=<revision>.
+"""
+
+from collections import deque
+from itertools import islice
+import threading
+
+class ChangeFeed:
+    """
+    The most recent events as (id, name, data bytes), bounded by count and by
+    total size. Ids are consecutive revisions; the newest event is always kept.
+    """
+
+    def __init__(self, max_events=4096, max_bytes=16 * 1024 * 1024, max_subscribers=64):
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.max_subscribers = max_subscribers
+        self.events = deque()  # Oldest first
+        self.size = 0
+        self.last_id = 0
+        self.subscribers = 0
+        self.resyncs = 0
+        self.cond = threading.Condition()
+
+    def reset(self, last_id):
+        """Drop buffered events and continue the feed after last_id."""
+        with self.cond:
+            self.events.clear()
+            self.size = 0
+            self.last_id = last_id
+            self.cond.notify_all()
+
+    def publish(self, event_id, name, data):
+        with self.cond:
+            if self.events and event_id != self.last_id + 1:
+                self.events.clear()
+                self.size = 0
+            self.events.append((event_id, name, data))
+            self.size += len(data)
+            while len(self.events) > 1 and (len(self.events) > self.max_events or self.size > self.max_bytes):
+                self.size -= len(self.events.popleft()[2])
+            self.last_id = event_id
+            self.cond.notify_all()
+
+    def subscribe(self):
+        """Claim a subscriber slot; False when all max_subscribers are taken."""
+        with self.cond:
+            if self.subscribers >= self.max_subscribers:
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+
+    def read(self, after, timeout=None, limit=100):
+        """
+        Up to limit events with ids after `after`, oldest first, waiting up to
+        timeout for the first one ([] if none arrives). Returns None when the
+        caller must resync: the events it needs have been dropped, or `after`
+        lies beyond the feed (a revision from before a server restart).
+        """
+        with self.cond:
+            if after <= self.last_id and not self.cond.wait_for(lambda: self.last_id > after, timeout):
+                return []
+            first = self.events[0][0] if self.events else self.last_id + 1
+            if after > self.last_id or after + 1 < first:
+                self.resyncs += 1
+                return None
+            start = after + 1 - first
+            return list(islice(self.events, start, start + limit))
+
+    def stats(self):
+        with self.cond:
+            return {
+                'events': len(self.events),
+                'bytes': self.size,
+                'firstId': self.events[0][0] if self.events else None,
+                'lastId': self.last_id,
+                'subscribers': self.subscribers,
+                'resyncs': self.resyncs,
+            }
@@ -51,6 +51,13 @@ export class VSMNetwork {
         
         // Initialize utility function selector
         this.initUtilitySelector();
+
+        // Server change feed: last applied revision, the server epoch it belongs to
+        // (new after every server restart), and changes queued during a resync
+        this.revision = 0;
+        this.epoch = null;
+        this.eventSource = null;
+        this.pendingChanges = null;
         
         // Initialize the network
         this.init();
@@ -67,6 +74,8 @@ export class VSMNetwork {
             }
             
             const nodes = await response.json();
+            this.revision = Number(response.headers.get('X-Revision')) || 0;
+            this.epoch = response.headers.get('X-Epoch');
             console.log('Loaded nodes from server:', nodes);
             
             if (Object.keys(nodes).length === 0) {
@@ -90,6 +99,9 @@ export class VSMNetwork {
             
             // Initial LOD update
             this.updateLOD();
+
+            // Follow other users' edits
+            this.subscribeToChanges();
             
             console.log('Network initialization complete');
             return true;
@@ -195,6 +207,7 @@ export class VSMNetwork {
 
         // Create child nodes
             const newNodes = [];
+            const batch = [];
             for (let i = 0; i < count; i++) {
             const newTag = `${parentTag}-${i + 1}`;
                 const nodeData = {
@@ -210,19 +223,19 @@ export class VSMNetwork {
                 // Create node locally
                 const node = await this.createNodeFromData(nodeData);
                 newNodes.push(node);
+                batch.push(nodeData);
             parent.children.push(newTag);
-            
-                // Save to server
-                try {
-                    const encodedTag = parentTag.replace(/\//g, '|');
-                    await fetch(`${window.SERVER_URL}/nodes`, {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify(nodeData)
-                    });
-                } catch (error) {
-                    console.warn('Failed to save child node to server:', error);
-                }
+            }
+
+            // Save all children to the server in a single request
+            try {
+                await fetch(`${window.SERVER_URL}/nodes/batch`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ nodes: batch })
+                });
+            } catch (error) {
+                console.warn('Failed to save child nodes to server:', error);
             }
             
             // Create outline
@@ -773,6 +786,8 @@ export class VSMNetwork {
             }
             
             const nodes = await response.json();
+            this.revision = Number(response.headers.get('X-Revision')) || 0;
+            this.epoch = response.headers.get('X-Epoch');
             
             // Clear existing nodes
             this.clearAllNodes();
@@ -789,12 +804,93 @@ export class VSMNetwork {
             };
             
             Object.values(nodes).forEach(createNode);
+            this.subscribeToChanges();
         } catch (error) {
             console.error('Failed to load nodes:', error);
             alert('Failed to connect to server. Check if the server is running.');
         }
     }
 
+    subscribeToChanges() {
+        // EventSource reconnects by itself and resumes with Last-Event-ID
+        if (this.eventSource) this.eventSource.close();
+        this.pendingChanges = null;
+        this.eventSource = new EventSource(`${window.SERVER_URL}/events?${this.syncQuery()}`);
+        this.eventSource.addEventListener('change', (event) => {
+            const changes = JSON.parse(event.data);
+            if (this.pendingChanges) {
+                this.pendingChanges.push(changes);
+            } else {
+                this.applyChanges(changes);
+            }
+        });
+        // Sent when we fell too far behind the feed to be replayed, or the server restarted
+        this.eventSource.addEventListener('resync', () => this.resync());
+    }
+
+    syncQuery() {
+        // Our revision, qualified by its epoch so a restarted server asks us to reload
+        const epoch = this.epoch ? `&epoch=${encodeURIComponent(this.epoch)}` : '';
+        return `since=${this.revision}${epoch}`;
+    }
+
+    async resync() {
+        if (this.pendingChanges) return;
+        this.pendingChanges = [];
+        try {
+            const response = await fetch(`${window.SERVER_URL}/nodes?${this.syncQuery()}`);
+            if (response.status === 410) {
+                // Too far behind the server's history, or from before a restart: start over
+                this.pendingChanges = null;
+                await this.loadNodesFromServer();
+                return;
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            this.applyChanges(await response.json());
+        } catch (error) {
+            console.warn('Failed to resync with server:', error);
+        }
+        const pending = this.pendingChanges;
+        this.pendingChanges = null;
+        pending.forEach(changes => this.applyChanges(changes));
+    }
+
+    applyChanges(changes) {
+        // changes: {revision, nodes: {tag: nodeData}, deleted: [tag]}, as from /nodes?since
+        if (changes.revision <= this.revision) return;
+        changes.deleted.forEach(tag => {
+            this.removeNode(tag);
+            if (this.outlines.has(tag)) {
+                this.scene.remove(this.outlines.get(tag));
+                this.outlines.delete(tag);
+            }
+        });
+
+        // Recreate changed nodes parents first, so connection lines find them
+        Object.values(changes.nodes)
+            .sort((a, b) => a.layer - b.layer)
+            .forEach(nodeData => {
+                this.removeNode(nodeData.tag);
+                this.createNodeFromData(nodeData);
+            });
+
+        this.revision = changes.revision;
+        this.updateLOD();
+    }
+
+    removeNode(tag) {
+        // Remove one node's visual elements, leaving its children and outline in place
+        const node = this.nodes.get(tag);
+        if (!node) return;
+
+        if (node.label) this.scene.remove(node.label);
+        if (node.connectionLine) this.scene.remove(node.connectionLine);
+        if (node.mesh) this.scene.remove(node.mesh);
+        this.nodes.delete(tag);
+    }
+
     clearAllNodes() {
         this.nodes.forEach(node => {
             if (node.label) this.scene.remove(node.label);
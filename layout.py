@@ -0,0 +1,477 @@
+"""
+layout.py
+
+Overlap-free hierarchical layout for the VSM network, shared by the server
+(server.py) and the desktop client (vsm_network.py).
+
+Every node's children sit on a ring around it. Each child's whole sub-structure
+is summarised by one bounding circle, and the ring gives every child an angular
+sector wide enough to contain that circle. Disjoint sectors therefore mean
+disjoint sub-structures at every depth without ever comparing individual nodes
+across branches: a far-away branch is one circle, as a Barnes–Hut cell is one
+mass. A ring keeps the classic fractal polygon (child n at angle 2π(n-1)/k,
+distance get_edge_length(layer)) while its children fit there, and is otherwise
+packed as tightly as the sectors allow.
+
+Each child's cone in its parent's ring is sized for a circle HEADROOM times
+larger than its sub-structure (its room), and a child that outgrows its room
+gets HEADROOM times its new size, so rooms grow geometrically. Adding or
+removing nodes walks the rings on the path to the root, stopping where a
+bounding circle stops changing, and only touches children that are new or have
+outgrown their room. Those are fitted into their ring where it stands: a new
+child takes its classic polygon slot or the widest free arc, and siblings in
+the way of a grown or new child are turned aside just far enough, heavy
+sub-structures least (see spread). Only a ring whose children no longer fit
+around it at all is repacked, so an insert moves a few siblings near it rather
+than every sub-structure up to the root. The full pass and the incremental
+pass share one vectorised packing step, applied to all rings of a layer at
+once.
+"""
+
+import numpy as np
+
+NODE_FOOTPRINT = 0.3  # A node of layer L keeps a disc of radius NODE_FOOTPRINT / (L + 1) to itself
+HEADROOM = 1.2        # A sub-structure's cone leaves room for it to grow this much larger
+PACK_ITERATIONS = 40
+
+def get_edge_length(layer):
+    """Decrease edge length with depth so that child nodes cluster closer to their parent."""
+    base_length = 1.0
+    return base_length / (layer + 2)
+
+def node_radius(layer):
+    return NODE_FOOTPRINT / (np.asarray(layer) + 1)
+
+def cone(room, distance):
+    """Half-angle, seen from the parent, of a circle of radius room at distance."""
+    return np.arcsin(np.minimum(room / np.maximum(distance, 1e-12), 1.0))
+
+def clears(angle, half, angles, halves):
+    """Whether a cone (angle, half) is disjoint from every cone (angles, halves)."""
+    apart = np.abs((np.asarray(angles) - angle + np.pi) % (2 * np.pi) - np.pi)
+    return bool(np.all(apart >= np.asarray(halves) + half - 1e-12))
+
+def free_angle(half, angles, halves, preferred=None):
+    """
+    Where to put a cone of half-angle half among the cones (angles, halves):
+    preferred if it is clear there, else the middle of the widest free arc.
+    """
+    angles, halves = np.asarray(angles, dtype=float), np.asarray(halves, dtype=float)
+    if preferred is not None and clears(preferred, half, angles, halves):
+        return preferred
+    if not len(angles):
+        return 0.0 if preferred is None else preferred
+    order = np.argsort(angles)
+    starts = angles[order] + halves[order]
+    ends = np.roll(angles[order] - halves[order], -1)
+    ends[-1] += 2 * np.pi
+    widest = int(np.argmax(ends - starts))
+    return (starts[widest] + ends[widest]) / 2 % (2 * np.pi)
+
+def weighted_median(values, weights):
+    order = np.argsort(values)
+    total = np.cumsum(weights[order])
+    return values[order][np.searchsorted(total, total[-1] / 2)]
+
+def spread(angles, halves, weights):
+    """
+    Angles for cones (angles, halves) that no longer overlap, keeping their
+    order around the circle and moving as little weight as possible: an L1
+    isotonic regression by pooling adjacent violators, so cones that are not in
+    the way keep their angle exactly. The circle is cut at its widest free arc.
+    Returns None when the cones only fit if that arc is given up too.
+    """
+    count = len(angles)
+    if count < 2:
+        return np.asarray(angles, dtype=float)
+    order = np.argsort(angles)
+    gaps = np.roll(angles[order] - halves[order], -1) - (angles[order] + halves[order])
+    gaps[-1] += 2 * np.pi
+    order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+    first = angles[order[0]]
+    wanted = (angles[order] - first) % (2 * np.pi) + first
+    half, weight = halves[order], np.maximum(weights[order], 1e-12)
+    offset = np.r_[0, np.cumsum(half[:-1] + half[1:])]
+    target = wanted - offset
+    blocks = []  # [start, stop, value] of pooled runs
+    for i in range(count):
+        blocks.append([i, i + 1, target[i]])
+        while len(blocks) > 1 and blocks[-2][2] > blocks[-1][2]:
+            start, stop = blocks[-2][0], blocks[-1][1]
+            blocks[-2:] = [[start, stop, weighted_median(target[start:stop], weight[start:stop])]]
+    placed = np.concatenate([np.full(stop - start, value) for start, stop, value in blocks]) + offset
+    placed = np.where(np.isclose(placed, wanted, rtol=0, atol=1e-12), wanted, placed)
+    if placed[-1] + half[-1] > placed[0] - half[0] + 2 * np.pi + 1e-12:
+        return None
+    result = np.empty(count)
+    result[order] = placed % (2 * np.pi)
+    return result
+
+def pack_rings(room, starts, numbers, poly_orders, parent_radii, base):
+    """
+    Pack many rings at once. Children are given group by group (a group is one
+    parent's children in node-number order): the room of each child, node
+    numbers and polygon orders; starts marks where each group begins.
+    parent_radii and base hold each parent's footprint and its classic ring
+    radius. Returns per-child (distance, angle).
+    """
+    count = len(room)
+    sizes = np.diff(np.r_[starts, count])
+    group = np.repeat(np.arange(len(starts)), sizes)
+    largest = np.maximum.reduceat(room, starts)
+    floor = np.maximum(base, largest + parent_radii)
+
+    # Classic polygon: one slot of 2π/k per node number
+    slots = np.maximum.reduceat(poly_orders, starts)
+    numbered = np.maximum.reduceat(numbers, starts) <= slots
+    with np.errstate(divide='ignore'):
+        polygon_radius = np.where(slots > 1, largest / np.sin(np.pi / np.maximum(slots, 1)), 0.0)
+    polygon = numbered & (np.maximum(floor, polygon_radius) <= base)
+
+    # Packed ring: the smallest radius at which the cones sum to at most 2π
+    low = largest.copy()
+    high = np.maximum(largest, np.add.reduceat(room, starts) / 2)
+    for _ in range(PACK_ITERATIONS):
+        mid = (low + high) / 2
+        used = np.add.reduceat(2 * np.arcsin(np.minimum(room / mid[group], 1.0)), starts)
+        fits = used <= 2 * np.pi
+        high = np.where(fits, mid, high)
+        low = np.where(fits, low, mid)
+    ring = np.where(polygon, base, np.maximum(floor, high))
+
+    need = 2 * np.arcsin(np.minimum(room / ring[group], 1.0))
+    slack = (2 * np.pi - np.add.reduceat(need, starts)) / sizes
+    width = need + np.maximum(slack, 0)[group]
+    ends = np.cumsum(width)
+    before = np.repeat(ends[starts] - width[starts], sizes)
+    angle = ends - before - width / 2 - (width[starts] / 2)[group]
+    slot = 2 * np.pi / np.maximum(slots, 1)
+    angle = np.where(polygon[group], (numbers - 1) * slot[group], angle)
+    return ring[group], angle
+
+# -----------------------------------------------------------------------------
+# LAYOUT ENGINE
+# -----------------------------------------------------------------------------
+
+class Layout:
+    """
+    Layout state for a NodeStore, indexed by store row: the bounding radius of
+    each node's sub-structure, the radius its cone in the parent's ring is sized
+    for (room, never below radius for a placed node), and its place in that ring
+    (distance and angle). Positions are written to store.pos.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.radius = np.zeros(0)
+        self.room = np.zeros(0)
+        self.distance = np.zeros(0)
+        self.angle = np.zeros(0)
+        self.placed = np.zeros(0, dtype=bool)  # Row has a place in its parent's ring
+        self.reserve()
+
+    def reserve(self):
+        """Grow the state arrays to the store's capacity."""
+        capacity = self.store.capacity
+        if len(self.placed) >= capacity:
+            return
+        for name in ('radius', 'room', 'distance', 'angle', 'placed'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def remap(self, remap):
+        """Follow a NodeStore.compact() row mapping."""
+        keep = np.flatnonzero(remap >= 0)
+        for name in ('radius', 'room', 'distance', 'angle', 'placed'):
+            column = getattr(self, name)
+            column[remap[keep]] = column[keep]
+            column[len(keep):] = 0
+
+    def levels(self, row=None):
+        """Live rows grouped by depth below row (default: below every root), the top first."""
+        store = self.store
+        if row is None:
+            live = store.live_rows()
+            roots = live[store.parent[live] < 0]
+        else:
+            roots = [row]
+        levels = []
+        for root in np.asarray(roots).tolist():
+            for depth, rows in enumerate(store.subtree_levels(root)):
+                if depth == len(levels):
+                    levels.append([])
+                levels[depth].append(rows)
+        return [np.concatenate(rows) for rows in levels]
+
+    def children_of(self, parents):
+        """Children of parents, grouped by parent in node-number order: (parents with children, rows, starts)."""
+        children = self.store.children
+        kids = [children.get(parent, ()) for parent in parents.tolist()]
+        sizes = np.array([len(k) for k in kids], dtype=np.int64)
+        has = sizes > 0
+        rows = np.fromiter((c for k in kids for c in k), dtype=np.int64, count=int(sizes.sum()))
+        return parents[has], rows, np.r_[0, np.cumsum(sizes[has])[:-1]].astype(np.int64)
+
+    def pack(self, parents, rows, starts):
+        """Repack the rings of parents (children given as by children_of) around their room."""
+        store = self.store
+        self.distance[rows], self.angle[rows] = pack_rings(
+            self.room[rows], starts, store.node_number[rows], store.poly_order[rows],
+            node_radius(store.layer[parents]), get_edge_length(store.layer[parents]))
+        self.placed[rows] = True
+
+    def enclose(self, parents, rows, starts):
+        """Bounding radius of each parent's sub-structure from its children's rings."""
+        outer = np.maximum.reduceat(self.distance[rows] + self.radius[rows], starts)
+        return np.maximum(node_radius(self.store.layer[parents]), outer)
+
+    # -- Whole-network passes -------------------------------------------------
+
+    def relayout(self, row=None):
+        """
+        Lay out the sub-structure of row (default: the whole network) from
+        scratch, keeping its root where it is. Returns the rows that moved.
+        """
+        self.reserve()
+        store = self.store
+        levels = self.levels(row)
+        for rows in levels:
+            self.radius[rows] = node_radius(store.layer[rows])
+        for rows in reversed(levels[:-1]):
+            parents, kids, starts = self.children_of(rows)
+            if len(parents):
+                self.room[kids] = self.radius[kids] * HEADROOM
+                self.pack(parents, kids, starts)
+                self.radius[parents] = self.enclose(parents, kids, starts)
+        for rows in levels[1:]:
+            self.position(rows)
+        return np.concatenate(levels[1:]) if len(levels) > 1 else np.empty(0, dtype=np.int64)
+
+    def adopt(self, parents=None):
+        """
+        Derive the layout state from the current positions without moving
+        anything: for the rings of parents, or for the whole network. Each child
+        gets room up to halfway to its neighbours on either side, at most
+        HEADROOM times its size. Rings that already overlap are left alone (see
+        fit).
+        """
+        self.reserve()
+        store = self.store
+        if parents is None:
+            levels = self.levels()
+            for rows in levels:
+                self.radius[rows] = node_radius(store.layer[rows])
+            rings = list(reversed(levels[:-1]))
+        else:
+            rings = np.unique(np.asarray(parents, dtype=np.int64))
+            rings = rings[store.alive[rings]]
+            layers = store.layer[rings]
+            rings = [rings[layers == layer] for layer in np.unique(layers)[::-1].tolist()]
+        changed = []
+        for rows in rings:
+            owners, kids, starts = self.children_of(rows)
+            if not len(owners):
+                continue
+            sizes = np.diff(np.r_[starts, len(kids)])
+            group = np.repeat(np.arange(len(owners)), sizes)
+            offset = store.pos[kids] - store.pos[owners][group]
+            self.distance[kids] = np.hypot(offset[:, 0], offset[:, 1])
+            self.angle[kids] = np.arctan2(offset[:, 1], offset[:, 0]) % (2 * np.pi)
+            order = np.lexsort((self.angle[kids], group))
+            turn = self.angle[kids][order]
+            following = np.roll(turn, -1)
+            last = starts + sizes - 1
+            following[last] = turn[starts] + 2 * np.pi
+            gap = following - turn
+            previous = np.roll(gap, 1)
+            previous[starts] = gap[last]
+            half = np.empty(len(kids))
+            half[order] = np.where(sizes[group] > 1, (gap + previous) / 4, np.pi / 2)
+            distance, radius = self.distance[kids], self.radius[kids]
+            free = np.minimum(distance * np.sin(np.minimum(half, np.pi / 2)),
+                              distance - node_radius(store.layer[owners])[group])
+            self.room[kids] = np.maximum(radius, np.minimum(free, radius * HEADROOM))
+            self.placed[kids] = True
+            radius = self.enclose(owners, kids, starts)
+            changed.append(owners[~np.isclose(radius, self.radius[owners])])
+            self.radius[owners] = radius
+        if parents is not None and changed:
+            above = store.parent[np.concatenate(changed)]
+            self.enclose_upwards(above[above >= 0])
+
+    def enclose_upwards(self, rows):
+        """Recompute the bounding radii of rows and their ancestors, stopping where they settle."""
+        store = self.store
+        while len(rows):
+            parents, kids, starts = self.children_of(np.unique(rows))
+            if not len(parents):
+                return
+            radius = self.enclose(parents, kids, starts)
+            changed = parents[~np.isclose(radius, self.radius[parents])]
+            self.radius[parents] = radius
+            rows = store.parent[changed]
+            rows = rows[rows >= 0]
+
+    # -- Incremental updates --------------------------------------------------
+
+    def place(self, rows):
+        """
+        Fit rows (new nodes, or re-parented sub-structure roots) into their
+        parents' rings, moving only the siblings in their way unless a ring has
+        to be repacked. A placed row's existing descendants move with it.
+        Returns the rows that moved.
+        """
+        self.reserve()
+        store = self.store
+        rows = np.asarray(rows, dtype=np.int64)
+        anchored = self.placed.copy()
+        self.placed[rows] = False
+        fresh = rows[~np.array([store.has_children(row) for row in rows.tolist()], dtype=bool)]
+        self.radius[fresh] = node_radius(store.layer[fresh])
+        parents = store.parent[rows]
+        return self.update(np.concatenate([parents[parents >= 0], rows]), anchored)
+
+    def removed(self, parents):
+        """Shrink the bounding circles above removed sub-structures. Nothing moves."""
+        self.update(np.asarray(parents, dtype=np.int64))
+
+    def update(self, rings, anchored=None):
+        """
+        Re-check the rings of the given parents, deepest first, making room for
+        children that are new or have outgrown their room (see refit). Parents
+        whose bounding circle changed pass the check up to their own parent.
+        Returns the rows that moved. anchored marks the rows whose descendants
+        move with them (default: every placed row).
+        """
+        store = self.store
+        pending = {}
+        for row in np.asarray(rings, dtype=np.int64).tolist():
+            if store.alive[row]:
+                pending.setdefault(int(store.layer[row]), set()).add(row)
+        if anchored is None:
+            anchored = self.placed.copy()
+        shifted = []
+        while pending:
+            layer = max(pending)
+            rows = np.array(sorted(pending.pop(layer)), dtype=np.int64)
+            parents, kids, starts = self.children_of(rows)
+            leaves = np.setdiff1d(rows, parents)
+            old = self.radius[rows].copy()
+            self.radius[leaves] = node_radius(store.layer[leaves])
+            if len(parents):
+                shifted.extend(self.refit(parents, kids, starts))
+                self.radius[parents] = self.enclose(parents, kids, starts)
+            grown = rows[~np.isclose(self.radius[rows], old) | ~self.placed[rows]]
+            for parent in store.parent[grown].tolist():
+                if parent >= 0:
+                    pending.setdefault(int(store.layer[parent]), set()).add(parent)
+        if not shifted:
+            return np.empty(0, dtype=np.int64)
+        return self.reposition(np.unique(np.concatenate(shifted)), anchored)
+
+    def refit(self, parents, kids, starts):
+        """
+        Make room in the rings of parents (children given as by children_of)
+        for children without a place or grown past their room (see fit). Rings
+        where that fails, and rings without placed children, are repacked.
+        Returns arrays of the children given a new place.
+        """
+        sizes = np.diff(np.r_[starts, len(kids)])
+        placed = self.placed[kids]
+        grown = placed & (self.radius[kids] > self.room[kids])
+        dirty = np.logical_or.reduceat(grown | ~placed, starts)
+        settled = np.logical_or.reduceat(placed, starts)  # Ring has children that keep their place
+        repack = dirty & ~settled
+        shifted = []
+        for index in np.flatnonzero(dirty & settled).tolist():
+            ring = slice(starts[index], starts[index] + sizes[index])
+            fitted = self.fit(parents[index], kids[ring], grown[ring])
+            if fitted is None:
+                repack[index] = True
+            else:
+                shifted.append(fitted)
+        if repack.any():
+            chosen = np.repeat(repack, sizes)
+            rows = kids[chosen]
+            changed = grown[chosen] | ~placed[chosen]
+            self.room[rows[changed]] = self.radius[rows[changed]] * HEADROOM
+            self.pack(parents[repack], rows, np.r_[0, np.cumsum(sizes[repack])[:-1]].astype(np.int64))
+            shifted.append(rows)
+        return shifted
+
+    def fit(self, parent, kids, grown):
+        """
+        Make room in parent's ring for the children in grown (a mask over kids)
+        and the unplaced ones, at the ring's current distance. A new child goes
+        to its classic polygon slot or the widest free arc, then spread() turns
+        apart the cones that overlap; a child too large for its distance moves
+        outwards. If the cones only fit without their headroom, every child
+        gives its headroom up. A ring that already overlapped (an adopted
+        layout) keeps its children where they are and only places new ones.
+        Returns the children given a new place, or None when the children no
+        longer fit around the ring.
+        """
+        store = self.store
+        inner = node_radius(store.layer[parent])
+        placed = self.placed[kids]
+        changed = grown | ~placed
+        room = self.room[kids].copy()
+        room[changed] = self.radius[kids[changed]] * HEADROOM
+        distance = np.where(placed, self.distance[kids], self.distance[kids[placed]].max())
+        distance = np.maximum(distance, room + inner)
+        half = cone(room, distance)
+        if half.sum() > np.pi:
+            room = self.radius[kids].copy()
+            half = cone(room, distance)
+        overlapping = half.sum() > np.pi
+        if overlapping and cone(room[~changed], distance[~changed]).sum() <= np.pi:
+            return None
+        angle = self.angle[kids].copy()
+        settled = np.flatnonzero(placed)
+        angles, halves = angle[settled].tolist(), half[settled].tolist()
+        for index in np.flatnonzero(~placed)[np.argsort(store.node_number[kids[~placed]], kind='stable')]:
+            number, slots = int(store.node_number[kids[index]]), int(store.poly_order[kids[index]])
+            preferred = 2 * np.pi * (number - 1) / slots if number <= slots else None
+            angle[index] = free_angle(half[index], angles, halves, preferred)
+            angles.append(angle[index])
+            halves.append(half[index])
+        if overlapping:
+            distance = np.where(placed, self.distance[kids], distance)
+            angle = np.where(placed, self.angle[kids], angle)
+        else:
+            angle = spread(angle, half, self.radius[kids] ** 2)
+            if angle is None:
+                return None
+        moved = ~placed | (angle != self.angle[kids]) | (distance != self.distance[kids])
+        self.room[kids], self.distance[kids], self.angle[kids] = room, distance, angle
+        self.placed[kids] = True
+        return kids[moved]
+
+    def position(self, rows):
+        """Put rows at their ring place around their parents. Returns the new positions."""
+        store = self.store
+        parents = store.parent[rows]
+        offset = np.column_stack([np.cos(self.angle[rows]), np.sin(self.angle[rows])])
+        store.pos[rows] = store.pos[parents] + self.distance[rows, None] * offset
+        return store.pos[rows]
+
+    def reposition(self, rows, anchored):
+        """
+        Move rows to their (new) ring places, top-down. Descendants of a row
+        that already had a position move rigidly with it.
+        """
+        store = self.store
+        moved = [rows]
+        layers = store.layer[rows]
+        for layer in np.unique(layers).tolist():
+            kids = rows[layers == layer]
+            old = store.pos[kids].copy()
+            shift = self.position(kids) - old
+            for kid, delta in zip(kids.tolist(), shift.tolist()):
+                if anchored[kid] and (delta[0] or delta[1]) and store.has_children(kid):
+                    below = store.subtree_rows(kid)[1:]
+                    store.pos[below] += delta
+                    moved.append(below)
+        return np.unique(np.concatenate(moved))
@@ -0,0 +1,210 @@
+"""
+metrics.py
+
+Lightweight in-process instrumentation: timing/size histograms, counters and
+callback gauges in one registry, rendered in the Prometheus text format or as
+a short human-readable summary.
+
+Recording is off until enable() is called (or VSM_METRICS=1 is set). While
+disabled, timed() wrappers cost one flag check per call and observe()/inc()
+return immediately.
+"""
+
+from bisect import bisect_left
+import functools
+import math
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('VSM_METRICS', '') not in ('', '0')
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = tuple(4 ** k for k in range(4, 14))  # 256 B .. 64 MiB
+
+def enable(flag=True):
+    global ENABLED
+    ENABLED = flag
+
+# -----------------------------------------------------------------------------
+# METRIC TYPES
+# -----------------------------------------------------------------------------
+
+class HistogramSeries:
+    __slots__ = ('counts', 'total', 'count', 'last')
+
+    def __init__(self, size):
+        self.counts = [0] * size  # Per bucket, the last one being +Inf
+        self.total = 0.0
+        self.count = 0
+        self.last = 0.0
+
+class Histogram:
+    """Bucketed distribution, optionally split by one label."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, label=None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label = label
+        self.series = {}  # Label value (None without a label) -> HistogramSeries
+        self.lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        if not ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = HistogramSeries(len(self.buckets) + 1)
+            series.counts[index] += 1
+            series.total += value
+            series.count += 1
+            series.last = value
+
+    def quantile(self, q, label_value=None):
+        """Upper bucket bound below which a fraction q of observations fall."""
+        series = self.series.get(label_value)
+        if series is None or not series.count:
+            return 0.0
+        rank, seen = q * series.count, 0
+        for bound, count in zip(self.buckets + (math.inf,), series.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.series.items(), key=lambda item: str(item[0]))
+            items = [(value, list(s.counts), s.total, s.count) for value, s in items]
+        for value, counts, total, count in items:
+            labels = {self.label: value} if self.label else {}
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket
+                yield self.name + '_bucket', dict(labels, le=format_bound(bound)), cumulative
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, count
+
+class Counter:
+    """Monotonic total, optionally split by one label."""
+    kind = 'counter'
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, label_value=None):
+        if not ENABLED:
+            return
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items(), key=lambda item: str(item[0]))
+        for value, total in items:
+            yield self.name, {self.label: value} if self.label else {}, total
+
+class Gauge:
+    """Value read from a callback at collection time, so it costs nothing in between."""
+
+    def __init__(self, name, help, fn, kind='gauge'):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind  # 'counter' for callbacks that report a running total
+
+    def samples(self):
+        yield self.name, {}, self.fn()
+
+# -----------------------------------------------------------------------------
+# REGISTRY
+# -----------------------------------------------------------------------------
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        """Add metric, or return the one already registered under its name."""
+        return self.metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, label=None):
+        return self.register(Histogram(name, help, buckets, label))
+
+    def counter(self, name, help, label=None):
+        return self.register(Counter(name, help, label))
+
+    def gauge(self, name, help, fn, kind='gauge'):
+        metric = Gauge(name, help, fn, kind)
+        self.metrics[name] = metric  # Re-registering rebinds the callback
+        return metric
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    pairs = ','.join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+                    name = f"{name}{{{pairs}}}"
+                lines.append(f"{name} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def summary_lines(self):
+        """One line per recorded histogram series: count, last, mean and p95."""
+        lines = []
+        for metric in self.metrics.values():
+            if isinstance(metric, Histogram):
+                for value, series in sorted(metric.series.items(), key=lambda item: str(item[0])):
+                    if not series.count:
+                        continue
+                    name = f"{metric.name}[{value}]" if metric.label else metric.name
+                    lines.append(f"{name}: n={series.count} last={series.last:.4g} "
+                                 f"mean={series.total / series.count:.4g} "
+                                 f"p95<={format_bound(metric.quantile(0.95, value))}")
+            elif isinstance(metric, Gauge):
+                lines.append(f"{metric.name}: {format_value(metric.fn())}")
+        return lines
+
+REGISTRY = Registry()
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else ('+Inf' if value > 0 else '-Inf')
+    return str(value)
+
+# -----------------------------------------------------------------------------
+# TIMING HELPERS
+# -----------------------------------------------------------------------------
+
+def timed(histogram, label_value=None):
+    """Decorator recording each call's wall time in histogram (only while enabled)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, label_value)
+        return wrapper
+    return decorate
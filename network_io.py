@@ -0,0 +1,315 @@
+"""
+network_io.py
+
+Chunked export and import of a NodeStore, shared by the desktop client and the
+server. Two formats:
+
+  CSV    one row per node with separate x/y columns; parent given by tag.
+  Table  a single .npy file holding a structured array (one record per node,
+         strings UTF-8 encoded in fixed-width byte fields, parent given by
+         record index). It can be memory-mapped with np.load(mmap_mode='r') and
+         streamed, since it is a header followed by fixed-size records.
+
+Writers yield or write one chunk of rows at a time and readers consume one
+chunk at a time, so memory beyond the store itself stays bounded by the chunk size.
+A writer streaming a store that is being mutated (the server's /export) leaves
+out nodes deleted before their chunk is written. The table's record count is
+fixed by its header, so there they become placeholder records with an empty
+tag, which readers skip.
+"""
+
+import csv
+import io
+
+import numpy as np
+
+from node_store import NodeStore
+
+CSV_FIELDS = ('tag', 'x', 'y', 'layer', 'shape', 'node', 'polyOrder', 'parent', 'orgUnit', 'name')
+CHUNK_SIZE = 65536
+
+# -----------------------------------------------------------------------------
+# CHUNKED ROW ACCESS
+# -----------------------------------------------------------------------------
+
+def iter_row_chunks(store, chunk_size=CHUNK_SIZE):
+    """
+    Yield live store rows in row order, chunk_size at a time (fewer where rows
+    were deleted after the iteration started).
+    """
+    rows = store.live_rows()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        yield chunk[store.alive[chunk]]
+
+def build_store(chunks):
+    """
+    Build a NodeStore from column chunks (dicts of equal-length sequences keyed
+    by CSV_FIELDS). 'parent' holds tags, or record indices when the chunk has
+    'parent_is_index' set; such chunks also give the indices of their records
+    within the chunk ('record') out of 'records', the others being skipped
+    placeholders. Parents may appear after their children. Raises ValueError for
+    non-finite positions, links to unknown or skipped parents and for cycles
+    (see check_parents).
+    """
+    store = NodeStore()
+    unresolved = []  # (row, parent tag) whose parent had not been seen yet
+    record_rows = []  # Row of every table record so far, -1 for placeholders, one array per chunk
+    indexed = []  # (rows, parent record indices) of table chunks, linked once all records are read
+    for chunk in chunks:
+        parents = chunk['parent']
+        if chunk.get('parent_is_index'):
+            parent_rows = np.full(len(chunk['tag']), -1, dtype=np.int64)
+        else:
+            parent_rows = np.array([store.rows.get(tag, -1) if tag else -1 for tag in parents],
+                                   dtype=np.int64)
+        positions = np.column_stack([chunk['x'], chunk['y']]).astype(float)
+        finite = np.isfinite(positions).all(axis=1)
+        if not finite.all():
+            raise ValueError(f"Node {chunk['tag'][int(np.argmin(finite))]} has a non-finite position")
+        rows = store.add_many(chunk['tag'], positions,
+                              chunk['layer'], chunk['polyOrder'], parent_rows,
+                              shapes=chunk['shape'], nodes=chunk['node'],
+                              org_units=chunk['orgUnit'], names=chunk['name'])
+        if chunk.get('parent_is_index'):
+            block = np.full(chunk['records'], -1, dtype=np.int64)
+            block[chunk['record']] = rows
+            record_rows.append(block)
+            indexed.append((rows, np.asarray(parents, dtype=np.int64)))
+        else:
+            unresolved.extend((row, tag) for row, tag, parent_row
+                              in zip(rows.tolist(), parents, parent_rows.tolist())
+                              if tag and parent_row < 0)
+    for row, tag in unresolved:
+        if tag not in store.rows:
+            raise ValueError(f"Parent node {tag} of {store.tags[row]} not found")
+        store.parent[row] = store.rows[tag]
+    if indexed:
+        link_records(store, np.concatenate(record_rows), indexed)
+    if unresolved or indexed:
+        store.rebuild_children()
+    check_parents(store)
+    return store
+
+def link_records(store, record_rows, indexed):
+    """Set the parents of table rows from parent record indices (see build_store)."""
+    rows = np.concatenate([chunk_rows for chunk_rows, _ in indexed])
+    parents = np.concatenate([chunk_parents for _, chunk_parents in indexed])
+    invalid = np.flatnonzero((parents < -1) | (parents >= len(record_rows)))
+    if len(invalid):
+        row = rows[invalid[0]]
+        raise ValueError(f"Node {store.tags[row]} has parent index {parents[invalid[0]]} outside the table")
+    parent_rows = np.where(parents >= 0, record_rows[np.maximum(parents, 0)], -1)
+    skipped = np.flatnonzero((parents >= 0) & (parent_rows < 0))
+    if len(skipped):
+        raise ValueError(f"Parent of node {store.tags[rows[skipped[0]]]} is a placeholder record")
+    store.parent[rows] = parent_rows
+
+def check_parents(store):
+    """
+    Raise ValueError if a node is its own ancestor. Cycles are found by pointer
+    doubling: each pass replaces every row's ancestor by that ancestor's, so
+    after k passes a row that has not reached a root within 2**k steps never will.
+    """
+    size = store.size
+    parents = store.parent[:size]
+    own = np.flatnonzero(parents == np.arange(size))
+    if len(own):
+        raise ValueError(f"Node {store.tags[own[0]]} is its own parent")
+    ancestors = np.append(parents, -1)  # The extra entry is what parent -1 indexes
+    steps = 1
+    while steps < size and ancestors.max() >= 0:
+        ancestors = ancestors[ancestors]
+        steps *= 2
+    cyclic = np.flatnonzero(ancestors[:-1] >= 0)
+    if len(cyclic):
+        raise ValueError(f"Parent links above node {store.tags[cyclic[0]]} form a cycle")
+
+# -----------------------------------------------------------------------------
+# CSV
+# -----------------------------------------------------------------------------
+
+def iter_csv(store, chunk_size=CHUNK_SIZE):
+    """Yield the network as CSV text, one chunk of rows per string (header first)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS)
+    tags, names, org_units = store.tags, store.names, store.org_units
+    for rows in iter_row_chunks(store, chunk_size):
+        parents = store.parent[rows].tolist()
+        writer.writerows(zip(
+            (tags[row] for row in rows.tolist()),
+            store.pos[rows, 0].tolist(),
+            store.pos[rows, 1].tolist(),
+            store.layer[rows].tolist(),
+            store.shape[rows].tolist(),
+            store.node_number[rows].tolist(),
+            store.poly_order[rows].tolist(),
+            (tags[parent] if parent >= 0 else '' for parent in parents),
+            (org_units[row] for row in rows.tolist()),
+            (names[row] for row in rows.tolist()),
+        ))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_csv(store, path, chunk_size=CHUNK_SIZE):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for text in iter_csv(store, chunk_size):
+            f.write(text)
+
+def read_csv(fileobj, chunk_size=CHUNK_SIZE):
+    """Yield column chunks from CSV text written by iter_csv."""
+    reader = csv.DictReader(fileobj)
+    while True:
+        records = [record for _, record in zip(range(chunk_size), reader)]
+        if not records:
+            return
+        yield {
+            'tag': [r['tag'] for r in records],
+            'x': np.array([r['x'] for r in records], dtype=float),
+            'y': np.array([r['y'] for r in records], dtype=float),
+            'layer': np.array([r['layer'] for r in records], dtype=np.int32),
+            'shape': np.array([r.get('shape') or 0 for r in records], dtype=np.int32),
+            'node': np.array([r.get('node') or 1 for r in records], dtype=np.int32),
+            'polyOrder': np.array([r.get('polyOrder') or 6 for r in records], dtype=np.int32),
+            'parent': [r.get('parent') or None for r in records],
+            'orgUnit': [r.get('orgUnit') or '' for r in records],
+            'name': [r.get('name') or r['tag'] for r in records],
+        }
+
+def import_csv(path_or_file, chunk_size=CHUNK_SIZE):
+    """Read a CSV export into a new NodeStore."""
+    if isinstance(path_or_file, str):
+        with open(path_or_file, newline='', encoding='utf-8') as f:
+            return build_store(read_csv(f, chunk_size))
+    return build_store(read_csv(path_or_file, chunk_size))
+
+# -----------------------------------------------------------------------------
+# BINARY TABLE (.npy STRUCTURED ARRAY)
+# -----------------------------------------------------------------------------
+
+def table_dtype(tag_width, name_width, org_width):
+    return np.dtype([('x', '<f8'), ('y', '<f8'), ('layer', '<i4'), ('shape', '<i4'),
+                     ('node', '<i4'), ('polyOrder', '<i4'), ('parent', '<i8'),
+                     ('tag', f'S{tag_width}'), ('name', f'S{name_width}'),
+                     ('orgUnit', f'S{org_width}')])
+
+def table_header(dtype, count):
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_2_0(buffer, {
+        'descr': np.lib.format.dtype_to_descr(dtype),
+        'fortran_order': False,
+        'shape': (count,),
+    })
+    return buffer.getvalue()
+
+def iter_table(store, chunk_size=CHUNK_SIZE):
+    """
+    Yield the network as .npy bytes: the header, then one block of records per
+    chunk. Nodes deleted after the header was written keep their record index
+    as placeholders with an empty tag.
+    """
+    rows = store.live_rows()
+    remap = np.full(store.size, -1, dtype=np.int64)
+    remap[rows] = np.arange(len(rows))
+
+    def width(strings):
+        return max((len(s.encode('utf-8')) for s in strings), default=1) or 1
+
+    live = rows.tolist()
+    dtype = table_dtype(width(store.tags[row] for row in live),
+                        width(store.names[row] for row in live),
+                        width(store.org_units[row] for row in live))
+    yield table_header(dtype, len(rows))
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        records = np.zeros(len(chunk), dtype=dtype)
+        records['x'] = store.pos[chunk, 0]
+        records['y'] = store.pos[chunk, 1]
+        records['layer'] = store.layer[chunk]
+        records['shape'] = store.shape[chunk]
+        records['node'] = store.node_number[chunk]
+        records['polyOrder'] = store.poly_order[chunk]
+        parents = store.parent[chunk]
+        records['parent'] = np.where(parents >= 0, remap[np.maximum(parents, 0)], -1)
+        chunk_rows = chunk.tolist()
+        records['tag'] = [store.tags[row].encode('utf-8') for row in chunk_rows]
+        records['name'] = [store.names[row].encode('utf-8') for row in chunk_rows]
+        records['orgUnit'] = [store.org_units[row].encode('utf-8') for row in chunk_rows]
+        deleted = ~store.alive[chunk]
+        if deleted.any():
+            records[deleted] = np.zeros(1, dtype=dtype)
+            records['parent'][deleted] = -1
+        yield records.tobytes()
+
+def export_table(store, path, chunk_size=CHUNK_SIZE):
+    with open(path, 'wb') as f:
+        for block in iter_table(store, chunk_size):
+            f.write(block)
+
+def load_table(path):
+    """Memory-map a table export; returns a read-only structured array."""
+    return np.load(path, mmap_mode='r')
+
+def table_columns(records):
+    """Convert a block of table records into build_store column chunks, without placeholders."""
+    count = len(records)
+    kept = np.flatnonzero(records['tag'] != b'')
+    if len(kept) < count:
+        records = records[kept]
+
+    def decode(values):
+        return [value.decode('utf-8') for value in values.tolist()]
+    return {
+        'tag': decode(records['tag']),
+        'x': records['x'], 'y': records['y'],
+        'layer': records['layer'], 'shape': records['shape'],
+        'node': records['node'], 'polyOrder': records['polyOrder'],
+        'parent': records['parent'], 'parent_is_index': True,
+        'record': kept, 'records': count,
+        'orgUnit': decode(records['orgUnit']),
+        'name': decode(records['name']),
+    }
+
+def read_table(fileobj, chunk_size=CHUNK_SIZE):
+    """Yield column chunks from a table streamed through a binary file object."""
+    version = np.lib.format.read_magic(fileobj)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(fileobj)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(fileobj)
+    remaining = shape[0]
+    while remaining:
+        count = min(chunk_size, remaining)
+        data = fileobj.read(count * dtype.itemsize)
+        if len(data) != count * dtype.itemsize:
+            raise ValueError("Truncated node table")
+        yield table_columns(np.frombuffer(data, dtype=dtype))
+        remaining -= count
+
+def import_table(path_or_file, chunk_size=CHUNK_SIZE):
+    """Read a table export (memory-mapped from a path, or streamed) into a new NodeStore."""
+    if isinstance(path_or_file, str):
+        records = load_table(path_or_file)
+        return build_store(table_columns(records[start:start + chunk_size])
+                           for start in range(0, len(records), chunk_size))
+    return build_store(read_table(path_or_file, chunk_size))
+
+# -----------------------------------------------------------------------------
+# FORMAT DISPATCH
+# -----------------------------------------------------------------------------
+
+def export_network(store, path, chunk_size=CHUNK_SIZE):
+    """Export to path, as a table if it ends in .npy and as CSV otherwise."""
+    if path.endswith('.npy'):
+        export_table(store, path, chunk_size)
+    else:
+        export_csv(store, path, chunk_size)
+
+def import_network(path, chunk_size=CHUNK_SIZE):
+    if path.endswith('.npy'):
+        return import_table(path, chunk_size)
+    return import_csv(path, chunk_size)
@@ -0,0 +1,512 @@
+"""
+node_store.py
+
+Columnar, array-backed node storage shared by the desktop client (vsm_network.py)
+and the Flask server (server.py). Positions, layers, polygon orders and parent
+links live in contiguous NumPy arrays indexed by row; tags map to rows through a
+single dict, and a parent -> children index keeps subtree walks proportional to
+the subtree. Deleted rows are left as tombstones until compact() reclaims them.
+Org units are also kept as small integer codes (org_code), so they can be
+matched and looked up per row with array operations.
+
+The store is also a MutableMapping of tag -> NodeRecord, where NodeRecord is a
+live dict-shaped view of one row, so code written against the old
+dict-of-dicts layout keeps working.
+"""
+
+import bisect
+import sys
+from collections.abc import Mapping, MutableMapping
+
+import numpy as np
+
+# Dict-view keys, in the order the desktop client has always used them
+FIELDS = ('tag', 'pos', 'layer', 'shape', 'node', 'polyOrder', 'parent', 'orgUnit', 'name')
+
+# Numeric column arrays, as exported by NodeStore.to_columns()
+COLUMNS = ('pos', 'layer', 'shape', 'node_number', 'poly_order', 'parent', 'revision')
+
+# -----------------------------------------------------------------------------
+# DICT-SHAPED VIEW OF ONE ROW
+# -----------------------------------------------------------------------------
+
+class NodeRecord(MutableMapping):
+    """Live view of a stored node that behaves like the legacy node dict."""
+
+    __slots__ = ('store', 'tag')
+
+    def __init__(self, store, tag):
+        self.store = store
+        self.tag = tag
+
+    def __getitem__(self, key):
+        store = self.store
+        row = store.rows[self.tag]
+        if key == 'tag':
+            return self.tag
+        if key == 'pos':
+            x, y = store.pos[row]
+            return (float(x), float(y))
+        if key == 'layer':
+            return int(store.layer[row])
+        if key == 'shape':
+            return int(store.shape[row])
+        if key == 'node':
+            return int(store.node_number[row])
+        if key == 'polyOrder':
+            return int(store.poly_order[row])
+        if key == 'parent':
+            parent = store.parent[row]
+            return store.tags[parent] if parent >= 0 else None
+        if key == 'orgUnit':
+            return store.org_units[row]
+        if key == 'name':
+            return store.names[row]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        store = self.store
+        row = store.rows[self.tag]
+        if key == 'pos':
+            store.pos[row] = value
+        elif key == 'layer':
+            store.layer[row] = value
+        elif key == 'shape':
+            store.shape[row] = value
+        elif key == 'node':
+            store.node_number[row] = value
+        elif key == 'polyOrder':
+            store.poly_order[row] = value
+        elif key == 'parent':
+            store.set_parent(row, store.rows[value] if value is not None else -1)
+        elif key == 'orgUnit':
+            store.org_units[row] = sys.intern(value or '')
+            store.org_code[row] = store.org_unit_code(value)
+        elif key == 'name':
+            store.names[row] = value
+        else:
+            raise KeyError(f"{key!r} is not a stored node field")
+
+    def __delitem__(self, key):
+        raise TypeError("node fields cannot be deleted")
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, NodeRecord):
+            return self.store is other.store and self.tag == other.tag
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"NodeRecord({dict(self)!r})"
+
+# -----------------------------------------------------------------------------
+# NODE STORE
+# -----------------------------------------------------------------------------
+
+class NodeStore(MutableMapping):
+    """
+    Column arrays for every node plus a tag -> row index.
+
+    Rows are stable until compact() is called; compact() returns the old -> new
+    row mapping so holders of row numbers can remap them.
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0         # Rows in use, including tombstones
+        self.tombstones = 0
+        self.pos = np.zeros((capacity, 2))
+        self.layer = np.zeros(capacity, dtype=np.int32)
+        self.shape = np.zeros(capacity, dtype=np.int32)
+        self.node_number = np.zeros(capacity, dtype=np.int32)
+        self.poly_order = np.zeros(capacity, dtype=np.int32)
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.revision = np.zeros(capacity, dtype=np.int64)  # Last revision that touched the row
+        self.org_code = np.zeros(capacity, dtype=np.int32)  # Row -> index into org_unit_table
+        self.org_unit_table = ['']  # Code -> org unit; code 0 is no org unit
+        self.org_unit_codes = {'': 0}
+        self.tags = []        # Row -> interned tag (kept on tombstones until compaction)
+        self.names = []
+        self.org_units = []
+        self.rows = {}        # Live tag -> row
+        self.children = {}    # Row -> child rows ordered by node number
+
+    # -- Mapping interface ----------------------------------------------------
+
+    def __getitem__(self, tag):
+        if tag not in self.rows:
+            raise KeyError(tag)
+        return NodeRecord(self, tag)
+
+    def __setitem__(self, tag, node):
+        """Insert or overwrite a node from a dict in the legacy node shape."""
+        if tag in self.rows:
+            record = NodeRecord(self, tag)
+            for key, value in node.items():
+                if key != 'tag' and key in FIELDS:
+                    record[key] = value
+            return
+        self.add(tag, node['pos'], node['layer'],
+                 poly_order=node.get('polyOrder', 6),
+                 parent=node.get('parent'),
+                 shape=node.get('shape', 0),
+                 node=node.get('node', 1),
+                 org_unit=node.get('orgUnit', ''),
+                 name=node.get('name'))
+
+    def __delitem__(self, tag):
+        if not self.remove(tag):
+            raise KeyError(tag)
+
+    def __contains__(self, tag):
+        return tag in self.rows
+
+    def __iter__(self):
+        return iter(list(self.rows))
+
+    def __len__(self):
+        return len(self.rows)
+
+    # -- Capacity -------------------------------------------------------------
+
+    @property
+    def capacity(self):
+        return len(self.alive)
+
+    def reserve(self, extra):
+        """Grow the column arrays geometrically so that extra rows fit."""
+        needed = self.size + extra
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, 2 * self.capacity)
+        for name in ('pos', 'layer', 'shape', 'node_number', 'poly_order', 'parent', 'alive',
+                     'revision', 'org_code'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            new[self.size:] = -1 if name == 'parent' else 0
+            setattr(self, name, new)
+
+    # -- Mutation -------------------------------------------------------------
+
+    def org_unit_code(self, unit):
+        """The code of org unit unit, allocating one the first time it is seen."""
+        unit = unit or ''
+        code = self.org_unit_codes.get(unit)
+        if code is None:
+            code = self.org_unit_codes[unit] = len(self.org_unit_table)
+            self.org_unit_table.append(sys.intern(unit))
+        return code
+
+    def add(self, tag, pos, layer, poly_order=6, parent=None, shape=0, node=1,
+            org_unit='', name=None):
+        """Append one node and return its row."""
+        if tag in self.rows:
+            raise KeyError(f"Node {tag!r} already exists")
+        self.reserve(1)
+        row = self.size
+        tag = sys.intern(tag)
+        self.pos[row] = pos
+        self.layer[row] = layer
+        self.shape[row] = shape
+        self.node_number[row] = node
+        self.poly_order[row] = poly_order
+        self.parent[row] = self.rows[parent] if parent is not None else -1
+        self.alive[row] = True
+        self.revision[row] = 0
+        self.org_code[row] = self.org_unit_code(org_unit)
+        self.tags.append(tag)
+        self.names.append(name if name is not None else tag)
+        self.org_units.append(sys.intern(org_unit or ''))
+        self.rows[tag] = row
+        self.size += 1
+        self.link_children([row])
+        return row
+
+    def add_many(self, tags, positions, layers, poly_orders, parent_rows,
+                 shapes=0, nodes=1, org_units=None, names=None):
+        """
+        Append a batch of nodes in one go. Numeric arguments may be arrays or
+        scalars; parent_rows are row numbers (-1 for roots). Returns the new rows.
+        """
+        count = len(tags)
+        if count == 0:
+            return np.empty(0, dtype=np.int64)
+        tags = [sys.intern(tag) for tag in tags]
+        if any(tag in self.rows for tag in tags) or len(set(tags)) != count:
+            raise KeyError("Batch contains tags that already exist")
+        self.reserve(count)
+        start, stop = self.size, self.size + count
+        self.pos[start:stop] = positions
+        self.layer[start:stop] = layers
+        self.shape[start:stop] = shapes
+        self.node_number[start:stop] = nodes
+        self.poly_order[start:stop] = poly_orders
+        self.parent[start:stop] = parent_rows
+        self.alive[start:stop] = True
+        self.revision[start:stop] = 0
+        self.tags.extend(tags)
+        self.names.extend(names if names is not None else tags)
+        if org_units is None:
+            self.org_units.extend([''] * count)
+            self.org_code[start:stop] = 0
+        else:
+            units = [sys.intern(unit or '') for unit in org_units]
+            self.org_units.extend(units)
+            self.org_code[start:stop] = [self.org_unit_code(unit) for unit in units]
+        self.rows.update(zip(tags, range(start, stop)))
+        self.size = stop
+        rows = np.arange(start, stop)
+        self.link_children(rows)
+        return rows
+
+    def link_children(self, rows):
+        """Add rows to their parents' child lists, keeping each list in node-number order."""
+        number = self.node_number
+        for row, parent in zip(np.asarray(rows).tolist(), self.parent[rows].tolist()):
+            if parent < 0:
+                continue
+            siblings = self.children.setdefault(parent, [])
+            if not siblings or number[siblings[-1]] <= number[row]:
+                siblings.append(row)
+            else:
+                bisect.insort(siblings, row, key=number.__getitem__)
+
+    def unlink_child(self, row):
+        parent = int(self.parent[row])
+        siblings = self.children.get(parent)
+        if siblings is not None:
+            siblings.remove(row)
+            if not siblings:
+                del self.children[parent]
+
+    def set_parent(self, row, parent):
+        self.unlink_child(row)
+        self.parent[row] = parent
+        self.link_children([row])
+
+    def remove(self, tag):
+        """Tombstone a node. The row keeps its tag until compaction."""
+        row = self.rows.pop(tag, None)
+        if row is None:
+            return False
+        self.alive[row] = False
+        self.tombstones += 1
+        self.unlink_child(row)
+        return True
+
+    def remove_subtree(self, tag):
+        """Tombstone a node and all of its descendants. Returns the removed rows."""
+        rows = self.subtree_rows(self.rows[tag])
+        self.unlink_child(rows[0])
+        for row in rows.tolist():
+            del self.rows[self.tags[row]]
+            self.children.pop(row, None)
+        self.alive[rows] = False
+        self.tombstones += len(rows)
+        return rows
+
+    def rename(self, row, new_tag):
+        """Change the tag of a live row. A name that mirrored the old tag follows it."""
+        old_tag = self.tags[row]
+        if new_tag in self.rows:
+            raise KeyError(f"Node {new_tag!r} already exists")
+        new_tag = sys.intern(new_tag)
+        del self.rows[old_tag]
+        self.rows[new_tag] = row
+        self.tags[row] = new_tag
+        if self.names[row] == old_tag:
+            self.names[row] = new_tag
+
+    def move_subtree(self, tag, new_parent_tag):
+        """
+        Re-parent a subtree under new_parent_tag. The subtree root becomes the next
+        free child number of the new parent and every tag in the subtree is
+        rewritten to the new ancestry; layers shift by the change in depth.
+        Positions are left to the caller. Returns the subtree levels (see subtree_levels).
+        """
+        row = self.rows[tag]
+        new_parent = self.rows[new_parent_tag]
+        levels = self.subtree_levels(row)
+        if any(new_parent in level for level in levels):
+            raise ValueError("Cannot move a node under its own sub-structure")
+        siblings = self.children.get(new_parent, ())
+        number = int(self.node_number[siblings[-1]]) + 1 if siblings else 1
+        new_root_tag = f"{new_parent_tag}-{number}"
+        old_prefix = len(tag)
+        subtree = np.concatenate(levels)
+        new_tags = [new_root_tag + self.tags[r][old_prefix:] for r in subtree.tolist()]
+        if any(new in self.rows for new in new_tags):
+            raise KeyError("Moved tags collide with existing nodes")
+        for r, new in zip(subtree.tolist(), new_tags):
+            self.rename(r, new)
+        self.layer[subtree] += self.layer[new_parent] + 1 - self.layer[row]
+        self.unlink_child(row)
+        self.node_number[row] = number
+        self.parent[row] = new_parent
+        self.link_children([row])
+        return levels
+
+    def compact(self):
+        """
+        Drop tombstoned rows and close the gaps. Returns an array mapping old
+        rows to new rows (-1 for rows that were dropped).
+        """
+        keep = np.flatnonzero(self.alive[:self.size])
+        remap = np.full(self.size, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        for name in ('pos', 'layer', 'shape', 'node_number', 'poly_order', 'alive', 'revision', 'org_code'):
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+        parents = self.parent[keep]
+        self.parent[:len(keep)] = np.where(parents >= 0, remap[parents], -1)
+        self.parent[len(keep):self.size] = -1
+        self.alive[len(keep):self.size] = False
+        self.tags = [self.tags[row] for row in keep]
+        self.names = [self.names[row] for row in keep]
+        self.org_units = [self.org_units[row] for row in keep]
+        self.rows = {tag: row for row, tag in enumerate(self.tags)}
+        self.children = {int(remap[parent]): [int(remap[c]) for c in kids]
+                         for parent, kids in self.children.items() if remap[parent] >= 0}
+        self.size = len(keep)
+        self.tombstones = 0
+        return remap
+
+    def compaction_due(self, ratio=0.25):
+        """True when tombstones exceed ratio of the used rows."""
+        return bool(self.tombstones) and self.tombstones > ratio * self.size
+
+    def maybe_compact(self, ratio=0.25):
+        """Compact when compaction_due(ratio). Returns the remap or None."""
+        if self.compaction_due(ratio):
+            return self.compact()
+        return None
+
+    def rebuild_children(self):
+        """Rebuild the parent -> children index from the parent column in one sort."""
+        rows = np.flatnonzero(self.alive[:self.size] & (self.parent[:self.size] >= 0))
+        order = rows[np.lexsort((self.node_number[rows], self.parent[rows]))]
+        parents = self.parent[order]
+        starts = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]]) if len(order) else []
+        self.children = {int(parents[start]): group.tolist()
+                         for start, group in zip(starts, np.split(order, starts[1:]))}
+
+    # -- Bulk import / export -------------------------------------------------
+
+    def to_columns(self):
+        """
+        Live nodes as a dict of arrays: the numeric COLUMNS plus 'tags', 'names'
+        and 'org_units' as fixed-width string arrays. Parent links refer to
+        positions in the returned arrays.
+        """
+        rows = self.live_rows()
+        remap = np.full(self.size, -1, dtype=np.int64)
+        remap[rows] = np.arange(len(rows))
+        columns = {name: getattr(self, name)[rows] for name in COLUMNS}
+        parents = columns['parent']
+        columns['parent'] = np.where(parents >= 0, remap[np.maximum(parents, 0)], -1)
+        row_list = rows.tolist()
+        columns['tags'] = np.array([self.tags[row] for row in row_list], dtype=str)
+        columns['names'] = np.array([self.names[row] for row in row_list], dtype=str)
+        columns['org_units'] = np.array([self.org_units[row] for row in row_list], dtype=str)
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build a store from to_columns() output with bulk array copies."""
+        tags = [sys.intern(tag) for tag in np.asarray(columns['tags']).tolist()]
+        count = len(tags)
+        store = cls(capacity=max(count, 1024))
+        for name in COLUMNS:
+            if name in columns:
+                getattr(store, name)[:count] = columns[name]
+        store.alive[:count] = True
+        store.tags = tags
+        store.names = np.asarray(columns['names']).tolist() if 'names' in columns else list(tags)
+        if 'org_units' in columns:
+            units = np.asarray(columns['org_units'], dtype=str)
+            store.org_units = [sys.intern(unit) for unit in units.tolist()]
+            distinct, codes = np.unique(units, return_inverse=True)
+            table = np.array([store.org_unit_code(unit) for unit in distinct.tolist()], dtype=np.int32)
+            store.org_code[:count] = table[codes.reshape(-1)]
+        else:
+            store.org_units = [''] * count
+        store.rows = dict(zip(tags, range(count)))
+        store.size = count
+        store.rebuild_children()
+        return store
+
+    def assign(self, other):
+        """Take over other's contents in place, so existing references see the new nodes."""
+        self.__dict__.update(other.__dict__)
+
+    # -- Queries --------------------------------------------------------------
+
+    def row(self, tag):
+        return self.rows[tag]
+
+    def live_rows(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    def child_rows(self, row):
+        return self.children.get(row, [])
+
+    def has_children(self, row):
+        return row in self.children
+
+    def subtree_levels(self, row, depth=None):
+        """
+        Rows of the subtree rooted at row, one array per depth (the root first),
+        optionally limited to depth levels below the root. Cost is proportional
+        to the size of the result.
+        """
+        levels = [np.array([row], dtype=np.int64)]
+        frontier = [row]
+        children = self.children
+        while frontier and (depth is None or len(levels) <= depth):
+            frontier = [c for r in frontier for c in children.get(r, ())]
+            if frontier:
+                levels.append(np.array(frontier, dtype=np.int64))
+        return levels
+
+    def subtree_rows(self, row, depth=None):
+        return np.concatenate(self.subtree_levels(row, depth))
+
+    def descendant_rows(self, row, depth=None):
+        """Rows below row in breadth-first order, optionally limited to depth levels."""
+        return self.subtree_rows(row, depth)[1:]
+
+    def ancestor_rows(self, row):
+        """Rows on the path from the root down to row's parent, the root first."""
+        ancestors = []
+        parent = int(self.parent[row])
+        while parent >= 0:
+            ancestors.append(parent)
+            parent = int(self.parent[parent])
+        return ancestors[::-1]
+
+    def sibling_rows(self, row):
+        """The other children of row's parent, in node-number order."""
+        parent = int(self.parent[row])
+        if parent < 0:
+            return []
+        return [sibling for sibling in self.children.get(parent, ()) if sibling != row]
+
+    def subtree_size(self, row):
+        size, frontier = 0, [row]
+        children = self.children
+        while frontier:
+            size += len(frontier)
+            frontier = [c for r in frontier for c in children.get(r, ())]
+        return size
+
+    def to_dict(self, tag):
+        """Plain dict snapshot of a node in the legacy shape."""
+        return dict(NodeRecord(self, tag))
@@ -0,0 +1,310 @@
+"""
+persistence.py
+
+Durable storage for the server's NodeManager: an append-only mutation log plus
+periodic columnar snapshots in one data directory.
+
+    <data_dir>/snapshot/    one .npy file per NodeStore column, plus meta.json
+    <data_dir>/mutations.log    NDJSON mutation records newer than the snapshot
+
+Startup bulk-loads the snapshot arrays straight into a NodeStore and replays the
+(short) log on top. Log appends are group-committed by a background writer: all
+records that arrive while one fsync is in flight are written and synced together.
+A torn final record left by a crash is cut off on load, before appending resumes.
+Snapshots are written in the background; the log is rotated to mutations.log.prev
+when a snapshot starts and that file is removed once the snapshot is durable.
+The previous snapshot stays in snapshot.old until the new one has replaced it.
+"""
+
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from node_store import NodeStore
+
+# -----------------------------------------------------------------------------
+# COLUMN SNAPSHOTS
+# -----------------------------------------------------------------------------
+
+def fsync_dir(path):
+    """Make renames and removals inside directory path durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def save_snapshot(path, columns, meta):
+    """
+    Write columns (name -> array) and meta atomically into directory path. The
+    previous snapshot is moved aside to path.old until the new one is in place,
+    so a crash between the two renames leaves it for load_snapshot to find.
+    Every file and both directories are fsynced before the swap, and the parent
+    again after it, so the new snapshot is durable once this returns.
+    """
+    tmp_path = path + '.tmp'
+    parent = os.path.dirname(os.path.abspath(path))
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in columns.items():
+        with open(os.path.join(tmp_path, name + '.npy'), 'wb') as f:
+            np.save(f, array, allow_pickle=False)
+            f.flush()
+            os.fsync(f.fileno())
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    fsync_dir(tmp_path)
+    fsync_dir(parent)
+    old_path = path + '.old'
+    if os.path.exists(path):
+        # path only ever appears complete, so a leftover path.old is stale
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    fsync_dir(parent)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def load_snapshot(path, mmap_mode=None):
+    """
+    Return (columns, meta) from a snapshot directory, or (None, None) if there
+    is none. Falls back to path.old when save_snapshot crashed mid-swap.
+    """
+    for path in (path, path + '.old'):
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            break
+    else:
+        return None, None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    columns = {}
+    for filename in os.listdir(path):
+        if filename.endswith('.npy'):
+            columns[filename[:-4]] = np.load(os.path.join(path, filename),
+                                             mmap_mode=mmap_mode, allow_pickle=False)
+    return columns, meta
+
+# -----------------------------------------------------------------------------
+# GROUP-COMMITTED MUTATION LOG
+# -----------------------------------------------------------------------------
+
+class MutationLog:
+    """
+    Append-only NDJSON log. append() hands the record to a writer thread; with
+    wait=True it blocks until the batch containing the record has been fsynced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        self.file_lock = threading.Lock()  # Held while the writer touches self.file
+        self.pending = []
+        self.appended = 0   # Sequence number of the last appended record
+        self.synced = 0     # Sequence number of the last fsynced record
+        self.closed = False
+        self.cond = threading.Condition()
+        self.writer = threading.Thread(target=self.run_writer, name='mutation-log', daemon=True)
+        self.writer.start()
+
+    def append(self, record, wait=True):
+        """Queue a record and return its sequence number (see wait())."""
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.cond:
+            if self.closed:
+                raise ValueError("mutation log is closed")
+            self.pending.append(line)
+            self.appended += 1
+            seq = self.appended
+            self.cond.notify_all()
+        if wait:
+            self.wait(seq)
+        return seq
+
+    def wait(self, seq):
+        """Block until the record with sequence number seq has been fsynced."""
+        with self.cond:
+            while self.synced < seq:
+                self.cond.wait()
+
+    def run_writer(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending and self.closed:
+                    return
+                batch, self.pending = self.pending, []
+                seq = self.appended
+            with self.file_lock:
+                self.file.write(''.join(batch))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            with self.cond:
+                self.synced = seq
+                self.cond.notify_all()
+
+    def flush(self):
+        self.wait(self.appended)
+
+    def rotate(self, rotated_path):
+        """
+        Move every record appended so far to the end of rotated_path and continue
+        in a fresh file. The caller must not append concurrently.
+        """
+        self.flush()
+        with self.file_lock:
+            self.file.close()
+            if os.path.exists(rotated_path):
+                with open(self.path, 'rb') as src, open(rotated_path, 'ab') as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, rotated_path)
+            fsync_dir(os.path.dirname(os.path.abspath(self.path)))
+            self.file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.writer.join()
+        self.file.close()
+
+def truncate_torn_tail(path):
+    """
+    Cut a log back to its last complete record, so that records appended after
+    a crash are not glued onto a torn final line that read_log would stop at.
+    """
+    if not os.path.exists(path):
+        return
+    end = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            end += len(line)
+        size = f.seek(0, os.SEEK_END)
+    if end < size:
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+def read_log(path):
+    """Yield the records of a mutation log, stopping at a torn final line."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                return
+
+# -----------------------------------------------------------------------------
+# DATA DIRECTORY
+# -----------------------------------------------------------------------------
+
+class Persistence:
+    """Snapshot + log pair for one data directory."""
+
+    def __init__(self, data_dir, snapshot_every=10000):
+        self.data_dir = data_dir
+        self.snapshot_path = os.path.join(data_dir, 'snapshot')
+        self.log_path = os.path.join(data_dir, 'mutations.log')
+        self.prev_log_path = self.log_path + '.prev'
+        self.snapshot_thread = None
+        self.snapshot_lock = threading.Lock()  # Guards snapshot_thread
+        self.snapshot_every = snapshot_every  # Log records between automatic snapshots
+        self.records_since_snapshot = 0
+        os.makedirs(data_dir, exist_ok=True)
+        self.log = None
+
+    def load(self):
+        """
+        Return (store, revision, deleted, horizon, records) where store holds the
+        snapshot (or None when there is none), deleted and horizon are what was
+        passed to snapshot(), and records are the log entries to replay.
+        """
+        columns, meta = load_snapshot(self.snapshot_path)
+        store, revision, deleted, horizon = None, 0, {}, 0
+        if columns is not None:
+            store = NodeStore.from_columns(columns)
+            revision = meta['revision']
+            horizon = meta.get('deletedHorizon', 0)
+            deleted = dict(zip(columns['deleted_tags'].tolist(), columns['deleted_revisions'].tolist()))
+        for path in (self.prev_log_path, self.log_path):
+            truncate_torn_tail(path)
+        records = [record for path in (self.prev_log_path, self.log_path)
+                   for record in read_log(path) if record['rev'] > revision]
+        self.records_since_snapshot = len(records)
+        self.log = MutationLog(self.log_path)
+        return store, revision, deleted, horizon, records
+
+    def append(self, record):
+        """Queue a record without waiting; pass the result to wait() for durability."""
+        self.records_since_snapshot += 1
+        return self.log.append(record, wait=False)
+
+    def wait(self, seq):
+        self.log.wait(seq)
+
+    def snapshot_due(self):
+        return self.records_since_snapshot >= self.snapshot_every
+
+    def snapshot(self, store, revision, deleted, wait=False, horizon=0):
+        """
+        Snapshot the store as of revision, with deleted (tag -> revision of its
+        deletion) and the revision horizon before which deletions were
+        forgotten. The columns are copied synchronously, so
+        the caller must hold off mutations only for that copy; the files are written
+        by a background thread unless wait is set.
+        """
+        self.wait_for_snapshot()
+        columns = store.to_columns()
+        columns['deleted_tags'] = np.array(list(deleted), dtype=str)
+        columns['deleted_revisions'] = np.array(list(deleted.values()), dtype=np.int64)
+        meta = {'revision': revision, 'nodes': len(store), 'deletedHorizon': horizon}
+        self.log.rotate(self.prev_log_path)
+        self.records_since_snapshot = 0
+
+        def write():
+            save_snapshot(self.snapshot_path, columns, meta)  # Durable on return
+            os.remove(self.prev_log_path)
+            fsync_dir(self.data_dir)
+
+        thread = threading.Thread(target=write, name='snapshot', daemon=True)
+        with self.snapshot_lock:
+            thread.start()
+            self.snapshot_thread = thread
+        if wait:
+            self.wait_for_snapshot()
+
+    def wait_for_snapshot(self):
+        """
+        Wait for the snapshot being written, if any. Safe to call without the
+        caller's lock while another thread starts the next snapshot.
+        """
+        with self.snapshot_lock:
+            thread = self.snapshot_thread
+        if thread is not None:
+            thread.join()
+            with self.snapshot_lock:
+                if self.snapshot_thread is thread:
+                    self.snapshot_thread = None
+
+    def close(self):
+        self.wait_for_snapshot()
+        if self.log is not None:
+            self.log.close()
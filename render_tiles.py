@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+render_tiles.py
+
+Headless renderer that turns a network into a pyramid of PNG tiles for reports
+and zoomable web viewers, using the style.py marker sizes and colours shared
+with the desktop client. Tiles follow the XYZ layout: <out>/<z>/<x>/<y>.png,
+with y = 0 at the top. At zoom z the network's square bounding box is split
+into 2**z x 2**z tiles.
+
+    python render_tiles.py network.npy --out tiles --max-zoom 6
+    python render_tiles.py network.csv --out tiles
+    python render_tiles.py --server http://localhost:5000 --out tiles --workers 8
+
+Before rendering, the nodes are written once to a spatial index: columns sorted
+by (layer, grid cell) plus per-layer cell offsets, memory-mapped by every
+worker. A worker rendering a tile reads only the cell ranges that overlap it,
+padded per layer by the longest edge of that layer, so it loads only the nodes
+whose markers or edges can reach the tile. Empty tiles are not written.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.request
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+import numpy as np
+
+import network_io
+from style import Style
+
+DPI = 100
+REFERENCE_WIDTH = 800  # Pixels across the whole network at which markers get their desktop size
+INDEX_COLUMNS = ('x', 'y', 'px', 'py', 'sx', 'sy', 'layer')
+STYLE = Style()  # Tiles are styled by layer only; the index holds no org units or tags
+
+# -----------------------------------------------------------------------------
+# LOADING
+# -----------------------------------------------------------------------------
+
+def download_table(server_url, path, chunk_size=1 << 20):
+    """Stream the server's binary node table export to path."""
+    with urllib.request.urlopen(server_url.rstrip('/') + '/export?format=npy') as response, \
+            open(path, 'wb') as f:
+        shutil.copyfileobj(response, f, chunk_size)
+
+def load_columns(path):
+    """Numeric node columns (x, y, layer, parent, node) from a .npy table or a CSV export."""
+    if path.endswith('.npy'):
+        records = network_io.load_table(path)
+        return {name: np.asarray(records[field]) for name, field in
+                (('x', 'x'), ('y', 'y'), ('layer', 'layer'), ('parent', 'parent'), ('node', 'node'))}
+    store = network_io.import_csv(path)
+    columns = store.to_columns()
+    return {'x': columns['pos'][:, 0], 'y': columns['pos'][:, 1], 'layer': columns['layer'],
+            'parent': columns['parent'], 'node': columns['node_number']}
+
+# -----------------------------------------------------------------------------
+# SPATIAL INDEX
+# -----------------------------------------------------------------------------
+
+def build_index(columns, index_dir, grid):
+    """
+    Write the tile index to index_dir and return its metadata. Every node gets
+    its parent position (px, py) and the position of its next sibling around the
+    parent's polygon (sx, sy), NaN where there is none, so segments can be drawn
+    from a node's own record.
+    """
+    x, y = columns['x'].astype(float), columns['y'].astype(float)
+    layer, parent = columns['layer'].astype(np.int32), columns['parent'].astype(np.int64)
+    count = len(x)
+    has_parent = parent >= 0
+    px = np.where(has_parent, x[np.maximum(parent, 0)], np.nan)
+    py = np.where(has_parent, y[np.maximum(parent, 0)], np.nan)
+
+    # Next sibling in node-number order, wrapping round to close the polygon
+    order = np.lexsort((columns['node'], parent))
+    order = order[has_parent[order]]
+    sibling = np.full(count, -1, dtype=np.int64)
+    if len(order):
+        group_start = np.r_[True, parent[order][1:] != parent[order][:-1]]
+        starts = np.flatnonzero(group_start)
+        sizes = np.diff(np.r_[starts, len(order)])
+        nxt = np.roll(order, -1)
+        nxt[starts + sizes - 1] = order[starts]
+        polygon = np.repeat(sizes, sizes) > 2
+        sibling[order[polygon]] = nxt[polygon]
+    sx = np.where(sibling >= 0, x[np.maximum(sibling, 0)], np.nan)
+    sy = np.where(sibling >= 0, y[np.maximum(sibling, 0)], np.nan)
+
+    # Square world bounds and a grid x grid cell raster over them
+    (min_x, min_y), (max_x, max_y) = (x.min(), y.min()), (x.max(), y.max())
+    side = max(max_x - min_x, max_y - min_y, 1e-9) * 1.05
+    origin = ((min_x + max_x - side) / 2, (min_y + max_y - side) / 2)
+    cell = side / grid
+    cx = np.clip(((x - origin[0]) / cell).astype(np.int64), 0, grid - 1)
+    cy = np.clip(((y - origin[1]) / cell).astype(np.int64), 0, grid - 1)
+    layers = int(layer.max()) + 1
+    key = (layer.astype(np.int64) * grid + cy) * grid + cx
+    order = np.argsort(key, kind='stable')
+    offsets = np.searchsorted(key[order], np.arange(layers * grid * grid + 1))
+
+    # Longest segment (to parent or sibling) per layer bounds how far outside a
+    # tile a node can be and still draw into it
+    reach = np.fmax(np.hypot(x - px, y - py), np.hypot(x - sx, y - sy))
+    reach = np.nan_to_num(reach, nan=0.0)
+    layer_reach = np.zeros(layers)
+    np.maximum.at(layer_reach, layer, reach)
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name, column in zip(INDEX_COLUMNS, (x, y, px, py, sx, sy, layer)):
+        np.save(os.path.join(index_dir, name + '.npy'), column[order])
+    np.save(os.path.join(index_dir, 'offsets.npy'), offsets)
+    meta = {'nodes': count, 'grid': grid, 'layers': layers, 'origin': list(origin), 'side': side,
+            'layer_reach': layer_reach.tolist()}
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+# -----------------------------------------------------------------------------
+# WORKERS
+# -----------------------------------------------------------------------------
+
+INDEX = {}  # Per worker process: memory-mapped index columns and metadata
+
+def init_worker(index_dir):
+    with open(os.path.join(index_dir, 'meta.json')) as f:
+        INDEX['meta'] = json.load(f)
+    for name in INDEX_COLUMNS + ('offsets',):
+        INDEX[name] = np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r')
+
+def tile_bounds(z, tx, ty):
+    meta = INDEX['meta']
+    size = meta['side'] / 2 ** z
+    x0 = meta['origin'][0] + tx * size
+    y1 = meta['origin'][1] + meta['side'] - ty * size
+    return x0, y1 - size, x0 + size, y1
+
+def load_tile_nodes(bounds, marker_pad):
+    """Read the index records that can draw into bounds, layer by layer."""
+    meta = INDEX['meta']
+    grid, cell = meta['grid'], meta['side'] / meta['grid']
+    ox, oy = meta['origin']
+    x0, y0, x1, y1 = bounds
+    offsets = INDEX['offsets']
+    slices = []
+    for layer, reach in enumerate(meta['layer_reach']):
+        pad = max(reach, marker_pad)
+        ix0, ix1 = (int(np.clip((v - ox) // cell, 0, grid - 1)) for v in (x0 - pad, x1 + pad))
+        iy0, iy1 = (int(np.clip((v - oy) // cell, 0, grid - 1)) for v in (y0 - pad, y1 + pad))
+        base = layer * grid * grid
+        for iy in range(iy0, iy1 + 1):
+            start, stop = offsets[base + iy * grid + ix0], offsets[base + iy * grid + ix1 + 1]
+            if stop > start:
+                slices.append(slice(int(start), int(stop)))
+    return {name: (np.concatenate([INDEX[name][s] for s in slices]) if slices
+                   else np.empty(0, dtype=INDEX[name].dtype))
+            for name in INDEX_COLUMNS}
+
+def render_tile(task):
+    """Render one tile; returns (z, x, y, nodes read) or None when nothing reaches it."""
+    z, tx, ty, out_dir, tile_size = task
+    bounds = tile_bounds(z, tx, ty)
+    x0, y0, x1, y1 = bounds
+    units_per_pixel = (x1 - x0) / tile_size
+    scale = min(1.0, 2 ** z * tile_size / REFERENCE_WIDTH)
+    max_marker_px = np.sqrt(STYLE.size_table.max() * scale ** 2) / 2 * DPI / 72
+    nodes = load_tile_nodes(bounds, (max_marker_px + 1) * units_per_pixel)
+    if not len(nodes['x']):
+        return None
+
+    segments = []
+    for ex, ey in (('px', 'py'), ('sx', 'sy')):
+        ok = ~np.isnan(nodes[ex])
+        lo_x, hi_x = np.minimum(nodes['x'], nodes[ex]), np.maximum(nodes['x'], nodes[ex])
+        lo_y, hi_y = np.minimum(nodes['y'], nodes[ey]), np.maximum(nodes['y'], nodes[ey])
+        ok &= (hi_x >= x0) & (lo_x <= x1) & (hi_y >= y0) & (lo_y <= y1)
+        segments.append(np.stack([np.column_stack([nodes['x'][ok], nodes['y'][ok]]),
+                                  np.column_stack([nodes[ex][ok], nodes[ey][ok]])], axis=1))
+    edges, outlines = segments
+    pad = (max_marker_px + 1) * units_per_pixel
+    visible = ((nodes['x'] >= x0 - pad) & (nodes['x'] <= x1 + pad) &
+               (nodes['y'] >= y0 - pad) & (nodes['y'] <= y1 + pad))
+    if not visible.any() and not len(edges) and not len(outlines):
+        return None
+
+    fig = Figure(figsize=(tile_size / DPI, tile_size / DPI), dpi=DPI, facecolor='black')
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.set_xlim(x0, x1)
+    ax.set_ylim(y0, y1)
+    line_width = max(2 * scale, 0.3)
+    ax.add_collection(LineCollection(edges, colors='white', linewidths=line_width, zorder=1))
+    ax.add_collection(LineCollection(outlines, colors='cyan', linewidths=line_width, zorder=2))
+    layers = nodes['layer'][visible]
+    ax.scatter(nodes['x'][visible], nodes['y'][visible], s=STYLE.layer_sizes(layers) * scale ** 2,
+               c=STYLE.layer_colors(layers), zorder=3)
+    path = os.path.join(out_dir, str(z), str(tx), f"{ty}.png")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    canvas.print_png(path)
+    return z, tx, ty, len(nodes['x'])
+
+# -----------------------------------------------------------------------------
+# MAIN ENTRY POINT
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a VSM network into a pyramid of PNG tiles")
+    parser.add_argument('input', nargs='?', help="network export (.npy node table or .csv)")
+    parser.add_argument('--server', help="fetch the network from this server instead, e.g. http://localhost:5000")
+    parser.add_argument('--out', default='tiles', help="output directory")
+    parser.add_argument('--min-zoom', type=int, default=0)
+    parser.add_argument('--max-zoom', type=int, default=5)
+    parser.add_argument('--tile-size', type=int, default=256, help="tile edge in pixels")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args()
+    if bool(args.input) == bool(args.server):
+        parser.error("give either an input file or --server")
+
+    start = time.time()
+    work_dir = tempfile.mkdtemp(prefix='vsm-tiles-')
+    try:
+        source = args.input
+        if args.server:
+            source = os.path.join(work_dir, 'network.npy')
+            download_table(args.server, source)
+        columns = load_columns(source)
+        index_dir = os.path.join(work_dir, 'index')
+        grid = 2 ** min(max(args.max_zoom + 1, 4), 10)
+        meta = build_index(columns, index_dir, grid)
+        print(f"Indexed {meta['nodes']} nodes in {time.time() - start:.1f}s")
+
+        os.makedirs(args.out, exist_ok=True)
+        tasks = [(z, tx, ty, args.out, args.tile_size)
+                 for z in range(args.min_zoom, args.max_zoom + 1)
+                 for tx in range(2 ** z) for ty in range(2 ** z)]
+        written = 0
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(index_dir,)) as pool:
+            for result in pool.map(render_tile, tasks, chunksize=max(1, len(tasks) // (8 * (args.workers or 1)))):
+                written += result is not None
+        with open(os.path.join(args.out, 'metadata.json'), 'w') as f:
+            json.dump({'minZoom': args.min_zoom, 'maxZoom': args.max_zoom, 'tileSize': args.tile_size,
+                       'origin': meta['origin'], 'side': meta['side'], 'nodes': meta['nodes']}, f, indent=2)
+        print(f"Wrote {written} of {len(tasks)} tiles to {args.out} in {time.time() - start:.1f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+response_cache.py
+
+Size-bounded LRU cache of serialized response bodies for the server. Entries
+are bytes keyed by any hashable; callers invalidate exactly the keys a
+mutation affects. Optionally stores a gzip-compressed body next to the plain one.
+"""
+
+from collections import OrderedDict
+import gzip
+import threading
+
+class ResponseCache:
+    """
+    LRU over serialized bodies, bounded by the total size of the cached bytes.
+    Bodies larger than the whole budget are served but never cached.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, compress=False, compress_level=5):
+        self.max_bytes = max_bytes
+        self.compress = compress  # Also keep a gzip body for clients that accept it
+        self.compress_level = compress_level
+        self.entries = OrderedDict()  # (key, gzipped) -> bytes, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, build, gzipped=False):
+        """
+        Return the body for key, calling build() for the plain bytes on a miss.
+        With gzipped (honoured only when compression is enabled) the body is
+        gzip-compressed. Returns (body, gzipped).
+        """
+        gzipped = gzipped and self.compress
+        entry = (key, gzipped)
+        with self.lock:
+            body = self.entries.get(entry)
+            if body is not None:
+                self.entries.move_to_end(entry)
+                self.hits += 1
+                return body, gzipped
+            self.misses += 1
+            plain = self.entries.get((key, False)) if gzipped else None
+        if plain is None:
+            plain = build()
+            self.put((key, False), plain)
+        if not gzipped:
+            return plain, False
+        body = gzip.compress(plain, compresslevel=self.compress_level)
+        self.put(entry, body)
+        return body, True
+
+    def put(self, entry, body):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(entry, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[entry] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        with self.lock:
+            for key in keys:
+                for entry in ((key, False), (key, True)):
+                    body = self.entries.pop(entry, None)
+                    if body is not None:
+                        self.size -= len(body)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+            }
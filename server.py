@@ -1,17 +1,81 @@
-from flask import Flask, jsonify, request
+"""
+server.py
+
+REST API over the shared VSM network.
+
+Serving modes:
+  python server.py                 Flask development server (debug, auto-reload)
+  python server.py --production    multi-threaded WSGI server: waitress when it is
+                                   installed, otherwise werkzeug's threaded server.
+                                   --host and --threads tune it.
+
+The NodeManager is safe to share between the server's request threads, so
+any threaded WSGI server (or `waitress-serve server:app`) can host the app.
+Run a single process per data directory: the network lives in process memory.
+
+Nodes created without coordinates (children and batch expansions) stay at
+[0, 0] unless --layout enables the overlap-free layout engine in layout.py,
+which places them and may shift neighbouring sub-structures to make room;
+shifted nodes are stamped with the new revision like any other change.
+
+GET /metrics serves Prometheus metrics. Node, revision and cache gauges are
+always available; per-route and per-operation timing histograms are recorded
+only with --metrics (or VSM_METRICS=1), so they cost nothing otherwise.
+
+GET /events streams every mutation as a Server-Sent Event carrying the changed
+nodes, so viewers stay in sync without re-fetching /nodes. Each open stream
+holds one server thread; --feed-clients caps how many may be open at once.
+"""
+
+import argparse
+import atexit
+from bisect import bisect_right
+from contextlib import contextmanager
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
+import io
 import json
+import logging
+
+import numpy as np
+
+from change_feed import ChangeFeed
+from layout import Layout
+import metrics
+import network_io
+from node_store import NodeStore
+from persistence import Persistence
+from response_cache import ResponseCache
 
 app = Flask(__name__)
 CORS(app, resources={
     r"/*": {
         "origins": "*",
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "methods": ["GET", "POST", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "If-None-Match", "Last-Event-ID"],
+        "expose_headers": ["ETag", "X-Revision", "X-Epoch"]
     }
 })
 
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'vsm_http_request_duration_seconds', "Time to produce a response, by route", label='route')
+RESPONSE_BYTES = metrics.REGISTRY.histogram(
+    'vsm_http_response_bytes', "Size of non-streamed response bodies, by route",
+    metrics.SIZE_BUCKETS, label='route')
+MANAGER_SECONDS = metrics.REGISTRY.histogram(
+    'vsm_manager_operation_seconds', "Time spent in NodeManager operations, by operation",
+    label='operation')
+
 class Node:
+    """API representation of a node. Nodes are held in NodeManager's NodeStore."""
+    __slots__ = ('tag', 'position', 'layer', 'poly_order', 'parent', 'name', 'children')
+
     def __init__(self, tag, position, layer, poly_order=6, parent=None, name=None):
         self.tag = tag
         self.position = position  # [x, y]
@@ -21,6 +85,14 @@ class Node:
         self.name = name or tag
         self.children = []
 
+    @classmethod
+    def from_store(cls, store, tag, children=()):
+        record = store[tag]
+        node = cls(tag, list(record['pos']), record['layer'], record['polyOrder'],
+                   record['parent'], record['name'])
+        node.children = list(children)
+        return node
+
     def to_dict(self):
         return {
             'tag': self.tag,
@@ -32,51 +104,743 @@ class Node:
             'children': self.children
         }
 
-class NodeManager:
+INT32_MAX = 2**31 - 1
+MAX_EXPAND_CHILDREN = 1000    # Children one expansion may request for a parent
+MAX_EXPAND_NODES = 100000     # Children one expand batch may request in total
+
+def positive_int32(value):
+    """True for an int (not a bool) that fits the store's int32 columns and is above zero."""
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= INT32_MAX
+
+def encode_json(data):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+class ReadWriteLock:
+    """
+    Any number of concurrent readers or one writer. Writers are preferred: once
+    a writer is waiting, new readers queue behind it so writes cannot starve.
+    """
+
     def __init__(self):
-        self.nodes = {}
-        self.create_seed_node()
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writing = False
+        self.waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self.cond:
+            while self.writing or self.waiting_writers:
+                self.cond.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.readers -= 1
+                if not self.readers:
+                    self.cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.cond:
+            self.waiting_writers += 1
+            while self.writing or self.readers:
+                self.cond.wait()
+            self.waiting_writers -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+class DeletionLog:
+    """
+    Deleted tags in revision order, for answering "what was deleted since
+    revision r" with one bisect. Deletions more than retention revisions old
+    are forgotten; horizon is then the newest forgotten revision, and a
+    client that has not seen it must reload instead of syncing.
+    """
+
+    def __init__(self, retention=100000, horizon=0):
+        self.retention = retention
+        self.horizon = horizon
+        self.revisions = []  # Ascending
+        self.tags = []
+        self.latest = {}     # Tag -> revision of its deletion, while it stays deleted
+
+    @classmethod
+    def from_dict(cls, deleted, retention=100000, horizon=0):
+        log = cls(retention, horizon)
+        for tag, revision in sorted(deleted.items(), key=lambda item: item[1]):
+            log.revisions.append(revision)
+            log.tags.append(tag)
+            log.latest[tag] = revision
+        return log
+
+    def add(self, tags, revision):
+        for tag in tags:
+            self.revisions.append(revision)
+            self.tags.append(tag)
+            self.latest[tag] = revision
+        self.expire(revision - self.retention)
+
+    def discard(self, tag):
+        """Forget the deletion of a tag that has been created again."""
+        self.latest.pop(tag, None)
+
+    def reset(self, horizon):
+        """Forget every deletion up to and including revision horizon."""
+        self.revisions, self.tags, self.latest = [], [], {}
+        self.horizon = max(self.horizon, horizon)
+
+    def expire(self, revision):
+        """Forget deletions at or before revision, trimming the lists once half of them are stale."""
+        stale = bisect_right(self.revisions, revision)
+        if not stale:
+            return
+        self.horizon = max(self.horizon, self.revisions[stale - 1])
+        if 2 * stale < len(self.revisions):
+            return
+        for tag, deleted_at in zip(self.tags[:stale], self.revisions[:stale]):
+            if self.latest.get(tag) == deleted_at:
+                del self.latest[tag]
+        del self.revisions[:stale], self.tags[:stale]
+
+    def since(self, revision):
+        """Tags deleted after revision (and still deleted), or None when revision is behind the horizon."""
+        if revision < self.horizon:
+            return None
+        start = bisect_right(self.revisions, revision)
+        latest = self.latest
+        return [tag for tag, deleted_at in zip(self.tags[start:], self.revisions[start:])
+                if latest.get(tag) == deleted_at]
+
+class NodeManager:
+    """
+    Owns the server-side network. Every mutation bumps self.revision and stamps
+    the rows it touched, so clients can ask for the changes since a revision
+    they have already seen. Deleted tags are remembered in self.deleted for
+    deletion_retention revisions; an import forgets them all, since clients
+    older than an import have to reload anyway.
+
+    With a Persistence backend every mutation is also written to its log as one
+    record per revision, and the network is restored from the backend on start.
+
+    Serialized get_node() and full-listing bodies are kept in self.cache and
+    invalidated for exactly the nodes each mutation touches.
+
+    Revisions restart from a snapshot or from 1 when the process restarts, so
+    self.epoch, drawn afresh by every manager, tells a client whether the
+    revision it holds was issued by this one.
+
+    Each mutation also publishes one event to self.feed, with the revision as
+    its id: 'change' with the same body as changes_since() for that revision,
+    or 'resync' after an import, which is too large to send as an event.
+
+    Safe to share between request threads: readers hold self.lock shared, and
+    mutations hold it exclusively only while they change the store and queue
+    their log record. Waiting for the record to reach disk happens after the
+    lock is released, so concurrent writers share one fsync.
+    """
+
+    def __init__(self, persistence=None, cache=None, layout=False, feed=None, deletion_retention=100000):
+        self.nodes = NodeStore()
+        self.layout = Layout(self.nodes) if layout else None
+        self.revision = 0
+        self.epoch = uuid.uuid4().hex
+        self.deleted = DeletionLog(deletion_retention)
+        self.persistence = persistence
+        self.lock = ReadWriteLock()
+        self.cache = cache if cache is not None else ResponseCache()
+        self.feed = None
+        if persistence is None:
+            self.create_seed_node()
+        else:
+            self.load()
+        self.use_feed(feed if feed is not None else ChangeFeed())
+
+    def load(self):
+        """Bulk-load the latest snapshot and replay the mutation log on top of it."""
+        persistence, self.persistence = self.persistence, None
+        store, revision, deleted, horizon, records = persistence.load()
+        if store is None:
+            self.create_seed_node()
+        else:
+            self.nodes, self.revision = store, revision
+            self.deleted = DeletionLog.from_dict(deleted, self.deleted.retention, horizon)
+            self.adopt_layout()
+        for record in records:
+            if record['op'] == 'add':
+                self.insert_nodes(record['columns'])
+                self.apply_moves(record.get('moved'))
+            elif record['op'] == 'delete':
+                self.remove_subtree(record['tag'])
+            if self.revision != record['rev']:
+                raise ValueError(f"Mutation log is inconsistent at revision {record['rev']}")
+        self.persistence = persistence
+
+    def adopt_layout(self):
+        """Restart the layout engine on the current store, keeping its positions."""
+        if self.layout is not None:
+            self.layout = Layout(self.nodes)
+            self.layout.adopt()
+
+    def apply_moves(self, moved):
+        """Replay the positions of nodes the layout engine shifted (from a log record)."""
+        if not moved:
+            return
+        rows = np.array([self.nodes.row(tag) for tag in moved['tag']], dtype=np.int64)
+        self.nodes.pos[rows] = np.column_stack([moved['x'], moved['y']])
+        self.nodes.revision[rows] = self.revision
+        if self.layout is not None:
+            self.layout.adopt(np.unique(self.nodes.parent[rows]))
+
+    def use_feed(self, feed):
+        """Publish mutations to feed from the current revision on."""
+        feed.reset(self.revision)
+        self.feed = feed
+
+    def publish(self, rows=(), deleted=()):
+        """Publish the current revision's change event: rows changed, tags deleted. Call under the write lock."""
+        if self.feed is None:
+            return
+        tags = self.nodes.tags
+        self.feed.publish(self.revision, 'change', encode_json({
+            'revision': self.revision,
+            'nodes': {tags[row]: self.node_dict(tags[row]) for row in np.unique(rows).tolist()},
+            'deleted': list(deleted),
+        }))
+
+    def log_mutation(self, record):
+        """Queue a mutation record; returns a token for wait_durable(). Call under the write lock."""
+        if self.persistence is None:
+            return None
+        seq = self.persistence.append(record)
+        if self.persistence.snapshot_due():
+            self.snapshot()
+        return seq
+
+    def snapshot(self):
+        self.persistence.snapshot(self.nodes, self.revision, self.deleted.latest, horizon=self.deleted.horizon)
+
+    def wait_durable(self, seq):
+        if seq is not None:
+            self.persistence.wait(seq)
+
+    def close(self):
+        if self.persistence is not None:
+            with self.lock.write():
+                self.persistence.close()
 
     def create_seed_node(self):
-        seed = Node('0/0/1', [0, 0], 0)
-        self.nodes[seed.tag] = seed
-        return seed.to_dict()
+        row = self.nodes.add('0/0/1', (0, 0), 0)
+        self.touch([row])
+        return self.get_node('0/0/1')
+
+    def touch(self, rows):
+        """Start a new revision and stamp rows (and their parents, whose children changed)."""
+        self.revision += 1
+        rows = np.asarray(rows, dtype=np.int64)
+        parents = self.nodes.parent[rows]
+        self.nodes.revision[rows] = self.revision
+        self.nodes.revision[parents[parents >= 0]] = self.revision
+        for row in rows.tolist():
+            self.deleted.discard(self.nodes.tags[row])
+        self.invalidate(np.concatenate([rows, parents[parents >= 0]]))
+
+    def invalidate(self, rows):
+        """Drop the cached bodies of rows and of the full listing."""
+        tags = self.nodes.tags
+        self.cache.invalidate([('node', tags[row]) for row in np.asarray(rows).tolist()] + ['nodes'])
 
+    # -- Mutations ------------------------------------------------------------
+
+    @metrics.timed(MANAGER_SECONDS, 'add_child_nodes')
     def add_child_nodes(self, parent_tag, count):
         if parent_tag not in self.nodes:
             return {'error': 'Parent node not found'}
 
-        parent = self.nodes[parent_tag]
-        new_nodes = []
+        return self.expand_nodes([(parent_tag, count)], as_nodes=True)
+
+    @metrics.timed(MANAGER_SECONDS, 'delete_node')
+    def delete_node(self, tag):
+        """Delete a node and its whole sub-structure. Returns the deleted tags."""
+        with self.lock.write():
+            tags, seq = self.remove_subtree(tag)
+        self.wait_durable(seq)
+        return tags
+
+    def remove_subtree(self, tag):
+        """delete_node without locking or waiting; returns (tags or error, log token)."""
+        if tag not in self.nodes:
+            return {'error': 'Node not found'}, None
+        parent = self.nodes.parent[self.nodes.row(tag)]
+        rows = self.nodes.remove_subtree(tag)
+        if self.layout is not None and parent >= 0:
+            self.layout.removed([parent])
+        self.revision += 1
+        if parent >= 0:
+            self.nodes.revision[parent] = self.revision
+        tags = [self.nodes.tags[row] for row in rows.tolist()]
+        self.deleted.add(tags, self.revision)
+        self.invalidate(np.append(rows, parent) if parent >= 0 else rows)
+        self.publish([parent] if parent >= 0 else [], tags)
+        seq = self.log_mutation({'op': 'delete', 'rev': self.revision, 'tag': tag})
+        self.maybe_compact()
+        return tags, seq
+
+    def maybe_compact(self):
+        """
+        Reclaim deleted rows once NodeStore.compaction_due(). The compacted store
+        is a copy swapped in for self.nodes, so listings and exports streaming
+        from the old one are not renumbered under them. Call under the write lock.
+        """
+        store = self.nodes
+        if not store.compaction_due():
+            return
+        rows = store.live_rows()
+        remap = np.full(store.size, -1, dtype=np.int64)
+        remap[rows] = np.arange(len(rows))
+        self.nodes = NodeStore.from_columns(store.to_columns())
+        if self.layout is not None:
+            self.layout.store = self.nodes
+            self.layout.remap(remap)
+
+    @metrics.timed(MANAGER_SECONDS, 'add_nodes')
+    def add_nodes(self, columns, as_nodes=False):
+        """
+        Create a batch of fully specified nodes atomically. columns holds parallel
+        lists keyed 'tag', 'x', 'y', 'parent' and optionally 'layer',
+        'polyOrder' and 'name'. A parent may be an existing node or one created
+        earlier in the same batch. Either every node is created or, on a
+        validation error, none is and {'error': ...} is returned. Returns the
+        created tags, or with as_nodes their node dicts as of the insert.
+        """
+        with self.lock.write():
+            created, seq = self.insert_nodes(columns)
+            created = self.created_nodes(created, as_nodes)
+        self.wait_durable(seq)
+        return created
+
+    @metrics.timed(MANAGER_SECONDS, 'expand_nodes')
+    def expand_nodes(self, expansions, as_nodes=False):
+        """
+        Apply a list of (parent_tag, count) expansions as one atomic batch. Parents
+        may be children created by an earlier expansion in the same list, and a
+        parent listed more than once gets the largest of its counts. Existing
+        child tags are skipped, as in add_child_nodes. The new nodes are placed by
+        the layout engine. Counts above MAX_EXPAND_CHILDREN, or more than
+        MAX_EXPAND_NODES children in total, are rejected before locking.
+        Returns what add_nodes does.
+        """
+        counts = {}
+        for parent, count in expansions:
+            if not isinstance(count, int) or isinstance(count, bool) or not 0 <= count <= MAX_EXPAND_CHILDREN:
+                return {'error': f"Expansion of {parent} has an invalid count {count!r} "
+                                 f"(at most {MAX_EXPAND_CHILDREN})"}
+            counts[parent] = max(counts.get(parent, 0), count)
+        if sum(counts.values()) > MAX_EXPAND_NODES:
+            return {'error': f"Expansions request more than {MAX_EXPAND_NODES} nodes"}
+        with self.lock.write():
+            columns = {'tag': [], 'parent': []}
+            for parent, count in counts.items():
+                for i in range(count):
+                    tag = f"{parent}-{i+1}"
+                    if tag not in self.nodes:
+                        columns['tag'].append(tag)
+                        columns['parent'].append(parent)
+            created, seq = self.insert_nodes(columns)
+            created = self.created_nodes(created, as_nodes)
+        self.wait_durable(seq)
+        return created
 
-        for i in range(count):
-            tag = f"{parent_tag}-{i+1}"
-            # Position will be set by the frontend
-            node = Node(tag, [0, 0], parent.layer + 1, parent=parent_tag)
-            self.nodes[tag] = node
-            parent.children.append(tag)
-            new_nodes.append(node.to_dict())
+    def created_nodes(self, created, as_nodes):
+        """Node dicts for insert_nodes' created tags when as_nodes is set. Call under the lock."""
+        if not as_nodes or isinstance(created, dict):
+            return created
+        return [self.node_dict(tag) for tag in created]
 
-        return new_nodes
+    def insert_nodes(self, columns):
+        """
+        add_nodes without locking or waiting; returns (tags or error, log token).
+        Without 'x' and 'y' columns the nodes are placed by the layout engine.
+        """
+        tags = columns.get('tag') or []
+        count = len(tags)
+        for key in ('x', 'y', 'parent', 'layer', 'polyOrder', 'name'):
+            if key in columns and len(columns[key]) != count:
+                return {'error': f"Column '{key}' has {len(columns[key])} values, expected {count}"}, None
+        xs = columns.get('x', [0] * count)
+        ys = columns.get('y', [0] * count)
+        parents = columns.get('parent', [None] * count)
+        layers = columns.get('layer', [None] * count)
+        poly_orders = columns.get('polyOrder', [6] * count)
+        names = columns.get('name', [None] * count)
 
+        store = self.nodes
+        batch_rows = {}
+        parent_rows, new_layers, numbers = [], [], []
+        for i, (tag, parent, layer, poly_order, name) in enumerate(zip(tags, parents, layers, poly_orders, names)):
+            if not isinstance(tag, str) or not tag:
+                return {'error': f"Node {i} has no tag"}, None
+            if tag in store or tag in batch_rows:
+                return {'error': f"Node {tag} already exists"}, None
+            if parent is None:
+                return {'error': f"Node {tag} has no parent"}, None
+            if not isinstance(parent, str):
+                return {'error': f"Node {tag} has a parent that is not a tag"}, None
+            if name is not None and not isinstance(name, str):
+                return {'error': f"Node {tag} has a name that is not a string"}, None
+            if layer is not None and not positive_int32(layer):
+                return {'error': f"Node {tag} has an invalid layer {layer!r}"}, None
+            if not positive_int32(poly_order):
+                return {'error': f"Node {tag} has an invalid polyOrder {poly_order!r}"}, None
+            if parent in batch_rows:
+                parent_row = store.size + batch_rows[parent]
+                parent_layer = new_layers[batch_rows[parent]]
+            elif parent in store:
+                parent_row = store.row(parent)
+                parent_layer = int(store.layer[parent_row])
+            else:
+                return {'error': f"Parent node {parent} not found"}, None
+            batch_rows[tag] = i
+            parent_rows.append(parent_row)
+            new_layers.append(parent_layer + 1 if layer is None else layer)
+            suffix = tag[len(parent) + 1:] if tag.startswith(parent + '-') else ''
+            numbers.append(int(suffix) if suffix.isdigit() else 1)
+
+        try:
+            positions = np.column_stack([np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)])
+            if not np.isfinite(positions).all():
+                i = int(np.flatnonzero(~np.isfinite(positions).all(axis=1))[0])
+                return {'error': f"Node {tags[i]} has a non-finite position"}, None
+            rows = store.add_many(tags, positions, new_layers, poly_orders, parent_rows, nodes=numbers,
+                                  names=[name or tag for tag, name in zip(tags, names)])
+        except (TypeError, ValueError) as e:
+            return {'error': f"Invalid node data: {e}"}, None
+        if not len(rows):
+            return [], None
+        moved = np.empty(0, dtype=np.int64)
+        if self.layout is not None:
+            if 'x' in columns or 'y' in columns:
+                self.layout.adopt(np.union1d(store.parent[rows], rows))
+            else:
+                moved = np.setdiff1d(self.layout.place(rows), rows)
+        touched = np.concatenate([rows, moved])
+        self.touch(touched)
+        owners = store.parent[rows]
+        self.publish(np.concatenate([touched, owners[owners >= 0]]))
+        created = [store.tags[row] for row in rows.tolist()]
+        record = {'op': 'add', 'rev': self.revision, 'columns': {
+            'tag': created,
+            'x': store.pos[rows, 0].tolist(),
+            'y': store.pos[rows, 1].tolist(),
+            'parent': list(parents),
+            'layer': store.layer[rows].tolist(),
+            'polyOrder': store.poly_order[rows].tolist(),
+            'name': [store.names[row] for row in rows.tolist()],
+        }}
+        if len(moved):
+            record['moved'] = {
+                'tag': [store.tags[row] for row in moved.tolist()],
+                'x': store.pos[moved, 0].tolist(),
+                'y': store.pos[moved, 1].tolist(),
+            }
+        return created, self.log_mutation(record)
+
+    @metrics.timed(MANAGER_SECONDS, 'replace_nodes')
+    def replace_nodes(self, store):
+        """
+        Replace the whole network with store (an import). Every imported node is
+        stamped with the new revision, and the deletion history is reset so that
+        clients from before the import reload. With persistence the new state is
+        snapshotted before returning.
+        """
+        with self.lock.write():
+            self.revision += 1
+            self.deleted.reset(self.revision)
+            store.revision[store.live_rows()] = self.revision
+            self.nodes = store
+            self.adopt_layout()
+            self.cache.clear()
+            if self.feed is not None:
+                self.feed.publish(self.revision, 'resync', encode_json({'revision': self.revision}))
+            if self.persistence is not None:
+                self.snapshot()
+        if self.persistence is not None:
+            self.persistence.wait_for_snapshot()
+        return len(store)
+
+    # -- Queries --------------------------------------------------------------
+
+    @metrics.timed(MANAGER_SECONDS, 'get_node')
     def get_node(self, tag):
-        return self.nodes.get(tag).to_dict() if tag in self.nodes else None
+        with self.lock.read():
+            return self.node_dict(tag)
+
+    def node_dict(self, tag, store=None):
+        """The node as a dict, read from store (the current network by default)."""
+        store = self.nodes if store is None else store
+        if tag not in store:
+            return None
+        return Node.from_store(store, tag, self.child_tags(tag, store)).to_dict()
+
+    def child_tags(self, tag, store=None):
+        store = self.nodes if store is None else store
+        return [store.tags[row] for row in store.child_rows(store.row(tag))]
 
+    @metrics.timed(MANAGER_SECONDS, 'get_subtree')
+    def get_subtree(self, tag, depth=None):
+        """
+        The node and its descendants down to depth levels below it (all of them
+        when depth is None), breadth-first; None for an unknown tag. Nodes on the
+        last level still list their children, so clients can continue from there.
+        """
+        with self.lock.read():
+            if tag not in self.nodes:
+                return None
+            tags = self.nodes.tags
+            rows = self.nodes.subtree_rows(self.nodes.row(tag), depth)
+            return {
+                'revision': self.revision,
+                'nodes': [self.node_dict(tags[row]) for row in rows.tolist()],
+            }
+
+    @metrics.timed(MANAGER_SECONDS, 'get_ancestors')
+    def get_ancestors(self, tag):
+        """The node's ancestors from the root down to its parent; None for an unknown tag."""
+        with self.lock.read():
+            if tag not in self.nodes:
+                return None
+            tags = self.nodes.tags
+            return {
+                'revision': self.revision,
+                'nodes': [self.node_dict(tags[row]) for row in self.nodes.ancestor_rows(self.nodes.row(tag))],
+            }
+
+    @metrics.timed(MANAGER_SECONDS, 'node_body')
+    def node_body(self, tag, gzipped=False):
+        """get_node(tag) serialized, as (body, gzipped); body is None for an unknown tag."""
+        with self.lock.read():
+            if tag not in self.nodes:
+                return None, False
+            return self.cache.get(('node', tag), lambda: encode_json(self.node_dict(tag)), gzipped)
+
+    @metrics.timed(MANAGER_SECONDS, 'listing_body')
+    def listing_body(self, gzipped=False):
+        """get_all_nodes() serialized, as (revision, body, gzipped)."""
+        with self.lock.read():
+            body, gzipped = self.cache.get('nodes', lambda: encode_json(self.all_node_dicts()), gzipped)
+            return self.revision, body, gzipped
+
+    @metrics.timed(MANAGER_SECONDS, 'get_all_nodes')
     def get_all_nodes(self):
-        return {tag: node.to_dict() for tag, node in self.nodes.items()}
+        with self.lock.read():
+            return self.all_node_dicts()
+
+    def all_node_dicts(self):
+        return {tag: self.node_dict(tag) for tag in self.nodes}
+
+    def locked_chunks(self, chunks):
+        """
+        Advance a generator of chunks under the read lock one chunk at a time, so
+        a long stream never holds the lock while its consumer is writing it out.
+        """
+        while True:
+            with self.lock.read():
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def iter_nodes(self, start=0, limit=None, chunk_size=1000):
+        """
+        Yield (cursor, node dict) for live nodes in row order from row start,
+        without building the whole listing. cursor is the row to resume after.
+        Nodes deleted while the listing is in progress are skipped, and an import
+        does not leak into it: every chunk is read from the store it started on
+        (so after a compaction, deletions no longer reach it either).
+        """
+        return self.iter_rows(*self.listing_rows(start, limit), chunk_size)
+
+    def listing_rows(self, start=0, limit=None):
+        """The current store and its live rows from row start on, at most limit of them."""
+        with self.lock.read():
+            store = self.nodes
+            rows = store.live_rows()
+        rows = rows[np.searchsorted(rows, start):]
+        return store, rows if limit is None else rows[:limit]
+
+    def iter_rows(self, store, rows, chunk_size=1000):
+        """iter_nodes over rows of store, as returned by listing_rows()."""
+        def chunks():
+            for offset in range(0, len(rows), chunk_size):
+                yield [(row + 1, self.node_dict(store.tags[row], store))
+                       for row in rows[offset:offset + chunk_size].tolist() if store.alive[row]]
+
+        for chunk in self.locked_chunks(chunks()):
+            yield from chunk
+
+    @metrics.timed(MANAGER_SECONDS, 'changes_since')
+    def changes_since(self, revision):
+        """
+        Nodes created or changed after revision, and tags deleted after it; None
+        when revision is older than the retained deletion history or newer than
+        the current revision (one issued before a server restart).
+        """
+        with self.lock.read():
+            if revision > self.revision:
+                return None
+            deleted = self.deleted.since(revision)
+            if deleted is None:
+                return None
+            store = self.nodes
+            rows = store.live_rows()
+            rows = rows[store.revision[rows] > revision]
+            return {
+                'revision': self.revision,
+                'nodes': {store.tags[row]: self.node_dict(store.tags[row]) for row in rows.tolist()},
+                'deleted': deleted,
+            }
 
 node_manager = NodeManager()
 
+metrics.REGISTRY.gauge('vsm_nodes', "Live nodes in the network", lambda: len(node_manager.nodes))
+metrics.REGISTRY.gauge('vsm_revision', "Current network revision", lambda: node_manager.revision)
+metrics.REGISTRY.gauge('vsm_response_cache_hits_total', "Response cache hits",
+                       lambda: node_manager.cache.hits, kind='counter')
+metrics.REGISTRY.gauge('vsm_response_cache_misses_total', "Response cache misses",
+                       lambda: node_manager.cache.misses, kind='counter')
+metrics.REGISTRY.gauge('vsm_response_cache_evictions_total', "Response cache evictions",
+                       lambda: node_manager.cache.evictions, kind='counter')
+metrics.REGISTRY.gauge('vsm_response_cache_bytes', "Bytes held by the response cache",
+                       lambda: node_manager.cache.size)
+metrics.REGISTRY.gauge('vsm_feed_subscribers', "Open /events streams",
+                       lambda: node_manager.feed.subscribers)
+metrics.REGISTRY.gauge('vsm_feed_resyncs_total', "/events readers that fell behind the change feed",
+                       lambda: node_manager.feed.resyncs, kind='counter')
+
+@app.before_request
+def start_timer():
+    if metrics.ENABLED:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else 'unmatched'}"
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route)
+        if response.content_length is not None:
+            RESPONSE_BYTES.observe(response.content_length, route)
+    return response
+
+def accepts_gzip():
+    return 'gzip' in request.accept_encodings
+
+def cached_json(body, gzipped):
+    """Response for a pre-serialized JSON body from the response cache."""
+    response = Response(body, mimetype='application/json')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/nodes', methods=['GET'])
 def get_nodes():
-    return jsonify(node_manager.get_all_nodes())
+    """
+    Full listing of the network, tagged with an ETag for the current epoch and
+    revision (304 when the client's copy is current), and with the two in the
+    X-Epoch and X-Revision headers. Query parameters:
+      since=<rev>            only nodes created/changed and tags deleted after rev;
+                             410 with "reload": true when rev cannot be synced from:
+                             too old, newer than the current revision, or issued
+                             under another epoch=<epoch> than the current one
+      limit=<n>&cursor=<c>   one page of at most n nodes; follow 'next' for the rest.
+                             Cursors are row positions, which the compaction that
+                             follows deletes renumbers: restart paging when a page's
+                             'revision' differs from the first page's
+      format=ndjson          stream one JSON node per line instead of one document
+    """
+    revision = node_manager.revision
+    epoch = node_manager.epoch
+    etag = f"{epoch}-{revision}"
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor', 0, type=int)
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    if cursor < 0:
+        return jsonify({'error': 'cursor must be zero or positive'}), 400
+    if since is None and request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif since is not None:
+        changes = None
+        if request.args.get('epoch', epoch) == epoch:
+            changes = node_manager.changes_since(since)
+        if changes is None:
+            response = jsonify({'error': f"Revision {since} is not in this server's retained history",
+                                'revision': revision, 'reload': True})
+            response.status_code = 410
+        else:
+            response = jsonify(changes)
+    elif request.args.get('format') == 'ndjson':
+        def generate():
+            for _, node in node_manager.iter_nodes():
+                yield json.dumps(node) + '\n'
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    elif limit is not None:
+        # next follows the rows scanned, so nodes deleted mid-page do not end the listing
+        store, rows = node_manager.listing_rows(cursor, limit)
+        page = node_manager.iter_rows(store, rows)
+        response = jsonify({
+            'revision': revision,
+            'nodes': {node['tag']: node for _, node in page},
+            'next': int(rows[-1]) + 1 if len(rows) == limit else None,
+        })
+    else:
+        revision, body, gzipped = node_manager.listing_body(accepts_gzip())
+        response = cached_json(body, gzipped)
+        etag = f"{epoch}-{revision}"
+    if since is None:
+        response.set_etag(etag)
+    response.headers['X-Revision'] = str(revision)
+    response.headers['X-Epoch'] = epoch
+    return response
 
 @app.route('/nodes/<path:tag>', methods=['GET'])
 def get_node(tag):
     # Convert back to original tag format
     tag = tag.replace('|', '/')
-    node = node_manager.get_node(tag)
-    return jsonify(node) if node else ('Node not found', 404)
+    body, gzipped = node_manager.node_body(tag, accepts_gzip())
+    return cached_json(body, gzipped) if body is not None else ('Node not found', 404)
+
+@app.route('/nodes/<path:tag>/subtree', methods=['GET'])
+def get_subtree(tag):
+    """A branch of the network: the node and its descendants, at most depth=<n> levels deep."""
+    tag = tag.replace('|', '/')
+    depth = request.args.get('depth', type=int)
+    if depth is not None and depth < 0:
+        return jsonify({'error': 'depth must be zero or positive'}), 400
+    subtree = node_manager.get_subtree(tag, depth)
+    return jsonify(subtree) if subtree is not None else ('Node not found', 404)
+
+@app.route('/nodes/<path:tag>/ancestors', methods=['GET'])
+def get_ancestors(tag):
+    tag = tag.replace('|', '/')
+    ancestors = node_manager.get_ancestors(tag)
+    return jsonify(ancestors) if ancestors is not None else ('Node not found', 404)
+
+@app.route('/nodes/<path:tag>', methods=['DELETE'])
+def delete_node(tag):
+    tag = tag.replace('|', '/')
+    deleted = node_manager.delete_node(tag)
+    if isinstance(deleted, dict):
+        return jsonify(deleted), 404
+    return jsonify({'deleted': deleted, 'revision': node_manager.revision})
 
 @app.route('/nodes/children/<path:tag>', methods=['POST'])
 def add_children(tag):
@@ -85,7 +849,214 @@ def add_children(tag):
     data = request.json
     count = data.get('count', 6)
     new_nodes = node_manager.add_child_nodes(tag, count)
+    if isinstance(new_nodes, dict):
+        return jsonify(new_nodes), 400
     return jsonify(new_nodes)
 
+@app.route('/nodes/batch', methods=['POST'])
+def add_nodes_batch():
+    """
+    Create many nodes in one request. Accepts one of:
+      {"nodes": [{"tag", "position": [x, y], "parent", "layer"?, "polyOrder"?, "name"?}, ...]}
+      {"expand": [{"parent": tag, "count": n}, ...]}  (or [[tag, n], ...])
+      {"columns": {"tag": [...], "x": [...], "y": [...], "parent": [...], ...}}
+    The batch is applied atomically. Created nodes are returned as a list, or
+    as columns when the request used the compact columns format.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        if 'columns' in data:
+            created = node_manager.add_nodes(data['columns'], as_nodes=True)
+        elif 'nodes' in data:
+            nodes = data['nodes']
+            columns = {
+                'tag': [node.get('tag') for node in nodes],
+                'parent': [node.get('parent') for node in nodes],
+                'layer': [node.get('layer') for node in nodes],
+                'polyOrder': [node.get('polyOrder', 6) for node in nodes],
+                'name': [node.get('name') for node in nodes],
+            }
+            if any('position' in node for node in nodes):
+                columns['x'] = [node.get('position', [0, 0])[0] for node in nodes]
+                columns['y'] = [node.get('position', [0, 0])[1] for node in nodes]
+            created = node_manager.add_nodes(columns, as_nodes=True)
+        elif 'expand' in data:
+            expansions = [(item['parent'], item.get('count', 6)) if isinstance(item, dict) else tuple(item)
+                          for item in data['expand']]
+            created = node_manager.expand_nodes(expansions, as_nodes=True)
+        else:
+            return jsonify({'error': "Expected 'nodes', 'expand' or 'columns'"}), 400
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"Malformed batch: {e}"}), 400
+    if isinstance(created, dict):
+        return jsonify(created), 400
+
+    if 'columns' in data:
+        return jsonify({'columns': {
+            'tag': [node['tag'] for node in created],
+            'x': [node['position'][0] for node in created],
+            'y': [node['position'][1] for node in created],
+            'layer': [node['layer'] for node in created],
+            'polyOrder': [node['polyOrder'] for node in created],
+            'parent': [node['parent'] for node in created],
+            'name': [node['name'] for node in created],
+        }})
+    return jsonify(created)
+
+FEED_KEEPALIVE = 15  # Seconds between comments on an idle /events stream
+FEED_RETRY_MS = 2000  # Reconnect delay suggested to EventSource clients
+
+def sse_event(event_id, name, data):
+    return b'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, name.encode('ascii'), data)
+
+@app.route('/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events stream of mutations. Resumes after the Last-Event-ID
+    header (sent by EventSource when it reconnects) or since=<rev>, and
+    otherwise starts with the next mutation. A client that passes the epoch=
+    its revision came from gets an immediate resync if the server has
+    restarted since. Events:
+      change   {"revision", "nodes", "deleted"} for one revision, as /nodes?since
+      resync   events were missed; fetch /nodes?since=<last applied revision>
+    """
+    feed = node_manager.feed
+    after = request.headers.get('Last-Event-ID', type=int)
+    if after is None:
+        after = request.args.get('since', feed.last_id, type=int)
+    stale = request.args.get('epoch', node_manager.epoch) != node_manager.epoch
+    if not feed.subscribe():
+        response = jsonify({'error': 'Too many open event streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(FEED_RETRY_MS // 1000)
+        return response
+
+    def generate():
+        cursor = after
+        yield b'retry: %d\n\n' % FEED_RETRY_MS
+        if stale:
+            cursor = feed.last_id
+            yield sse_event(cursor, 'resync', encode_json({'revision': cursor}))
+        while True:
+            events = feed.read(cursor, FEED_KEEPALIVE)
+            if events is None:
+                cursor = feed.last_id
+                yield sse_event(cursor, 'resync', encode_json({'revision': cursor}))
+            elif events:
+                cursor = events[-1][0]
+                yield b''.join(sse_event(*event) for event in events)
+            else:
+                yield b': keep-alive\n\n'
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.call_on_close(feed.unsubscribe)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    """Response cache occupancy and hit rate."""
+    return jsonify(node_manager.cache.stats())
+
+EXPORT_FORMATS = {
+    'csv': (network_io.iter_csv, 'text/csv', 'network.csv'),
+    'npy': (network_io.iter_table, 'application/octet-stream', 'network.npy'),
+}
+
+@app.route('/export', methods=['GET'])
+def export_network():
+    """Stream the whole network as CSV (format=csv, default) or as a binary .npy node table (format=npy)."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format '{fmt}'"}), 400
+    generate, mimetype, filename = EXPORT_FORMATS[fmt]
+    chunks = node_manager.locked_chunks(generate(node_manager.nodes))
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['X-Revision'] = str(node_manager.revision)
+    return response
+
+@app.route('/import', methods=['POST'])
+def import_network():
+    """
+    Replace the network with an uploaded export (request body in the format
+    given by format=csv|npy). The body is parsed in chunks as it streams in.
+    """
+    fmt = request.args.get('format', 'csv')
+    try:
+        if fmt == 'csv':
+            store = network_io.import_csv(io.TextIOWrapper(request.stream, encoding='utf-8', newline=''))
+        elif fmt == 'npy':
+            store = network_io.import_table(request.stream)
+        else:
+            return jsonify({'error': f"Unknown format '{fmt}'"}), 400
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"Malformed import: {e}"}), 400
+    count = node_manager.replace_nodes(store)
+    return jsonify({'imported': count, 'revision': node_manager.revision})
+
+def serve(host, port, threads):
+    """Serve app with waitress if available, else with werkzeug's threaded WSGI server."""
+    try:
+        import waitress
+    except ImportError:
+        waitress = None
+    if waitress is not None:
+        waitress.serve(app, host=host, port=port, threads=threads)
+        return
+    from werkzeug.serving import make_server
+    logger.info("waitress not installed; serving with werkzeug's threaded server on http://%s:%d", host, port)
+    make_server(host, port, app, threaded=True).serve_forever()
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="VSM network server")
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--data-dir', help="persist the network in this directory "
+                                            "(snapshot + mutation log); in-memory if omitted")
+    parser.add_argument('--snapshot-every', type=int, default=10000,
+                        help="mutations between automatic snapshots")
+    parser.add_argument('--cache-mb', type=int, default=64,
+                        help="memory budget of the serialized response cache")
+    parser.add_argument('--gzip', action='store_true',
+                        help="also cache gzip-compressed responses for clients that accept them")
+    parser.add_argument('--deletion-retention', type=int, default=100000,
+                        help="revisions for which deletions are kept for ?since clients")
+    parser.add_argument('--layout', action='store_true',
+                        help="place nodes created without coordinates with the overlap-free layout engine")
+    parser.add_argument('--feed-events', type=int, default=4096,
+                        help="mutation events kept for /events clients to resume from")
+    parser.add_argument('--feed-clients', type=int, default=8,
+                        help="open /events streams allowed at once; each holds a server thread")
+    parser.add_argument('--metrics', action='store_true',
+                        help="record request and NodeManager timing histograms for /metrics")
+    parser.add_argument('--production', action='store_true',
+                        help="serve with a multi-threaded WSGI server instead of the debug server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--threads', type=int, default=16,
+                        help="worker threads in production mode")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    if args.metrics:
+        metrics.enable()
+    cache = ResponseCache(args.cache_mb * 1024 * 1024, compress=args.gzip)
+    feed = ChangeFeed(args.feed_events, max_subscribers=args.feed_clients)
+    if args.data_dir:
+        node_manager = NodeManager(Persistence(args.data_dir, snapshot_every=args.snapshot_every), cache,
+                                   layout=args.layout, feed=feed,
+                                   deletion_retention=args.deletion_retention)
+        atexit.register(node_manager.close)
+    else:
+        node_manager.cache = cache
+        node_manager.use_feed(feed)
+        node_manager.deleted.retention = args.deletion_retention
+        if args.layout:
+            node_manager.layout = Layout(node_manager.nodes)
+    if args.production:
+        serve(args.host, args.port, args.threads)
+    else:
+        app.run(debug=True, host=args.host, port=args.port, use_reloader=not args.data_dir) 
\ No newline at end of file
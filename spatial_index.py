@@ -0,0 +1,178 @@
+"""
+spatial_index.py
+
+Incremental point quadtree over node positions, the Python counterpart of
+js/QuadTree.js. Used for nearest-node lookups, radius queries and box queries
+without scanning every node in the network.
+"""
+
+import heapq
+import math
+
+# -----------------------------------------------------------------------------
+# QUADTREE CELLS
+# -----------------------------------------------------------------------------
+
+MIN_CELL_SIZE = 1e-9  # Stop subdividing below this width (coincident points)
+
+
+class QuadCell:
+    __slots__ = ('x0', 'y0', 'x1', 'y1', 'points', 'children')
+
+    def __init__(self, x0, y0, x1, y1):
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.points = {}  # key -> (x, y), only used while the cell is a leaf
+        self.children = None
+
+    def contains(self, x, y):
+        return self.x0 <= x <= self.x1 and self.y0 <= y <= self.y1
+
+    def child_for(self, x, y):
+        mx = (self.x0 + self.x1) / 2
+        my = (self.y0 + self.y1) / 2
+        return self.children[(x >= mx) + 2 * (y >= my)]
+
+    def subdivide(self):
+        mx = (self.x0 + self.x1) / 2
+        my = (self.y0 + self.y1) / 2
+        self.children = [QuadCell(self.x0, self.y0, mx, my),   # south-west
+                         QuadCell(mx, self.y0, self.x1, my),   # south-east
+                         QuadCell(self.x0, my, mx, self.y1),   # north-west
+                         QuadCell(mx, my, self.x1, self.y1)]   # north-east
+        points, self.points = self.points, {}
+        for key, (x, y) in points.items():
+            self.child_for(x, y).points[key] = (x, y)
+
+    def min_dist_sq(self, x, y):
+        dx = max(self.x0 - x, 0.0, x - self.x1)
+        dy = max(self.y0 - y, 0.0, y - self.y1)
+        return dx * dx + dy * dy
+
+    def intersects_box(self, x0, y0, x1, y1):
+        return not (x1 < self.x0 or x0 > self.x1 or y1 < self.y0 or y0 > self.y1)
+
+# -----------------------------------------------------------------------------
+# SPATIAL INDEX
+# -----------------------------------------------------------------------------
+
+class SpatialIndex:
+    """
+    Quadtree keyed by node tag. The root grows to cover points inserted outside
+    its bounds, so the index never needs to know the network extent up front.
+    Growing leaves existing points where they are, even when the new root would
+    route them to a sibling (a point on the old root's max edge), so removal
+    goes through self.cells rather than by routing.
+    """
+
+    def __init__(self, bounds=(-2.0, -2.0, 2.0, 2.0), capacity=16):
+        self.capacity = capacity
+        self.root = QuadCell(*bounds)
+        self.positions = {}  # key -> (x, y)
+        self.cells = {}      # key -> leaf cell holding it
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def clear(self):
+        r = self.root
+        self.root = QuadCell(r.x0, r.y0, r.x1, r.y1)
+        self.positions = {}
+        self.cells = {}
+
+    def grow_to(self, x, y):
+        if not (math.isfinite(x) and math.isfinite(y)):
+            raise ValueError(f"Cannot index non-finite position ({x}, {y})")
+        while not self.root.contains(x, y):
+            old = self.root
+            w, h = old.x1 - old.x0, old.y1 - old.y0
+            x0 = old.x0 - w if x < old.x0 else old.x0
+            y0 = old.y0 - h if y < old.y0 else old.y0
+            root = QuadCell(x0, y0, x0 + 2 * w, y0 + 2 * h)
+            root.children = [QuadCell(x0, y0, x0 + w, y0 + h),
+                             QuadCell(x0 + w, y0, x0 + 2 * w, y0 + h),
+                             QuadCell(x0, y0 + h, x0 + w, y0 + 2 * h),
+                             QuadCell(x0 + w, y0 + h, x0 + 2 * w, y0 + 2 * h)]
+            root.children[(old.x0 > x0) + 2 * (old.y0 > y0)] = old
+            self.root = root
+
+    def insert(self, key, x, y):
+        x, y = float(x), float(y)
+        self.grow_to(x, y)  # Raises ValueError before the old position is dropped
+        if key in self.positions:
+            self.remove(key)
+        cell = self.root
+        while cell.children is not None:
+            cell = cell.child_for(x, y)
+        cell.points[key] = (x, y)
+        self.positions[key] = (x, y)
+        self.cells[key] = cell
+        while len(cell.points) > self.capacity and cell.x1 - cell.x0 > MIN_CELL_SIZE:
+            cell.subdivide()
+            for child in cell.children:
+                for moved in child.points:
+                    self.cells[moved] = child
+            cell = cell.child_for(x, y)
+
+    def remove(self, key):
+        if self.positions.pop(key, None) is None:
+            return False
+        del self.cells.pop(key).points[key]
+        return True
+
+    def nearest(self, x, y, max_distance=math.inf):
+        """Return (key, distance) of the closest point, or (None, inf) if none is in range."""
+        best_key, best_sq = None, max_distance * max_distance
+        heap = [(0.0, 0, self.root)]
+        counter = 1
+        while heap:
+            d_sq, _, cell = heapq.heappop(heap)
+            if d_sq > best_sq:
+                break
+            if cell.children is None:
+                for key, (px, py) in cell.points.items():
+                    p_sq = (px - x) ** 2 + (py - y) ** 2
+                    if p_sq <= best_sq:
+                        best_key, best_sq = key, p_sq
+                continue
+            for child in cell.children:
+                c_sq = child.min_dist_sq(x, y)
+                if c_sq <= best_sq:
+                    heapq.heappush(heap, (c_sq, counter, child))
+                    counter += 1
+        if best_key is None:
+            return None, math.inf
+        return best_key, math.sqrt(best_sq)
+
+    def query_radius(self, x, y, radius):
+        """Return the keys of all points within radius of (x, y)."""
+        r_sq = radius * radius
+        found = []
+        stack = [self.root]
+        while stack:
+            cell = stack.pop()
+            if cell.min_dist_sq(x, y) > r_sq:
+                continue
+            if cell.children is None:
+                found.extend(key for key, (px, py) in cell.points.items()
+                             if (px - x) ** 2 + (py - y) ** 2 <= r_sq)
+            else:
+                stack.extend(cell.children)
+        return found
+
+    def query_box(self, x0, y0, x1, y1):
+        """Return the keys of all points inside the axis-aligned box."""
+        found = []
+        stack = [self.root]
+        while stack:
+            cell = stack.pop()
+            if not cell.intersects_box(x0, y0, x1, y1):
+                continue
+            if cell.children is None:
+                found.extend(key for key, (px, py) in cell.points.items()
+                             if x0 <= px <= x1 and y0 <= py <= y1)
+            else:
+                stack.extend(cell.children)
+        return found
@@ -0,0 +1,49 @@
+"""ChangeFeed: resuming after an event id, resync when events are gone, bounds."""
+
+import threading
+
+from change_feed import ChangeFeed
+
+def filled(count, **kwargs):
+    feed = ChangeFeed(**kwargs)
+    for event_id in range(1, count + 1):
+        feed.publish(event_id, 'change', b'%d' % event_id)
+    return feed
+
+def test_read_resumes_after_an_id():
+    feed = filled(5)
+    assert [event[0] for event in feed.read(2)] == [3, 4, 5]
+    assert [event[0] for event in feed.read(0, limit=2)] == [1, 2]
+    assert feed.read(5, timeout=0) == []
+
+def test_read_waits_for_the_next_event():
+    feed = filled(1)
+    timer = threading.Timer(0.05, feed.publish, (2, 'change', b'2'))
+    timer.start()
+    assert feed.read(1, timeout=5) == [(2, 'change', b'2')]
+    timer.join()
+
+def test_events_dropped_from_the_ring_need_a_resync():
+    feed = filled(10, max_events=4)
+    assert feed.read(5) is None
+    assert [event[0] for event in feed.read(6)] == [7, 8, 9, 10]
+    assert feed.stats()['resyncs'] == 1
+
+def test_byte_bound_keeps_the_newest_event():
+    feed = ChangeFeed(max_bytes=4)
+    feed.publish(1, 'change', b'12345')
+    feed.publish(2, 'change', b'123456')
+    assert feed.read(1) == [(2, 'change', b'123456')]
+
+def test_revision_from_before_a_restart_needs_a_resync():
+    feed = filled(3)
+    assert feed.read(8, timeout=0) is None
+    feed.reset(20)
+    assert feed.read(3) is None
+    assert feed.read(20, timeout=0) == []
+
+def test_subscriber_slots():
+    feed = ChangeFeed(max_subscribers=1)
+    assert feed.subscribe() and not feed.subscribe()
+    feed.unsubscribe()
+    assert feed.subscribe()
@@ -0,0 +1,63 @@
+"""Layout engine: inserts keep sub-structures apart and move few rows."""
+
+import numpy as np
+import pytest
+
+from layout import Layout, node_radius
+from node_store import NodeStore
+import vsm_network
+
+def fractal_store(size, poly_order=6):
+    store = NodeStore(capacity=size)
+    store.add('0/0/1', (0, 0), 0, poly_order=poly_order)
+    frontier = np.array([0])
+    while store.size < size:
+        positions, _ = vsm_network.fractalise_objects(store.pos[frontier], store.layer[frontier], poly_order)
+        take = min(len(frontier) * poly_order, size - store.size)
+        parents = np.repeat(frontier, poly_order)[:take]
+        numbers = np.tile(np.arange(1, poly_order + 1), len(frontier))[:take]
+        tags = [f"{store.tags[p]}-{n}" for p, n in zip(parents.tolist(), numbers.tolist())]
+        frontier = store.add_many(tags, positions.reshape(-1, 2)[:take], store.layer[parents] + 1,
+                                  poly_order, parents, nodes=numbers)
+    return store
+
+def insert(store, layout, parent):
+    row = store.add(f"{store.tags[parent]}-x{store.size}", (0, 0), int(store.layer[parent]) + 1,
+                    parent=store.tags[parent], node=len(store.child_rows(parent)) + 1)
+    return np.setdiff1d(layout.place([row]), [row])
+
+def overlaps(store, layout):
+    """Sibling pairs whose bounding circles intersect, plus children covering their parent."""
+    live = store.live_rows()
+    kids = live[store.parent[live] >= 0]
+    parents = store.parent[kids]
+    count = int(np.sum(layout.distance[kids] + 1e-9 < layout.radius[kids] + node_radius(store.layer[parents])))
+    for parent in np.unique(parents).tolist():
+        ring = kids[parents == parent]
+        gaps = np.linalg.norm(store.pos[ring][:, None] - store.pos[ring][None], axis=2)
+        np.fill_diagonal(gaps, np.inf)
+        count += int(np.sum(gaps + 1e-9 < layout.radius[ring][:, None] + layout.radius[ring][None])) // 2
+    return count
+
+@pytest.mark.parametrize('deepest', [False, True])
+def test_inserts_after_relayout_stay_apart_and_local(deepest):
+    store = fractal_store(5000)
+    layout = Layout(store)
+    layout.relayout()
+    rng = np.random.default_rng(0)
+    live = store.live_rows()
+    if deepest:
+        live = live[store.layer[live] == store.layer[live].max()]
+    moved = [len(insert(store, layout, parent)) for parent in rng.choice(live, 40).tolist()]
+    assert overlaps(store, layout) == 0
+    assert np.median(moved) < 0.05 * store.size
+    assert np.mean(moved) < 0.1 * store.size
+
+def test_inserts_into_adopted_network_move_a_few_siblings():
+    store = fractal_store(5000)
+    layout = Layout(store)
+    layout.adopt()
+    rng = np.random.default_rng(0)
+    for parent in rng.choice(store.live_rows(), 40).tolist():
+        moved = insert(store, layout, parent)
+        assert len(moved) <= 12
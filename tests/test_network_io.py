@@ -0,0 +1,92 @@
+"""Import validation: parent links must form a forest before a store is swapped in."""
+
+import io
+from itertools import islice
+
+import numpy as np
+import pytest
+
+import network_io
+from node_store import NodeStore
+import server
+
+def sample_store():
+    store = NodeStore()
+    store.add('0/0/1', (0, 0), 0)
+    store.add('0/0/1-1', (1, 0), 1, parent='0/0/1')
+    store.add('0/0/1-1-1', (2, 0), 2, parent='0/0/1-1')
+    return store
+
+def table_bytes(store, parents=None):
+    data = b''.join(network_io.iter_table(store))
+    records = np.load(io.BytesIO(data))
+    if parents is not None:
+        records['parent'] = parents
+    buffer = io.BytesIO()
+    np.save(buffer, records)
+    return buffer.getvalue()
+
+def test_table_round_trip():
+    store = network_io.import_table(io.BytesIO(table_bytes(sample_store())))
+    assert store.ancestor_rows(store.row('0/0/1-1-1')) == [store.row('0/0/1'), store.row('0/0/1-1')]
+
+@pytest.mark.parametrize('parents, message', [
+    ([-1, 0, 7], 'outside the table'),
+    ([-1, 1, 1], 'its own parent'),
+    ([-1, 2, 1], 'form a cycle'),
+    ([1, 2, 0], 'form a cycle'),
+])
+def test_table_rejects_bad_parents(parents, message):
+    with pytest.raises(ValueError, match=message):
+        network_io.import_table(io.BytesIO(table_bytes(sample_store(), parents)))
+
+def test_csv_rejects_unknown_parent():
+    text = ''.join(network_io.iter_csv(sample_store())).replace(',0/0/1-1,', ',0/0/9,')
+    with pytest.raises(ValueError, match='0/0/9'):
+        network_io.import_csv(io.StringIO(text, newline=''))
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf'])
+def test_csv_rejects_non_finite_positions(value):
+    text = ''.join(network_io.iter_csv(sample_store())).replace('0/0/1-1,1.0,', f'0/0/1-1,{value},')
+    with pytest.raises(ValueError, match='0/0/1-1 has a non-finite position'):
+        network_io.import_csv(io.StringIO(text, newline=''))
+
+def test_import_route_rejects_non_finite_positions():
+    store = sample_store()
+    store.pos[store.row('0/0/1-1-1'), 1] = np.inf
+    before = server.node_manager.revision, len(server.node_manager.nodes)
+    response = server.app.test_client().post('/import?format=npy', data=table_bytes(store))
+    assert response.status_code == 400
+    assert 'non-finite' in response.json['error']
+    assert (server.node_manager.revision, len(server.node_manager.nodes)) == before
+
+def test_import_route_keeps_network_on_cycle():
+    before = server.node_manager.revision, len(server.node_manager.nodes)
+    response = server.app.test_client().post('/import?format=npy',
+                                             data=table_bytes(sample_store(), [-1, 2, 1]))
+    assert response.status_code == 400
+    assert (server.node_manager.revision, len(server.node_manager.nodes)) == before
+
+@pytest.mark.parametrize('export, load', [
+    (network_io.iter_csv, lambda data: network_io.import_csv(io.StringIO(''.join(data), newline=''))),
+    (network_io.iter_table, lambda data: network_io.import_table(io.BytesIO(b''.join(data)))),
+])
+def test_export_skips_nodes_deleted_mid_stream(export, load):
+    store = sample_store()
+    stream = export(store, chunk_size=1)
+    data = list(islice(stream, 2 if export is network_io.iter_table else 1))  # Up to the root's row
+    store.remove_subtree('0/0/1-1')
+    data.extend(stream)
+    assert list(load(data)) == ['0/0/1']
+
+def test_iter_nodes_reads_the_store_it_started_on():
+    manager = server.NodeManager(layout=False)
+    manager.add_child_nodes('0/0/1', 3)
+    stream = manager.iter_nodes(chunk_size=1)
+    first = next(stream)
+    manager.delete_node('0/0/1-2')
+    manager.replace_nodes(sample_store())
+    rest = [node for _, node in stream]
+    assert first[1]['tag'] == '0/0/1'
+    assert [node['tag'] for node in rest] == ['0/0/1-1', '0/0/1-3']
+    assert rest[0]['parent'] == '0/0/1'
@@ -0,0 +1,82 @@
+"""NodeStore structural queries and operations on a small hand-built tree."""
+
+import numpy as np
+import pytest
+
+from node_store import NodeStore
+
+def tree():
+    """0/0/1 with children -1 and -2; -1 has -1-1 and -1-2; -1-2 has -1-2-1."""
+    store = NodeStore()
+    store.add('0/0/1', (0, 0), 0)
+    for tag, parent, number in [('0/0/1-1', '0/0/1', 1), ('0/0/1-2', '0/0/1', 2),
+                                ('0/0/1-1-1', '0/0/1-1', 1), ('0/0/1-1-2', '0/0/1-1', 2),
+                                ('0/0/1-1-2-1', '0/0/1-1-2', 1)]:
+        store.add(tag, (number, 0), store.layer[store.row(parent)] + 1, parent=parent, node=number)
+    return store
+
+def tags(store, rows):
+    return [store.tags[row] for row in np.asarray(rows).tolist()]
+
+def test_subtree_levels_by_depth():
+    store = tree()
+    levels = store.subtree_levels(store.row('0/0/1'))
+    assert [tags(store, level) for level in levels] == [
+        ['0/0/1'], ['0/0/1-1', '0/0/1-2'], ['0/0/1-1-1', '0/0/1-1-2'], ['0/0/1-1-2-1']]
+    assert len(store.subtree_levels(store.row('0/0/1'), depth=1)) == 2
+    assert tags(store, store.descendant_rows(store.row('0/0/1-1'))) == ['0/0/1-1-1', '0/0/1-1-2', '0/0/1-1-2-1']
+    assert store.subtree_size(store.row('0/0/1-1')) == 4
+
+def test_ancestor_and_sibling_rows():
+    store = tree()
+    assert tags(store, store.ancestor_rows(store.row('0/0/1-1-2-1'))) == ['0/0/1', '0/0/1-1', '0/0/1-1-2']
+    assert store.ancestor_rows(store.row('0/0/1')) == []
+    assert tags(store, store.sibling_rows(store.row('0/0/1-1-1'))) == ['0/0/1-1-2']
+    assert store.sibling_rows(store.row('0/0/1')) == []
+
+def test_move_subtree_rewrites_tags_and_layers():
+    store = tree()
+    row = store.row('0/0/1-1-2')
+    levels = store.move_subtree('0/0/1-1-2', '0/0/1-2')
+    assert tags(store, np.concatenate(levels)) == ['0/0/1-2-1', '0/0/1-2-1-1']
+    assert store.row('0/0/1-2-1') == row and '0/0/1-1-2' not in store
+    assert store.names[row] == '0/0/1-2-1'  # A name mirroring the tag follows it
+    assert store.layer[store.row('0/0/1-2-1-1')] == 3
+    assert store.node_number[row] == 1
+    assert tags(store, store.child_rows(store.row('0/0/1-1'))) == ['0/0/1-1-1']
+    assert tags(store, store.child_rows(store.row('0/0/1-2'))) == ['0/0/1-2-1']
+
+def test_move_subtree_takes_the_next_free_number():
+    store = tree()
+    store.move_subtree('0/0/1-1-1', '0/0/1')
+    assert tags(store, store.child_rows(store.row('0/0/1'))) == ['0/0/1-1', '0/0/1-2', '0/0/1-3']
+    assert store.layer[store.row('0/0/1-3')] == 1
+
+@pytest.mark.parametrize('tag, new_parent', [('0/0/1-1', '0/0/1-1'), ('0/0/1-1', '0/0/1-1-2-1')])
+def test_move_subtree_under_itself_is_rejected(tag, new_parent):
+    store = tree()
+    with pytest.raises(ValueError, match='own sub-structure'):
+        store.move_subtree(tag, new_parent)
+    assert tags(store, store.subtree_rows(store.row('0/0/1-1'))) == [
+        '0/0/1-1', '0/0/1-1-1', '0/0/1-1-2', '0/0/1-1-2-1']
+
+def test_remove_subtree_tombstones_and_unlinks():
+    store = tree()
+    removed = store.remove_subtree('0/0/1-1')
+    assert tags(store, removed) == ['0/0/1-1', '0/0/1-1-1', '0/0/1-1-2', '0/0/1-1-2-1']
+    assert list(store) == ['0/0/1', '0/0/1-2']
+    assert store.tombstones == 4 and not store.alive[removed].any()
+    assert tags(store, store.child_rows(store.row('0/0/1'))) == ['0/0/1-2']
+
+def test_compact_renumbers_rows_and_links():
+    store = tree()
+    store.remove_subtree('0/0/1-1-1')
+    store.remove('0/0/1-2')
+    assert store.maybe_compact(ratio=0.5) is None
+    remap = store.maybe_compact()
+    assert remap.tolist() == [0, 1, -1, -1, 2, 3]
+    assert store.size == 4 and store.tombstones == 0
+    assert [store.row(tag) for tag in store] == [0, 1, 2, 3]
+    assert store.parent[:4].tolist() == [-1, 0, 1, 2]
+    assert tags(store, store.subtree_rows(0)) == ['0/0/1', '0/0/1-1', '0/0/1-1-2', '0/0/1-1-2-1']
+    assert not store.alive[4:6].any()
@@ -0,0 +1,159 @@
+"""
+Restarting a NodeManager from its data directory: snapshot plus log replay,
+a crash in the middle of a snapshot swap, and snapshots taken while request
+threads keep mutating.
+"""
+
+import os
+import shutil
+import threading
+
+import pytest
+
+from node_store import NodeStore
+from persistence import Persistence
+from server import NodeManager
+
+def open_manager(data_dir, snapshot_every=10000):
+    return NodeManager(Persistence(str(data_dir), snapshot_every), layout=False)
+
+def state(manager):
+    return manager.revision, manager.get_all_nodes()
+
+def take_snapshot(manager):
+    with manager.lock.write():
+        manager.snapshot()
+    manager.persistence.wait_for_snapshot()
+
+def test_snapshot_plus_log_replay(tmp_path):
+    manager = open_manager(tmp_path)
+    manager.add_child_nodes('0/0/1', 3)
+    manager.add_nodes({'tag': ['x'], 'x': [1.5], 'y': [-2.0], 'parent': ['0/0/1-1'], 'name': ['X']})
+    take_snapshot(manager)
+    manager.add_child_nodes('0/0/1-2', 2)
+    manager.delete_node('0/0/1-1')
+    expected, changes = state(manager), manager.changes_since(2)
+    manager.close()
+
+    reopened = open_manager(tmp_path)
+    assert state(reopened) == expected
+    assert reopened.changes_since(2) == changes
+    assert sorted(changes['deleted']) == ['0/0/1-1', 'x']
+    reopened.close()
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_crash_between_snapshot_renames(tmp_path, monkeypatch):
+    manager = open_manager(tmp_path)
+    manager.add_child_nodes('0/0/1', 3)
+    take_snapshot(manager)
+    manager.add_child_nodes('0/0/1-1', 2)
+    expected = state(manager)
+
+    replace = os.replace
+
+    def crash_before_new_snapshot(src, dst):
+        if src.endswith('snapshot.tmp'):
+            raise OSError("simulated crash")
+        replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', crash_before_new_snapshot)
+    take_snapshot(manager)
+    monkeypatch.undo()
+    manager.close()
+    assert not os.path.exists(tmp_path / 'snapshot')
+    assert os.path.exists(tmp_path / 'snapshot.old' / 'meta.json')
+
+    reopened = open_manager(tmp_path)
+    assert state(reopened) == expected
+    reopened.add_child_nodes('0/0/1-3', 1)
+    take_snapshot(reopened)
+    expected = state(reopened)
+    reopened.close()
+    assert not os.path.exists(tmp_path / 'snapshot.old')
+
+    assert state(open_manager(tmp_path)) == expected
+
+def test_snapshot_over_stale_old_snapshot(tmp_path):
+    manager = open_manager(tmp_path)
+    take_snapshot(manager)
+    shutil.copytree(tmp_path / 'snapshot', tmp_path / 'snapshot.old')  # Crash before the cleanup
+    manager.add_child_nodes('0/0/1', 2)
+    take_snapshot(manager)
+    expected = state(manager)
+    manager.close()
+    assert not os.path.exists(tmp_path / 'snapshot.old')
+    assert state(open_manager(tmp_path)) == expected
+
+def test_writes_after_torn_log_tail_survive_restart(tmp_path):
+    manager = open_manager(tmp_path)
+    manager.add_child_nodes('0/0/1', 2)
+    manager.close()
+    with open(tmp_path / 'mutations.log', 'a') as f:
+        f.write('{"rev":99,"op":')  # Crash in the middle of an append
+
+    reopened = open_manager(tmp_path)
+    reopened.add_child_nodes('0/0/1-1', 2)
+    reopened.add_child_nodes('0/0/1-2', 2)
+    expected = state(reopened)
+    reopened.close()
+
+    restarted = open_manager(tmp_path)
+    assert state(restarted) == expected
+    assert len(expected[1]) == 7
+    restarted.close()
+
+def test_snapshots_during_concurrent_writes(tmp_path):
+    manager = open_manager(tmp_path, snapshot_every=7)
+    manager.add_child_nodes('0/0/1', 4)
+
+    def write(parent):
+        for i in range(10):
+            manager.add_child_nodes(parent, 3)
+            manager.delete_node(f"{parent}-1")
+            parent = f"{parent}-2"
+
+    def read():
+        for _ in range(50):
+            listing = manager.get_all_nodes()
+            assert all(node['parent'] is None or node['parent'] in listing for node in listing.values())
+
+    threads = [threading.Thread(target=write, args=(f"0/0/1-{i}",)) for i in range(1, 5)]
+    threads.append(threading.Thread(target=read))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    expected = state(manager)
+    manager.close()
+
+    assert state(open_manager(tmp_path)) == expected
+
+def test_imports_racing_automatic_snapshots(tmp_path):
+    manager = open_manager(tmp_path, snapshot_every=2)
+    errors = []
+
+    def run(action):
+        try:
+            for _ in range(30):
+                action()
+        except Exception as e:  # Surface failures from worker threads
+            errors.append(e)
+
+    def import_network():
+        store = NodeStore()
+        store.add('0/0/1', (0, 0), 0)
+        manager.replace_nodes(store)
+
+    def expand():
+        manager.add_child_nodes('0/0/1', 2)
+        manager.delete_node('0/0/1-1')
+
+    threads = [threading.Thread(target=run, args=(action,)) for action in (import_network, expand, expand)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    expected = state(manager)
+    manager.close()
+    assert state(open_manager(tmp_path)) == expected
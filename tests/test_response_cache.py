@@ -0,0 +1,68 @@
+"""ResponseCache hits, LRU eviction at the byte budget, gzip variants, and the server's invalidation."""
+
+import gzip
+
+from response_cache import ResponseCache
+import server
+
+def builder(body):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return body
+    return build, calls
+
+def test_hit_after_miss_builds_once():
+    cache = ResponseCache()
+    build, calls = builder(b'{"a":1}')
+    assert cache.get('a', build) == (b'{"a":1}', False)
+    assert cache.get('a', build) == (b'{"a":1}', False)
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_eviction_at_the_byte_budget_drops_least_recently_used():
+    cache = ResponseCache(max_bytes=10)
+    cache.get('a', lambda: b'aaaa')
+    cache.get('b', lambda: b'bbbb')
+    cache.get('a', lambda: b'aaaa')  # b is now least recently used
+    cache.get('c', lambda: b'cccc')
+    assert set(cache.entries) == {('a', False), ('c', False)}
+    assert (cache.size, cache.evictions) == (8, 1)
+
+def test_oversized_bodies_are_served_uncached():
+    cache = ResponseCache(max_bytes=3)
+    assert cache.get('big', lambda: b'toolarge') == (b'toolarge', False)
+    assert cache.size == 0 and not cache.entries
+
+def test_gzip_variant_is_cached_and_invalidated_with_the_plain_body():
+    cache = ResponseCache(compress=True)
+    build, calls = builder(b'x' * 1000)
+    body, gzipped = cache.get('a', build, gzipped=True)
+    assert gzipped and gzip.decompress(body) == b'x' * 1000
+    assert cache.get('a', build) == (b'x' * 1000, False)
+    assert len(calls) == 1
+    cache.invalidate(['a'])
+    assert cache.size == 0
+    cache.get('a', build, gzipped=True)
+    assert len(calls) == 2
+
+def test_gzip_requests_get_plain_bodies_when_compression_is_off():
+    cache = ResponseCache()
+    assert cache.get('a', lambda: b'plain', gzipped=True) == (b'plain', False)
+
+def test_server_writes_invalidate_cached_node_and_listing():
+    manager = server.NodeManager(layout=False)
+    manager.node_body('0/0/1')
+    manager.listing_body()
+    hits = manager.cache.hits
+    manager.node_body('0/0/1')
+    assert manager.cache.hits == hits + 1
+    manager.add_child_nodes('0/0/1', 2)
+    body, _ = manager.node_body('0/0/1')
+    assert b'0/0/1-2' in body
+    _, body, _ = manager.listing_body()
+    assert b'0/0/1-2' in body
+    manager.delete_node('0/0/1-2')
+    assert b'0/0/1-2' not in manager.node_body('0/0/1')[0]
+    assert manager.node_body('0/0/1-2') == (None, False)
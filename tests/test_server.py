@@ -0,0 +1,223 @@
+"""HTTP endpoints against a fresh in-memory NodeManager: batch validation, paging and sync."""
+
+import pytest
+
+import server
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, 'node_manager', server.NodeManager(layout=False))
+    return server.app.test_client()
+
+@pytest.mark.parametrize('body', [
+    '{"nodes": [{"tag": "a", "parent": "0/0/1", "position": [NaN, 1]}]}',
+    '{"nodes": [{"tag": "a", "parent": "0/0/1", "position": [1, -Infinity]}]}',
+    '{"columns": {"tag": ["a"], "parent": ["0/0/1"], "x": [0], "y": [Infinity]}}',
+])
+def test_batch_rejects_non_finite_positions(client, body):
+    response = client.post('/nodes/batch', data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert 'non-finite' in response.json['error']
+    assert server.node_manager.revision == 1
+
+@pytest.mark.parametrize('expand', [
+    [['0/0/1', server.MAX_EXPAND_CHILDREN + 1]],
+    [['0/0/1', -1]],
+    [['0/0/1', 'six']],
+    [['0/0/1', server.MAX_EXPAND_CHILDREN]] + [[f"0/0/1-{i}", server.MAX_EXPAND_CHILDREN]
+                                                for i in range(1, server.MAX_EXPAND_NODES // server.MAX_EXPAND_CHILDREN + 1)],
+])
+def test_expand_rejects_oversized_counts(client, expand):
+    response = client.post('/nodes/batch', json={'expand': expand})
+    assert response.status_code == 400
+    assert len(server.node_manager.nodes) == 1
+
+def test_expand_merges_repeated_parents(client):
+    response = client.post('/nodes/batch', json={'expand': [['0/0/1', 2], ['0/0/1-1', 1], ['0/0/1', 3]]})
+    assert response.status_code == 200
+    assert [node['tag'] for node in response.json] == ['0/0/1-1', '0/0/1-2', '0/0/1-3', '0/0/1-1-1']
+
+def add_children(parent, count):
+    return server.node_manager.add_child_nodes(parent, count)
+
+def test_listing_pages_follow_next(client):
+    add_children('0/0/1', 6)
+    tags, cursor = [], 0
+    while cursor is not None:
+        page = client.get(f'/nodes?limit=4&cursor={cursor}').json
+        tags.extend(page['nodes'])
+        cursor = page['next']
+    assert tags == list(server.node_manager.get_all_nodes())
+    assert len(tags) == 7
+
+def test_listing_page_skips_deleted_nodes(client):
+    add_children('0/0/1', 3)
+    server.node_manager.delete_node('0/0/1-1')
+    page = client.get('/nodes?limit=10').json
+    assert list(page['nodes']) == ['0/0/1', '0/0/1-2', '0/0/1-3']
+    assert page['next'] is None
+
+def test_deletion_mid_page_does_not_end_the_listing(client, monkeypatch):
+    manager = server.node_manager
+    add_children('0/0/1', 6)
+    iter_rows = manager.iter_rows
+
+    def delete_then_iterate(store, rows, chunk_size=1000):
+        manager.delete_node('0/0/1-2')  # After the page's rows were chosen
+        return iter_rows(store, rows, chunk_size)
+
+    monkeypatch.setattr(manager, 'iter_rows', delete_then_iterate)
+    page = client.get('/nodes?limit=3').json
+    assert list(page['nodes']) == ['0/0/1', '0/0/1-1']
+    assert page['next'] == 3
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=-1', 'limit=2&cursor=-1'])
+def test_listing_rejects_bad_pages(client, query):
+    assert client.get(f'/nodes?{query}').status_code == 400
+
+def test_since_returns_changes_and_deletions(client):
+    add_children('0/0/1', 2)
+    revision = server.node_manager.revision
+    add_children('0/0/1-1', 1)
+    server.node_manager.delete_node('0/0/1-2')
+    changes = client.get(f'/nodes?since={revision}').json
+    assert changes['revision'] == server.node_manager.revision
+    assert sorted(changes['nodes']) == ['0/0/1', '0/0/1-1', '0/0/1-1-1']
+    assert changes['deleted'] == ['0/0/1-2']
+    assert client.get(f'/nodes?since={changes["revision"]}').json['nodes'] == {}
+
+def test_since_behind_the_deletion_horizon_asks_for_reload(client):
+    server.node_manager.deleted.retention = 1
+    add_children('0/0/1', 3)
+    server.node_manager.delete_node('0/0/1-1')
+    server.node_manager.delete_node('0/0/1-2')
+    response = client.get('/nodes?since=1')
+    assert response.status_code == 410
+    assert response.json['reload'] is True
+
+@pytest.mark.parametrize('query', ['since=999', 'since=0&epoch=earlier'])
+def test_since_from_another_server_process_asks_for_reload(client, query):
+    response = client.get(f'/nodes?{query}')
+    assert response.status_code == 410
+    assert response.json['reload'] is True
+
+def test_etag_from_before_a_restart_is_not_current(client, monkeypatch):
+    etag = client.get('/nodes').headers['ETag']
+    monkeypatch.setattr(server, 'node_manager', server.NodeManager(layout=False))
+    response = client.get('/nodes', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['X-Epoch'] == server.node_manager.epoch
+
+def test_etag_answers_304_until_the_network_changes(client):
+    response = client.get('/nodes')
+    etag = response.headers['ETag']
+    assert response.headers['X-Revision'] == str(server.node_manager.revision)
+    assert client.get('/nodes', headers={'If-None-Match': etag}).status_code == 304
+    add_children('0/0/1', 1)
+    response = client.get('/nodes', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_deletes_compact_the_store_without_disturbing_a_stream(client):
+    manager = server.node_manager
+    add_children('0/0/1', 8)
+    stream = manager.iter_nodes(chunk_size=1)
+    next(stream)
+    old_store = manager.nodes
+    for i in range(1, 4):
+        manager.delete_node(f'0/0/1-{i}')
+    assert manager.nodes is not old_store
+    assert (manager.nodes.size, manager.nodes.tombstones) == (6, 0)
+    manager.delete_node('0/0/1-4')
+    assert [node['tag'] for _, node in stream] == [f'0/0/1-{i}' for i in range(4, 9)]
+    assert list(client.get('/nodes?limit=10').json['nodes']) == ['0/0/1'] + [f'0/0/1-{i}' for i in range(5, 9)]
+    assert manager.get_node('0/0/1')['children'] == [f'0/0/1-{i}' for i in range(5, 9)]
+
+def open_events(client, query='', headers=None):
+    response = client.get(f'/events?{query}', headers=headers, buffered=False)
+    return response, iter(response.response)
+
+def read_event(stream):
+    """The next event's (id, name, data) from a /events stream, skipping comments."""
+    while True:
+        lines = dict(line.split(': ', 1) for line in next(stream).decode().strip().split('\n'))
+        if 'event' in lines:
+            return int(lines['id']), lines['event'], lines['data']
+
+def test_events_replay_changes_after_since(client):
+    add_children('0/0/1', 2)
+    add_children('0/0/1-1', 1)
+    response, stream = open_events(client, 'since=2')
+    assert response.mimetype == 'text/event-stream'
+    assert next(stream).startswith(b'retry:')
+    event_id, name, data = read_event(stream)
+    assert (event_id, name) == (3, 'change')
+    assert '0/0/1-1-1' in data
+    response.close()
+    assert server.node_manager.feed.subscribers == 0
+
+def test_events_resume_from_last_event_id(client):
+    add_children('0/0/1', 1)
+    add_children('0/0/1', 2)
+    response, stream = open_events(client, 'since=1', headers={'Last-Event-ID': '2'})
+    next(stream)
+    assert read_event(stream)[0] == 3
+    response.close()
+
+@pytest.mark.parametrize('query', ['since=50', 'since=1&epoch=earlier'])
+def test_events_from_another_server_process_resync(client, query):
+    add_children('0/0/1', 1)
+    response, stream = open_events(client, query)
+    next(stream)
+    assert read_event(stream)[:2] == (server.node_manager.revision, 'resync')
+    response.close()
+
+def test_events_refuse_subscribers_over_the_limit(client):
+    feed = server.node_manager.feed
+    feed.max_subscribers = feed.subscribers
+    response = client.get('/events')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+
+def test_subtree_is_breadth_first_and_depth_limited(client):
+    add_children('0/0/1', 2)
+    add_children('0/0/1-1', 2)
+    add_children('0/0/1-1-2', 1)
+    tags = [node['tag'] for node in client.get('/nodes/0|0|1-1/subtree').json['nodes']]
+    assert tags == ['0/0/1-1', '0/0/1-1-1', '0/0/1-1-2', '0/0/1-1-2-1']
+    response = client.get('/nodes/0|0|1/subtree?depth=1').json
+    assert [node['tag'] for node in response['nodes']] == ['0/0/1', '0/0/1-1', '0/0/1-2']
+    assert response['nodes'][1]['children'] == ['0/0/1-1-1', '0/0/1-1-2']
+    assert response['revision'] == server.node_manager.revision
+    assert [node['tag'] for node in client.get('/nodes/0|0|1/subtree?depth=0').json['nodes']] == ['0/0/1']
+    assert client.get('/nodes/0|0|1/subtree?depth=-1').status_code == 400
+
+def test_ancestors_run_from_the_root_down(client):
+    add_children('0/0/1', 1)
+    add_children('0/0/1-1', 1)
+    add_children('0/0/1-1-1', 1)
+    nodes = client.get('/nodes/0|0|1-1-1-1/ancestors').json['nodes']
+    assert [node['tag'] for node in nodes] == ['0/0/1', '0/0/1-1', '0/0/1-1-1']
+    assert client.get('/nodes/0|0|1/ancestors').json['nodes'] == []
+
+@pytest.mark.parametrize('route', ['/nodes/0|0|9/subtree', '/nodes/0|0|9/ancestors'])
+def test_structure_queries_of_unknown_tags_are_404(client, route):
+    assert client.get(route).status_code == 404
+
+@pytest.mark.parametrize('body', [
+    {'columns': {'tag': ['a', 'b'], 'parent': ['0/0/1', 'a'], 'x': [1, 2], 'y': [0, 0]}},
+    {'nodes': [{'tag': 'a', 'parent': '0/0/1'}, {'tag': 'b', 'parent': 'a'}]},
+    {'expand': [['0/0/1', 2]]},
+])
+def test_batch_response_survives_a_concurrent_delete(client, monkeypatch, body):
+    manager = server.node_manager
+
+    def delete_before_responding(seq):
+        manager.__dict__.pop('wait_durable')  # Once; delete_node waits too
+        manager.delete_node(manager.child_tags('0/0/1')[0])
+
+    monkeypatch.setattr(manager, 'wait_durable', delete_before_responding)
+    response = client.post('/nodes/batch', json=body)
+    assert response.status_code == 200
+    created = response.json['columns']['tag'] if 'columns' in body else [node['tag'] for node in response.json]
+    assert len(created) == 2
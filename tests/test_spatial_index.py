@@ -0,0 +1,74 @@
+"""The quadtree against brute force, including points on cell edges and root growth."""
+
+import math
+import random
+
+import pytest
+
+from spatial_index import SpatialIndex
+
+def brute_nearest(points, x, y):
+    return min(math.dist(p, (x, y)) for p in points.values())
+
+def test_remove_point_on_old_root_edge_after_growth():
+    index = SpatialIndex()
+    index.insert('a', 2.0, 0)
+    index.insert('b', 5.0, 0)
+    assert index.remove('a')
+    assert 'a' not in index and len(index) == 1
+    index.insert('a', 2.0, 0)
+    index.insert('a', 2.0, 1.0)  # Re-insert moves the point
+    assert index.query_box(2.0, 0, 2.0, 1.0) == ['a']
+    assert index.nearest(2.0, 0.9) == ('a', pytest.approx(0.1))
+
+@pytest.mark.parametrize('x, y', [(2.0, 9.0), (9.0, 2.0), (2.0, 2.0), (-9.0, -2.0)])
+def test_edge_points_survive_growth_in_every_direction(x, y):
+    index = SpatialIndex(capacity=2)
+    edge = {f'e{i}': (2.0, -2.0 + i) for i in range(5)}
+    edge.update({f'f{i}': (-2.0 + i, 2.0) for i in range(5)})
+    for key, pos in edge.items():
+        index.insert(key, *pos)
+    index.insert('far', x, y)
+    for key in edge:
+        assert index.remove(key)
+    assert list(index.query_box(-100, -100, 100, 100)) == ['far']
+
+def test_coincident_points_and_missing_keys():
+    index = SpatialIndex(capacity=2)
+    for i in range(10):
+        index.insert(i, 1.0, 1.0)
+    assert sorted(index.query_radius(1.0, 1.0, 0)) == list(range(10))
+    assert not index.remove('missing')
+    for i in range(10):
+        assert index.remove(i)
+    assert index.nearest(1.0, 1.0) == (None, math.inf)
+
+def test_queries_match_brute_force():
+    rng = random.Random(7)
+    index = SpatialIndex(capacity=4)
+    points = {}
+    for i in range(400):
+        # Integer grid coordinates put many points exactly on cell edges
+        pos = (float(rng.randint(-20, 20)), float(rng.randint(-20, 20)))
+        points[i] = pos
+        index.insert(i, *pos)
+    for i in rng.sample(range(400), 150):
+        assert index.remove(i)
+        del points[i]
+    for _ in range(50):
+        x, y = rng.uniform(-25, 25), rng.uniform(-25, 25)
+        key, distance = index.nearest(x, y)
+        assert distance == pytest.approx(brute_nearest(points, x, y))
+        assert math.dist(points[key], (x, y)) == pytest.approx(distance)
+        assert sorted(index.query_radius(x, y, 5)) == sorted(
+            k for k, p in points.items() if math.dist(p, (x, y)) <= 5)
+        assert sorted(index.query_box(x - 3, y - 3, x + 3, y + 3)) == sorted(
+            k for k, (px, py) in points.items() if abs(px - x) <= 3 and abs(py - y) <= 3)
+
+@pytest.mark.parametrize('x, y', [(math.nan, 0), (0, math.inf), (-math.inf, 1)])
+def test_non_finite_positions_are_rejected(x, y):
+    index = SpatialIndex()
+    index.insert('a', 1.0, 1.0)
+    with pytest.raises(ValueError, match='non-finite'):
+        index.insert('a', x, y)
+    assert index.nearest(1.0, 1.0) == ('a', 0.0)
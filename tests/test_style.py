@@ -0,0 +1,36 @@
+"""SubtreeRule membership on stores whose layers do not follow depth."""
+
+import numpy as np
+import pytest
+
+from node_store import NodeStore
+from style import Style, SubtreeRule
+
+def chain_store():
+    """0/0/1 -> a (layer 7) -> b (layer 2) -> c (layer 3), plus a sibling d of a."""
+    store = NodeStore()
+    store.add('0/0/1', (0, 0), 0)
+    store.add('a', (1, 0), 7, parent='0/0/1')
+    store.add('b', (2, 0), 2, parent='a')
+    store.add('c', (3, 0), 3, parent='b')
+    store.add('d', (0, 1), 1, parent='0/0/1')
+    return store
+
+@pytest.mark.parametrize('rows', [
+    [3],              # Few rows: climb to the ancestors
+    [0, 1, 2, 3, 4],  # Many rows: walk down from the roots
+])
+def test_members_ignore_layers(rows):
+    store = chain_store()
+    rule = SubtreeRule(['a'])
+    expected = [store.tags[row] in ('a', 'b', 'c') for row in rows]
+    assert rule.members(store, np.array(rows)).tolist() == expected
+
+def test_rule_restyles_only_the_sub_structure():
+    store = chain_store()
+    colors, sizes = Style([SubtreeRule(['b'], color='red', size_scale=2.0)]).apply(store, store.live_rows())
+    plain_colors, plain_sizes = Style().apply(store, store.live_rows())
+    changed = (sizes != plain_sizes).tolist()
+    assert changed == [False, False, True, True, False]
+    assert colors[2].tolist() == [1.0, 0.0, 0.0, 1.0]
+    assert (colors[[0, 1, 4]] == plain_colors[[0, 1, 4]]).all()
@@ -6,16 +6,45 @@ A VSM network visualization demonstrating dynamic visual scaling, color coding,
 and automatic view adjustment for any sized network. All node data is stored in memory.
 """
 
+import logging
+
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import tkinter as tk
 from tkinter import simpledialog, messagebox
-import csv
+
+from layout import Layout, get_edge_length
+import metrics
+import network_io
+from node_store import NodeStore
+from spatial_index import SpatialIndex
+from style import OrgUnitRule, Style, get_marker_size, get_node_color
 
 # -----------------------------------------------------------------------------
 # GLOBAL IN–MEMORY DATABASE
 # -----------------------------------------------------------------------------
-nodes_db = {}
+nodes_db = NodeStore()  # Columnar store; nodes_db[tag] still yields a dict-shaped view
+
+# Level of detail: sub-structures whose radius on screen is below LOD_PIXELS are
+# drawn as one aggregate marker. In either mode labels are hidden when more than
+# LABEL_LIMIT markers are visible.
+LOD_PIXELS = 24
+LABEL_LIMIT = 200
+
+# Nodes added while the view stays put are blitted over the last full draw, and
+# folded into it by one full redraw once additions pause for SETTLE_MS.
+SETTLE_MS = 500
+
+# Keys handled by VSMNetwork.on_key. Matplotlib binds several of them by default
+# (l: yscale, o: zoom, c: back, r: home, v: forward), so they are removed from
+# its keymaps when the figure is created.
+KEY_COMMANDS = ('a', 'e', 'r', 'l', 'm', 'o', 'c', 'escape', 'v')
+
+RENDER_SECONDS = metrics.REGISTRY.histogram(
+    'vsm_desktop_render_seconds', "Desktop render path timings, by operation", label='operation')
+
+logger = logging.getLogger(__name__)
 
 # -----------------------------------------------------------------------------
 # UTILITY FUNCTIONS: GEOMETRY, SCALING, AND COLORING
@@ -31,45 +60,66 @@ def turn(direction, angle_degrees):
                         [-np.sin(angle_radians), np.cos(angle_radians)]])
     return np.dot(direction, rot_mat)
 
-def generate_polygon(center, edge_length, poly_order):
+def polygon_unit_vertices(poly_order):
     angles = np.linspace(0, 2*np.pi, poly_order+1)  # Close the polygon
-    vertices = np.array([[center[0] + edge_length * np.cos(a),
-                          center[1] + edge_length * np.sin(a)] for a in angles])
-    return vertices
+    return np.column_stack([np.cos(angles), np.sin(angles)])
+
+def generate_polygon(center, edge_length, poly_order):
+    return np.asarray(center, dtype=float) + edge_length * polygon_unit_vertices(poly_order)
+
+def generate_polygons(centers, edge_lengths, poly_order):
+    """
+    Vectorised generate_polygon: one closed polygon per center, computed as a
+    single (parents x poly_order+1) broadcast. Returns an array of shape (P, poly_order+1, 2).
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 1, 2)
+    edge_lengths = np.asarray(edge_lengths, dtype=float).reshape(-1, 1, 1)
+    return centers + edge_lengths * polygon_unit_vertices(poly_order)
 
 def fractalise_object(parent_node, poly_order, edge_length):
     polygon = generate_polygon(parent_node['pos'], edge_length, poly_order)
     child_positions = polygon[:-1]  # Exclude duplicate closing vertex
     return child_positions, polygon
 
-def get_edge_length(layer):
-    """Decrease edge length with depth so that child nodes cluster closer to their parent."""
-    base_length = 1.0
-    return base_length / (layer + 2)
+def fractalise_objects(centers, layers, poly_order):
+    """Child positions (P, poly_order, 2) and polygons for a whole layer of parents."""
+    polygons = generate_polygons(centers, get_edge_length(np.asarray(layers)), poly_order)
+    return polygons[:, :-1], polygons
 
-def get_marker_size(layer):
-    """Decrease marker size for deeper layers."""
-    base_size = 500
-    size = base_size / (layer + 1)
-    return max(size, 50)
+def release_keys(keys):
+    """Remove keys from every Matplotlib default keymap (rcParams['keymap.*'])."""
+    for name in [name for name in plt.rcParams if name.startswith('keymap.')]:
+        plt.rcParams[name] = [key for key in plt.rcParams[name] if key not in keys]
 
-def get_node_color(layer):
+def place_levels(store, levels):
     """
-    Returns a color from a continuous colormap based on the recursion layer.
-    Here we use the 'viridis' colormap.
+    Recompute positions level by level (parents before children) from each
+    node's parent position and node number, i.e. where fractalise_object would
+    have put it. A ring has as many slots as the largest polygon order or node
+    number among its members (a moved-in node may be numbered past the
+    polygon), so each level must hold whole rings. Levels whose roots have no
+    parent keep their position.
     """
-    cmap = plt.get_cmap('viridis')
-    # Assume maximum expected depth is 10 for scaling purposes
-    fraction = min(layer / 10, 1.0)
-    return cmap(fraction)
+    for rows in levels:
+        parents = store.parent[rows]
+        placed = parents >= 0
+        rows, parents = rows[placed], parents[placed]
+        rings, members = np.unique(parents, return_inverse=True)
+        slots = np.zeros(len(rings), dtype=np.int64)
+        np.maximum.at(slots, members, np.maximum(store.poly_order[rows], store.node_number[rows]))
+        angles = 2*np.pi * (store.node_number[rows] - 1) / slots[members]
+        offsets = np.column_stack([np.cos(angles), np.sin(angles)])
+        edge_lengths = get_edge_length(store.layer[parents])[:, None]
+        store.pos[rows] = store.pos[parents] + edge_lengths * offsets
 
 # -----------------------------------------------------------------------------
 # VSMNetwork CLASS: VISUALIZATION AND INTERACTION
 # -----------------------------------------------------------------------------
 
 class VSMNetwork:
-    def __init__(self):
+    def __init__(self, nodes=None):
         plt.ion()  # Turn on interactive mode
+        release_keys(KEY_COMMANDS)
         self.fig, self.ax = plt.subplots(figsize=(10, 8))
         self.fig.canvas.manager.set_window_title("VSM Global – Dynamic Scaling & Auto-View")
         self.ax.set_facecolor('black')
@@ -79,60 +129,341 @@ class VSMNetwork:
         self.ax.set_ylim(-2, 2)
         self.ax.set_aspect('equal')
         
-        self.tk_root = tk.Tk()
-        self.tk_root.withdraw()
-        self.tk_root.wm_attributes('-topmost', 1)
+        self.tk_window = None  # Hidden Tk root, created on first use (see tk_root)
+        self.metrics_overlay = None  # Text artist of the metrics overlay while shown
+        self.metrics_timer = None
         
-        self.nodes = {}  # Local mapping: tag -> node dictionary
+        self.nodes = nodes if nodes is not None else nodes_db  # NodeStore: tag -> node view
         self.seed_tag = "0/0/1"
+        self.lod = True      # Level-of-detail rendering (toggle with 'l')
+        self.layout = None   # Overlap-free Layout while enabled (toggle with 'o'), else fractal polygons
+        self.style = Style()  # Node colors and sizes; color by org unit with 'c'
+        self.bounds = None   # Cached [min_x, min_y, max_x, max_y] of all nodes, None when stale
+        self.index = SpatialIndex()  # Quadtree over node positions
+        self.index_rows(self.nodes.live_rows())
+        self.init_layers()
+        self.init_overlays()
         self.create_seed_node()
         self.setup_event_handling()
+        metrics.REGISTRY.gauge('vsm_desktop_nodes', "Nodes in the network", lambda: len(self.nodes))
+        metrics.REGISTRY.gauge('vsm_desktop_markers', "Markers currently drawn", lambda: len(self.layer_rows))
+        metrics.REGISTRY.gauge('vsm_desktop_labels', "Labels currently drawn", lambda: len(self.labels))
         
+    @property
+    def tk_root(self):
+        """Hidden Tk root for menus and dialogs, so headless use never opens a Tk window."""
+        if self.tk_window is None:
+            self.tk_window = tk.Tk()
+            self.tk_window.withdraw()
+            self.tk_window.wm_attributes('-topmost', 1)
+        return self.tk_window
+
     def setup_event_handling(self):
         self.fig.canvas.mpl_connect('button_press_event', self.on_click)
         self.fig.canvas.mpl_connect('pick_event', self.on_pick)
         self.fig.canvas.mpl_connect('key_press_event', self.on_key)
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+        self.fig.canvas.mpl_connect('resize_event', lambda event: self.render_view())
+        self.ax.callbacks.connect('xlim_changed', lambda ax: self.render_view())
+        self.ax.callbacks.connect('ylim_changed', lambda ax: self.render_view())
         
     def create_seed_node(self):
         x, y = 0, 0
         tag = self.seed_tag
-        node = {
-            'tag': tag,
-            'pos': (x, y),
-            'layer': 0,
-            'shape': 0,
-            'node': 1,
-            'polyOrder': 6,  # Default: hexagon
-            'parent': None,
-            'orgUnit': 'n/a',
-            'name': tag
-        }
-        self.nodes[tag] = node
-        nodes_db[tag] = node
-        size = get_marker_size(0)
-        color = get_node_color(0)
-        scatter = self.ax.scatter(x, y, s=size, c=[color], picker=True)
-        node['artist'] = scatter
-        self.ax.text(x+0.01, y+0.05, tag, color='white', fontsize=12, picker=True)
+        if tag not in self.nodes:
+            row = self.nodes.add(tag, (x, y), 0,
+                                 poly_order=6,  # Default: hexagon
+                                 org_unit='n/a')
+            self.index_rows([row])
+        self.rebuild_layers()
         self.adjust_view()
         self.fig.canvas.draw()
-    
+
+    def index_rows(self, rows):
+        """Add store rows to the spatial index and grow the cached bounds."""
+        tags = self.nodes.tags
+        pos = self.nodes.pos[rows]
+        for row, (x, y) in zip(np.asarray(rows).tolist(), pos.tolist()):
+            self.index.insert(tags[row], x, y)
+        if self.bounds is not None and len(pos):
+            self.bounds[:2] = np.minimum(self.bounds[:2], pos.min(axis=0))
+            self.bounds[2:] = np.maximum(self.bounds[2:], pos.max(axis=0))
+
+    # -------------------------------------------------------------------------
+    # BATCHED RENDER LAYERS
+    # -------------------------------------------------------------------------
+
+    def init_layers(self):
+        """
+        Create the shared artists that hold the whole network: one PathCollection
+        for the nodes, one LineCollection each for parent-child edges and polygon
+        outlines, and a bounded tag -> Text mapping for the labels (see
+        sync_labels). Rows in the
+        node layer map to store rows through self.layer_rows, and back through
+        self.tag_rows.
+        """
+        self.layer_rows = np.empty(0, dtype=np.int64)  # Row in the node layer -> store row
+        self.tag_rows = {}   # Tag -> row in the node layer
+        self.offsets = np.empty((0, 2))
+        self.sizes = np.empty(0)
+        self.colors = np.empty((0, 4))
+        self.edges = np.empty((0, 2, 2))
+        self.outlines = []
+        self.labels = {}
+        self.extent = np.zeros(0)  # Store row -> radius of its sub-structure around it
+        self.root_rows = np.empty(0, dtype=np.int64)
+        self.view_key = None       # View the LOD layers were last rendered for
+        self.layers_stale = False  # Nodes were added since, and are shown staged (see stage)
+        self.node_layer = self.ax.scatter([], [], picker=True, zorder=3)
+        self.edge_layer = LineCollection([], colors='white', linewidths=2, zorder=1)
+        self.outline_layer = LineCollection([], colors='cyan', linewidths=2, zorder=2)
+        self.ax.add_collection(self.edge_layer, autolim=False)
+        self.ax.add_collection(self.outline_layer, autolim=False)
+
+    def make_label(self, tag, x, y):
+        if tag == self.seed_tag:
+            return self.ax.text(x+0.01, y+0.05, tag, color='white', fontsize=12)
+        return self.ax.text(x+0.01, y+0.01, tag, color='white', fontsize=8)
+
+    def append_to_layers(self, rows):
+        """Add a batch of store rows to the render layers without creating new collections."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        store = self.nodes
+        start = len(self.layer_rows)
+        pos = store.pos[rows]
+        self.layer_rows = np.concatenate([self.layer_rows, rows])
+        self.offsets = np.concatenate([self.offsets, pos])
+        colors, sizes = self.style.apply(store, rows)
+        self.sizes = np.concatenate([self.sizes, sizes])
+        self.colors = np.concatenate([self.colors, colors])
+        parents = store.parent[rows]
+        linked = parents >= 0
+        linked[linked] = store.alive[parents[linked]]
+        if linked.any():
+            segments = np.stack([store.pos[parents[linked]], pos[linked]], axis=1)
+            self.edges = np.concatenate([self.edges, segments])
+        self.tag_rows.update(zip(map(store.tags.__getitem__, rows.tolist()), range(start, start + len(rows))))
+
+    def clear_layers(self):
+        for label in self.labels.values():
+            label.remove()
+        self.layer_rows = np.empty(0, dtype=np.int64)
+        self.tag_rows = {}
+        self.offsets = np.empty((0, 2))
+        self.sizes = np.empty(0)
+        self.colors = np.empty((0, 4))
+        self.edges = np.empty((0, 2, 2))
+        self.outlines = []
+        self.labels = {}
+
+    @metrics.timed(RENDER_SECONDS, 'rebuild_layers')
+    def rebuild_layers(self):
+        """Rebuild every layer array from self.nodes in a single pass."""
+        self.clear_layers()
+        self.bounds = None
+        self.update_extents()
+        if self.lod:
+            self.view_key = None
+            self.render_view()
+        else:
+            live = self.nodes.live_rows()
+            self.append_to_layers(live)
+            self.outlines = self.ring_outlines(live)
+            self.sync_layers()
+            self.sync_labels()
+
+    def show_new_rows(self, rows):
+        """
+        Bring newly created store rows on screen and refit the view. While the
+        view stays put the new rows are staged and blitted; otherwise the figure
+        is redrawn.
+        """
+        if self.layout is not None and self.fit_layout(rows):
+            # Existing nodes moved to make room: extents and layers start over
+            self.rebuild_layers()
+            self.adjust_view()
+            self.fig.canvas.draw()
+            return
+        limits = (self.ax.get_xlim(), self.ax.get_ylim())
+        self.update_extents(rows)
+        if not self.lod:
+            self.append_to_layers(rows)
+            self.outlines.extend(self.ring_outlines(np.unique(self.nodes.parent[rows])))
+            self.sync_layers()
+        self.adjust_view()
+        if not self.lod:
+            self.sync_labels()
+        moved = (self.ax.get_xlim(), self.ax.get_ylim()) != limits  # The view change re-rendered the layers
+        if self.background is not None and not moved:
+            self.layers_stale = self.lod  # The layers catch up in the settle redraw
+            self.stage(rows)
+            return
+        if not moved:
+            self.view_key = None
+            self.render_view()
+        self.fig.canvas.draw()
+
+    def ring_outlines(self, rows):
+        """Closed polygons through the children of rows, for rows with more than two children."""
+        store = self.nodes
+        return [store.pos[kids + kids[:1]] for kids in map(store.children.get, np.asarray(rows).tolist())
+                if kids is not None and len(kids) > 2]
+
+    def sync_layers(self, edgecolors='face'):
+        """Push the layer arrays into the collections in place."""
+        self.node_layer.set_offsets(self.offsets)
+        self.node_layer.set_sizes(self.sizes)
+        self.node_layer.set_facecolor(self.colors)
+        self.node_layer.set_edgecolor(edgecolors)
+        self.edge_layer.set_segments(self.edges)
+        self.outline_layer.set_segments(self.outlines)
+
+    # -------------------------------------------------------------------------
+    # LEVEL OF DETAIL
+    # -------------------------------------------------------------------------
+
+    def update_extents(self, rows=None):
+        """
+        Maintain self.extent, the radius of each node's sub-structure around the
+        node. With rows (newly added leaves) only their ancestors are revisited,
+        and only while the extent still grows; otherwise it is rebuilt bottom-up,
+        one depth below the roots at a time (layers need not equal depth).
+        """
+        store = self.nodes
+        pos, parent = store.pos, store.parent
+        if rows is None:
+            self.extent = np.zeros(store.capacity)
+            live = store.live_rows()
+            self.root_rows = live[parent[live] < 0]
+            trees = [store.subtree_levels(root) for root in self.root_rows.tolist()]
+            for depth in range(max(map(len, trees), default=0) - 1, 0, -1):
+                rows = np.concatenate([levels[depth] for levels in trees if len(levels) > depth])
+                parents = parent[rows]
+                reach = np.hypot(*(pos[rows] - pos[parents]).T) + self.extent[rows]
+                np.maximum.at(self.extent, parents, reach)
+            return
+        if len(self.extent) < store.capacity:
+            self.extent = np.concatenate([self.extent, np.zeros(store.capacity - len(self.extent))])
+        rows = np.asarray(rows, dtype=np.int64)
+        self.extent[rows] = 0
+        while len(rows):
+            rows = rows[parent[rows] >= 0]
+            parents = parent[rows]
+            before = self.extent[parents]
+            reach = np.hypot(*(pos[rows] - pos[parents]).T) + self.extent[rows]
+            np.maximum.at(self.extent, parents, reach)
+            rows = np.unique(parents[self.extent[parents] > before])
+
+    def visible_rows(self, box, min_extent):
+        """
+        Walk the hierarchy from the roots, skipping sub-structures whose bounding
+        circle misses box (x0, y0, x1, y1). Returns (shown, collapsed): rows drawn
+        as nodes, and rows whose sub-structure is narrower than min_extent and is
+        drawn as one aggregate marker.
+        """
+        store = self.nodes
+        x0, y0, x1, y1 = box
+        children = store.children
+        shown, collapsed = [], []
+        frontier = self.root_rows
+        while len(frontier):
+            (x, y), r = store.pos[frontier].T, self.extent[frontier]
+            hit = (x + r >= x0) & (x - r <= x1) & (y + r >= y0) & (y - r <= y1)
+            frontier, r = frontier[hit], r[hit]
+            small = (r > 0) & (r < min_extent)
+            collapsed.append(frontier[small])
+            frontier = frontier[~small]
+            shown.append(frontier)
+            frontier = np.array([c for p in frontier.tolist() for c in children.get(p, ())],
+                                dtype=np.int64)
+        empty = np.empty(0, dtype=np.int64)
+        return (np.concatenate(shown) if shown else empty,
+                np.concatenate(collapsed) if collapsed else empty)
+
+    @metrics.timed(RENDER_SECONDS, 'render_view')
+    def render_view(self):
+        """
+        Fill the layers with what the current view needs: culled to the axes
+        limits, with small sub-structures collapsed and labels dropped when the
+        view is crowded. Skipped when the view has not changed since the last call;
+        the caller (or the pan/zoom that changed the limits) redraws. Without
+        LOD the layers hold every node and only the labels follow the view.
+        """
+        (x0, x1), (y0, y1) = self.ax.get_xlim(), self.ax.get_ylim()
+        bbox = self.ax.bbox
+        key = (x0, x1, y0, y1, bbox.width, bbox.height)
+        if key == self.view_key:
+            return
+        self.view_key = key
+        if not self.lod:
+            self.sync_labels()
+            return
+        self.layers_stale = False
+        scale = bbox.width / max(abs(x1 - x0), 1e-12)  # Pixels per data unit
+        margin = 20 / scale  # Keep markers whose centre is just off screen
+        box = (min(x0, x1) - margin, min(y0, y1) - margin, max(x0, x1) + margin, max(y0, y1) + margin)
+        shown, collapsed = self.visible_rows(box, LOD_PIXELS / scale)
+        store = self.nodes
+        rows = np.concatenate([shown, collapsed])
+        pos = store.pos[rows]
+
+        colors, sizes = self.style.apply(store, rows)
+        sizes[len(shown):] *= 1.5
+        edgecolors = colors.copy()
+        edgecolors[len(shown):] = (1, 1, 1, 1)  # Aggregates are enlarged and get a white rim
+        parents = store.parent[rows]
+        linked = parents >= 0
+        self.layer_rows = rows
+        self.offsets = pos
+        self.sizes = sizes
+        self.colors = colors
+        self.edges = np.stack([store.pos[parents[linked]], pos[linked]], axis=1)
+        self.outlines = self.ring_outlines(shown)
+        tags = [store.tags[row] for row in rows.tolist()]
+        self.tag_rows = dict(zip(tags, range(len(tags))))
+        self.sync_layers(edgecolors)
+        self.sync_labels()
+
+    def sync_labels(self):
+        """
+        Label the markers inside the axes limits, or none when more than
+        LABEL_LIMIT are, so at most LABEL_LIMIT Text artists ever exist.
+        """
+        (x0, x1), (y0, y1) = self.ax.get_xlim(), self.ax.get_ylim()
+        pos = self.offsets
+        on_screen = np.flatnonzero((pos[:, 0] >= min(x0, x1)) & (pos[:, 0] <= max(x0, x1)) &
+                                   (pos[:, 1] >= min(y0, y1)) & (pos[:, 1] <= max(y0, y1)))
+        tags = self.nodes.tags
+        wanted = {tags[row]: i for i, row in zip(on_screen.tolist(), self.layer_rows[on_screen].tolist())
+                  } if len(on_screen) <= LABEL_LIMIT else {}
+        for tag in [tag for tag in self.labels if tag not in wanted]:
+            self.labels.pop(tag).remove()
+        for tag in wanted.keys() - self.labels.keys():
+            x, y = pos[wanted[tag]]
+            self.labels[tag] = self.make_label(tag, x, y)
+
+    @metrics.timed(RENDER_SECONDS, 'adjust_view')
     def adjust_view(self):
         """
         Adjust the axes limits based on the positions of all nodes.
-        Adds a margin so that all nodes are visible.
+        Adds a margin so that all nodes are visible. Uses the cached bounds,
+        rescanning the store only after they were invalidated.
         """
         if not self.nodes:
             self.ax.set_xlim(-2, 2)
             self.ax.set_ylim(-2, 2)
             return
         
-        xs = [node['pos'][0] for node in self.nodes.values()]
-        ys = [node['pos'][1] for node in self.nodes.values()]
-        margin_x = (max(xs) - min(xs)) * 0.2 if max(xs) != min(xs) else 1.0
-        margin_y = (max(ys) - min(ys)) * 0.2 if max(ys) != min(ys) else 1.0
-        self.ax.set_xlim(min(xs) - margin_x, max(xs) + margin_x)
-        self.ax.set_ylim(min(ys) - margin_y, max(ys) + margin_y)
+        if self.bounds is None:
+            pos = self.nodes.pos[self.nodes.live_rows()]
+            self.bounds = np.concatenate([pos.min(axis=0), pos.max(axis=0)])
+        min_x, min_y, max_x, max_y = self.bounds
+        margin_x = (max_x - min_x) * 0.2 if max_x != min_x else 1.0
+        margin_y = (max_y - min_y) * 0.2 if max_y != min_y else 1.0
+        self.ax.set_xlim(min_x - margin_x, max_x + margin_x)
+        self.ax.set_ylim(min_y - margin_y, max_y + margin_y)
     
     def on_click(self, event):
         if event.button == 3:  # Right-click
@@ -146,29 +477,42 @@ class VSMNetwork:
                 self.show_general_context_menu(event)
                 
     def on_pick(self, event):
-        for tag, node in self.nodes.items():
-            if 'artist' in node and node['artist'] == event.artist:
-                self.show_node_context_menu(event, tag)
-                break
+        if event.artist is not self.node_layer or not len(event.ind):
+            return
+        row = event.ind[0]
+        mouse = event.mouseevent
+        if len(event.ind) > 1 and mouse.xdata is not None:
+            # Several markers overlap the cursor: take the closest one
+            d = np.hypot(*(self.offsets[event.ind] - (mouse.xdata, mouse.ydata)).T)
+            row = event.ind[np.argmin(d)]
+        self.show_node_context_menu(event, self.nodes.tags[self.layer_rows[row]])
                 
     def on_key(self, event):
         if event.key == 'a':
             self.add_child_nodes(self.seed_tag)
+        elif event.key == 'e':
+            self.expand_to_depth(depth=1)
         elif event.key == 'r':
             self.refresh_screen()
+        elif event.key == 'l':
+            self.lod = not self.lod
+            self.refresh_screen()
+        elif event.key == 'm':
+            self.toggle_metrics_overlay()
+        elif event.key == 'o':
+            self.toggle_layout()
+        elif event.key == 'c':
+            self.toggle_org_unit_colors()
+        elif event.key == 'escape':
+            self.highlight_nodes([])
         elif event.key == 'v':
             self.voice_command()
     
     def find_nearest_node(self, coords):
-        min_dist = float('inf')
-        nearest_tag = None
-        for tag, node in self.nodes.items():
-            node_pos = node['pos']
-            dist = np.linalg.norm(np.array(coords) - np.array(node_pos))
-            if dist < min_dist:
-                min_dist = dist
-                nearest_tag = tag
-        return nearest_tag, min_dist
+        return self.index.nearest(coords[0], coords[1])
+
+    def find_nodes_within(self, coords, radius):
+        return self.index.query_radius(coords[0], coords[1], radius)
     
     def show_node_context_menu(self, event, tag):
         menu = tk.Menu(self.tk_root, tearoff=0)
@@ -187,6 +531,8 @@ class VSMNetwork:
         submenu2 = tk.Menu(menu, tearoff=0)
         submenu2.add_command(label="Add Group Node", command=lambda: self.add_group_node(tag))
         submenu2.add_command(label="Delete Group Node", command=lambda: self.delete_group_node(tag))
+        submenu2.add_command(label="Delete Sub-Structure", command=lambda: self.delete_subtree(tag))
+        submenu2.add_command(label="Move Sub-Structure", command=lambda: self.ask_move_subtree(tag))
         menu.add_cascade(label="Modify Structure", menu=submenu2)
         try:
             menu.tk_popup(event.guiEvent.x_root, event.guiEvent.y_root)
@@ -200,6 +546,7 @@ class VSMNetwork:
         menu.add_command(label="Refresh Screen", command=self.refresh_screen)
         menu.add_command(label="Voice Command", command=self.voice_command)
         menu.add_command(label="Export Network", command=self.export_network)
+        menu.add_command(label="Import Network", command=self.import_network)
         try:
             menu.tk_popup(event.guiEvent.x_root, event.guiEvent.y_root)
         finally:
@@ -223,7 +570,8 @@ class VSMNetwork:
         info = (f"Tag: {node['tag']}\n"
                 f"Name: {node['name']}\n"
                 f"Position: {node['pos']}\n"
-                f"Layer: {node['layer']}")
+                f"Layer: {node['layer']}\n"
+                f"Sub-Structure: {self.subtree_size(tag)} nodes")
         label = tk.Label(hud, text=info, font=("Arial", 12))
         label.pack(padx=10, pady=10)
     
@@ -231,22 +579,13 @@ class VSMNetwork:
         self.add_child_nodes(tag)
     
     def trace_sub_structure(self, tag):
+        """Highlight the node and its whole sub-structure (Escape clears it)."""
         if tag not in self.nodes:
             return
-        self.ax.cla()
-        self.ax.set_facecolor('black')
-        for node in self.nodes.values():
-            pos = node['pos']
-            self.ax.scatter(pos[0], pos[1], s=get_marker_size(node['layer']),
-                            c=[get_node_color(node['layer'])], picker=True)
-            self.ax.text(pos[0]+0.01, pos[1]+0.01, node['tag'], color='white', fontsize=8)
-            if node['parent'] in self.nodes:
-                parent_pos = self.nodes[node['parent']]['pos']
-                self.ax.plot([parent_pos[0], pos[0]], [parent_pos[1], pos[1]],
-                             color='white', linewidth=2)
-        self.adjust_view()
-        self.fig.canvas.draw()
+        rows = self.nodes.subtree_rows(self.nodes.row(tag))
+        self.highlight_nodes([self.nodes.tags[row] for row in rows.tolist()])
     
+    @metrics.timed(RENDER_SECONDS, 'add_child_nodes')
     def add_child_nodes(self, parent_tag, poly_order=None):
         parent_node = self.nodes.get(parent_tag)
         if not parent_node:
@@ -254,34 +593,59 @@ class VSMNetwork:
         if poly_order is None:
             poly_order = parent_node.get('polyOrder', 6)
         edge_length = get_edge_length(parent_node['layer'])
-        child_positions, polygon = fractalise_object(parent_node, poly_order, edge_length)
-        self.ax.plot(polygon[:,0], polygon[:,1], color='cyan', linewidth=2)
-        for i, pos in enumerate(child_positions):
-            new_tag = f"{parent_tag}-{i+1}"
-            if new_tag in self.nodes:
-                continue
-            new_layer = parent_node['layer'] + 1
-            new_node = {
-                'tag': new_tag,
-                'pos': (pos[0], pos[1]),
-                'layer': new_layer,
-                'shape': parent_node['shape'],
-                'node': i+1,
-                'polyOrder': poly_order,
-                'parent': parent_tag,
-                'orgUnit': parent_node.get('orgUnit', ''),
-                'name': new_tag
-            }
-            self.nodes[new_tag] = new_node
-            nodes_db[new_tag] = new_node
-            scatter = self.ax.scatter(pos[0], pos[1],
-                                      s=get_marker_size(new_layer),
-                                      c=[get_node_color(new_layer)],
-                                      picker=True)
-            new_node['artist'] = scatter
-            self.ax.text(pos[0]+0.01, pos[1]+0.01, new_tag, color='white', fontsize=8)
-        self.adjust_view()
-        self.fig.canvas.draw()
+        child_positions, _ = fractalise_object(parent_node, poly_order, edge_length)
+        new_rows = self.create_children([self.nodes.row(parent_tag)], child_positions[None], poly_order)
+        self.show_new_rows(new_rows)
+
+    def create_children(self, parent_rows, child_positions, poly_order):
+        """
+        Register the children of each parent row in one store append, from child
+        positions shaped (parents, poly_order, 2). Existing tags are skipped.
+        Returns the new store rows. Does not redraw.
+        """
+        store = self.nodes
+        parents = np.repeat(np.asarray(parent_rows, dtype=np.int64), poly_order)
+        numbers = np.tile(np.arange(1, poly_order+1), len(parent_rows))
+        tags = [f"{store.tags[p]}-{n}" for p, n in zip(parents.tolist(), numbers.tolist())]
+        fresh = np.array([tag not in store for tag in tags], dtype=bool)
+        parents = parents[fresh]
+        new_rows = store.add_many([tag for tag, keep in zip(tags, fresh) if keep],
+                                  child_positions.reshape(-1, 2)[fresh],
+                                  store.layer[parents] + 1,
+                                  poly_order,
+                                  parents,
+                                  shapes=store.shape[parents],
+                                  nodes=numbers[fresh],
+                                  org_units=[store.org_units[p] for p in parents.tolist()])
+        self.index_rows(new_rows)
+        return new_rows
+
+    @metrics.timed(RENDER_SECONDS, 'expand_to_depth')
+    def expand_to_depth(self, parent_tags=None, depth=1):
+        """
+        Expand parent_tags (default: every current leaf) depth layers down in one go.
+        Each layer's child positions come from a single fractalise_objects broadcast
+        per polygon order, and the screen is redrawn once at the end.
+        """
+        store = self.nodes
+        if parent_tags is None:
+            live = store.live_rows()
+            frontier = np.setdiff1d(live, store.parent[live])
+        else:
+            frontier = np.array([store.row(tag) for tag in parent_tags if tag in store], dtype=np.int64)
+        new_rows = []
+        for _ in range(depth):
+            layer_rows = []
+            orders = store.poly_order[frontier]
+            for poly_order in np.unique(orders).tolist():
+                parents = frontier[orders == poly_order]
+                child_positions, _ = fractalise_objects(store.pos[parents], store.layer[parents], poly_order)
+                layer_rows.append(self.create_children(parents, child_positions, poly_order))
+            frontier = np.concatenate(layer_rows) if layer_rows else np.empty(0, dtype=np.int64)
+            new_rows.append(frontier)
+        new_rows = np.concatenate(new_rows) if new_rows else np.empty(0, dtype=np.int64)
+        self.show_new_rows(new_rows)
+        return new_rows
     
     def add_group_node(self, tag):
         dialog = tk.Toplevel(self.tk_root)
@@ -306,33 +670,283 @@ class VSMNetwork:
             dialog.winfo_screenheight()//2 - dialog.winfo_reqheight()//2))
     
     def delete_group_node(self, tag):
-        has_children = any(node.get('parent') == tag for node in self.nodes.values())
+        row = self.nodes.rows.get(tag)
+        has_children = row is not None and self.nodes.has_children(row)
         if has_children:
             messagebox.showinfo("Delete Node",
                                 "Cannot delete node with children. Remove children first.",
                                 parent=self.tk_root)
             return
         if tag in self.nodes:
+            parent = int(self.nodes.parent[row])
             del self.nodes[tag]
-        if tag in nodes_db:
-            del nodes_db[tag]
+            self.index.remove(tag)
+            if self.layout is not None and parent >= 0:
+                self.layout.removed([parent])
+        self.refresh_screen()
+
+    def subtree_size(self, tag):
+        """Number of nodes in the sub-structure rooted at tag, including tag itself."""
+        row = self.nodes.rows.get(tag)
+        return self.nodes.subtree_size(row) if row is not None else 0
+
+    def delete_subtree(self, tag):
+        """Delete a node together with its whole sub-structure."""
+        if tag not in self.nodes or tag == self.seed_tag:
+            return
+        parent = int(self.nodes.parent[self.nodes.row(tag)])
+        rows = self.nodes.remove_subtree(tag)
+        for row in rows.tolist():
+            self.index.remove(self.nodes.tags[row])
+        if self.layout is not None and parent >= 0:
+            self.layout.removed([parent])
+        self.refresh_screen()
+
+    def ask_move_subtree(self, tag):
+        new_parent = simpledialog.askstring("Move Sub-Structure", "Enter new parent tag:", parent=self.tk_root)
+        if not new_parent:
+            return
+        try:
+            self.move_subtree(tag, new_parent)
+        except (KeyError, ValueError) as e:
+            messagebox.showerror("Move Sub-Structure", f"Cannot move {tag}: {e}", parent=self.tk_root)
+
+    def move_subtree(self, tag, new_parent_tag):
+        """
+        Re-parent the sub-structure rooted at tag under new_parent_tag. Tags,
+        layers and positions of the moved nodes are recomputed. Without the
+        layout engine the destination ring is re-spread to make a slot for it
+        and each sibling's sub-structure is shifted along with it; with it,
+        neighbours move only if the engine has to make room.
+        """
+        if tag == self.seed_tag:
+            raise ValueError("the seed node cannot be moved")
+        store = self.nodes
+        old_parent = int(store.parent[store.row(tag)])
+        old_tags = [store.tags[row] for row in store.subtree_rows(store.row(tag)).tolist()]
+        levels = store.move_subtree(tag, new_parent_tag)
+        moved = np.concatenate(levels)
+        if self.layout is None:
+            # The ring gained a member: spread the siblings over it and shift
+            # their sub-structures by however far each sibling moved
+            ring = np.array(store.child_rows(store.row(new_parent_tag)), dtype=np.int64)
+            before = store.pos[ring].copy()
+            place_levels(store, [ring])
+            place_levels(store, levels[1:])
+            moved = [ring] + levels[1:]
+            for sibling, offset in zip(ring.tolist(), store.pos[ring] - before):
+                if sibling != levels[0][0] and offset.any():
+                    rows = store.descendant_rows(sibling)
+                    store.pos[rows] += offset
+                    moved.append(rows)
+            moved = np.concatenate(moved)
+        else:
+            self.layout.removed([old_parent])
+            self.layout.relayout(levels[0][0])  # Layers changed, so the sub-structure is repacked
+            moved = np.union1d(moved, self.layout.place(levels[0]))
+            self.bounds = None
+        for old_tag in old_tags:
+            self.index.remove(old_tag)
+        self.index_rows(moved)
         self.refresh_screen()
+        return store.tags[levels[0][0]]
     
-    def flash_node(self, tag):
-        node = self.nodes.get(tag)
-        if not node:
+    # -------------------------------------------------------------------------
+    # LAYOUT ENGINE
+    # -------------------------------------------------------------------------
+
+    def toggle_layout(self):
+        """
+        Switch between the overlap-free layout engine and the classic fractal
+        polygons. Either way every node is re-placed once.
+        """
+        store = self.nodes
+        if self.layout is None:
+            self.layout = Layout(store)
+            self.layout.relayout()
+        else:
+            self.layout = None
+            live = store.live_rows()
+            roots = live[store.parent[live] < 0]
+            for root in roots.tolist():
+                place_levels(store, store.subtree_levels(root))
+        self.index.clear()
+        self.index_rows(store.live_rows())
+        self.refresh_screen()
+
+    def fit_layout(self, rows):
+        """
+        Place new rows with the layout engine and re-index whatever moved.
+        Returns True when existing nodes had to move to make room.
+        """
+        moved = self.layout.place(rows)
+        self.index_rows(moved)
+        self.bounds = None
+        return len(np.setdiff1d(moved, rows)) > 0
+
+    # -------------------------------------------------------------------------
+    # STYLING
+    # -------------------------------------------------------------------------
+
+    def toggle_org_unit_colors(self):
+        """Color nodes by org unit, or back by layer."""
+        rules = [rule for rule in self.style.rules if not isinstance(rule, OrgUnitRule)]
+        if len(rules) == len(self.style.rules):
+            rules.append(OrgUnitRule())
+        self.style.rules = rules
+        self.restyle()
+
+    @metrics.timed(RENDER_SECONDS, 'restyle')
+    def restyle(self):
+        """Recolor and resize the drawn nodes after self.style or its rules changed."""
+        if self.lod:
+            self.view_key = None
+            self.render_view()
+        else:
+            self.colors, self.sizes = self.style.apply(self.nodes, self.layer_rows)
+            self.sync_layers()
+        if len(self.stage_rows):
+            colors, sizes = self.style.apply(self.nodes, self.stage_rows)
+            self.stage_node_layer.set_sizes(sizes)
+            self.stage_node_layer.set_facecolor(colors)
+        self.fig.canvas.draw_idle()
+
+    # -------------------------------------------------------------------------
+    # ANIMATION: OVERLAYS BLITTED OVER THE CACHED BACKGROUND
+    # -------------------------------------------------------------------------
+
+    def init_overlays(self):
+        """
+        Create the animated artists that change between full draws: staged nodes
+        (added since the last full draw), highlights and the flash marker. They
+        are left out of full draws; after each one the canvas is cached and they
+        are drawn on top, and later updates only restore that cache, draw them
+        and blit.
+        """
+        self.background = None  # Canvas pixels of the last full draw, without overlays
+        self.stage_rows = np.empty(0, dtype=np.int64)
+        self.highlight_tags = []
+        self.stage_edge_layer = LineCollection([], colors='white', linewidths=2, zorder=1, animated=True)
+        self.stage_outline_layer = LineCollection([], colors='cyan', linewidths=2, zorder=2, animated=True)
+        self.ax.add_collection(self.stage_edge_layer, autolim=False)
+        self.ax.add_collection(self.stage_outline_layer, autolim=False)
+        self.stage_node_layer = self.ax.scatter([], [], zorder=3, animated=True)
+        self.highlight_layer = self.ax.scatter([], [], facecolors='none', edgecolors='yellow',
+                                               linewidths=2, zorder=4, animated=True)
+        self.flash_layer = self.ax.scatter([], [], zorder=5, animated=True)
+        self.flash_timer = None
+        self.flash_ticks = 0
+        self.settle_timer = self.fig.canvas.new_timer(interval=SETTLE_MS)
+        self.settle_timer.single_shot = True
+        self.settle_timer.add_callback(self.settle)
+
+    def overlay_artists(self):
+        store, labels = self.nodes, self.labels
+        staged_labels = [labels[tag] for tag in map(store.tags.__getitem__, self.stage_rows.tolist())
+                         if tag in labels]
+        artists = [self.stage_edge_layer, self.stage_outline_layer, self.stage_node_layer, *staged_labels,
+                   self.highlight_layer, self.flash_layer]
+        if self.metrics_overlay is not None:
+            artists.append(self.metrics_overlay)
+        return artists
+
+    def draw_overlays(self):
+        for artist in self.overlay_artists():
+            self.ax.draw_artist(artist)
+
+    def on_draw(self, event):
+        """
+        After a full draw: cache it, retire the staged nodes if the layers drew
+        them, and draw the overlays on top.
+        """
+        canvas = self.fig.canvas
+        self.background = canvas.copy_from_bbox(self.fig.bbox) if canvas.supports_blit else None
+        if len(self.stage_rows) and not self.layers_stale:
+            self.stage_rows = np.empty(0, dtype=np.int64)
+            self.stage_node_layer.set_offsets(np.empty((0, 2)))
+            self.stage_edge_layer.set_segments([])
+            self.stage_outline_layer.set_segments([])
+        self.sync_highlight()
+        self.draw_overlays()
+
+    def blit_overlays(self):
+        """Redraw only the overlays: restore the cached background, draw them on top and blit."""
+        canvas = self.fig.canvas
+        if self.background is None:
+            canvas.draw_idle()
             return
-        artist = node.get('artist')
-        if artist is None:
+        canvas.restore_region(self.background)
+        self.draw_overlays()
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def stage(self, rows):
+        """
+        Show new rows without a full draw: their markers, edges and polygon
+        outlines go to the staging overlay, which is blitted. A full redraw
+        folds them into the background once additions pause for SETTLE_MS.
+        """
+        store = self.nodes
+        self.stage_rows = staged = np.concatenate([self.stage_rows, rows])
+        colors, sizes = self.style.apply(store, staged)
+        self.stage_node_layer.set_offsets(store.pos[staged])
+        self.stage_node_layer.set_sizes(sizes)
+        self.stage_node_layer.set_facecolor(colors)
+        parents = store.parent[staged]
+        linked = parents >= 0
+        self.stage_edge_layer.set_segments(np.stack([store.pos[parents[linked]], store.pos[staged[linked]]], axis=1))
+        self.stage_outline_layer.set_segments(self.ring_outlines(np.unique(parents[linked])))
+        self.blit_overlays()
+        self.settle_timer.stop()
+        self.settle_timer.start()
+
+    def settle(self):
+        """Fold the staged nodes into the layers with one full redraw."""
+        if self.layers_stale:
+            self.view_key = None
+            self.render_view()
+        self.fig.canvas.draw_idle()
+
+    def highlight_nodes(self, tags):
+        """Ring the nodes with tags in yellow until the next call (an empty list clears it)."""
+        self.highlight_tags = list(tags)
+        self.sync_highlight()
+        self.blit_overlays()
+
+    def sync_highlight(self):
+        rows = self.nodes.rows
+        live = np.array([rows[tag] for tag in self.highlight_tags if tag in rows], dtype=np.int64)
+        _, sizes = self.style.apply(self.nodes, live)
+        self.highlight_layer.set_offsets(self.nodes.pos[live].reshape(-1, 2))
+        self.highlight_layer.set_sizes(sizes * 2)
+
+    def flash_node(self, tag, flashes=5, interval=250):
+        """
+        Blink a node at three times its size without blocking the event loop: a
+        timer toggles the flash overlay every interval ms, and each toggle is
+        one blit.
+        """
+        row = self.nodes.rows.get(tag)
+        if row is None:
             return
-        original_size = artist.get_sizes()[0]
-        for _ in range(5):
-            artist.set_sizes([original_size * 3])
-            self.fig.canvas.draw_idle()
-            plt.pause(0.25)
-            artist.set_sizes([original_size])
-            self.fig.canvas.draw_idle()
-            plt.pause(0.25)
+        colors, sizes = self.style.apply(self.nodes, [row])
+        self.flash_layer.set_offsets(self.nodes.pos[row:row+1])
+        self.flash_layer.set_sizes(sizes * 3)
+        self.flash_layer.set_facecolor(colors)
+        self.flash_ticks = 2 * flashes
+        if self.flash_timer is None:
+            self.flash_timer = self.fig.canvas.new_timer()
+            self.flash_timer.add_callback(self.flash_step)
+        self.flash_timer.interval = interval
+        self.flash_timer.start()
+        self.flash_step()
+
+    def flash_step(self):
+        self.flash_ticks -= 1
+        self.flash_layer.set_visible(self.flash_ticks % 2 == 1)
+        if self.flash_ticks <= 0:
+            self.flash_timer.stop()
+        self.blit_overlays()
     
     def voice_command(self):
         try:
@@ -372,33 +986,67 @@ class VSMNetwork:
         messagebox.showinfo("Organisations", msg, parent=self.tk_root)
     
     def export_network(self):
-        filename = simpledialog.askstring("Export Network", "Enter filename (e.g. network.csv):", parent=self.tk_root)
+        filename = simpledialog.askstring("Export Network", "Enter filename (network.csv, or network.npy for binary):", parent=self.tk_root)
         if filename:
             try:
-                with open(filename, mode='w', newline='') as csv_file:
-                    fieldnames = ['tag', 'pos', 'layer', 'shape', 'node', 'polyOrder', 'parent', 'orgUnit', 'name']
-                    writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-                    writer.writeheader()
-                    for node in self.nodes.values():
-                        writer.writerow(node)
+                network_io.export_network(self.nodes, filename)
                 messagebox.showinfo("Export Network", f"Network exported to {filename}.", parent=self.tk_root)
             except Exception as e:
                 messagebox.showerror("Export Network", f"Error exporting network: {e}", parent=self.tk_root)
     
+    def import_network(self):
+        filename = simpledialog.askstring("Import Network", "Enter filename (.csv or .npy):", parent=self.tk_root)
+        if filename:
+            try:
+                self.load_nodes(network_io.import_network(filename))
+                messagebox.showinfo("Import Network", f"Imported {len(self.nodes)} nodes from {filename}.", parent=self.tk_root)
+            except Exception as e:
+                messagebox.showerror("Import Network", f"Error importing network: {e}", parent=self.tk_root)
+    
+    def load_nodes(self, store):
+        """Replace the displayed network with the contents of store."""
+        self.nodes.assign(store)
+        if self.layout is not None:
+            self.layout = Layout(self.nodes)
+            self.layout.adopt()  # Imported positions are kept until something needs room
+        self.index.clear()
+        self.index_rows(self.nodes.live_rows())
+        self.create_seed_node()
+    
+    def toggle_metrics_overlay(self):
+        """
+        Show live render timings in the corner of the axes, refreshed (and logged
+        when they change) once a second. Showing the overlay enables metrics.
+        """
+        if self.metrics_overlay is not None:
+            self.metrics_timer.stop()
+            self.metrics_overlay.remove()
+            self.metrics_overlay = self.metrics_timer = None
+            self.blit_overlays()
+            return
+        metrics.enable()
+        self.metrics_overlay = self.ax.text(0.01, 0.99, '', transform=self.ax.transAxes, va='top',
+                                            color='yellow', fontsize=7, family='monospace', zorder=5,
+                                            animated=True)
+        self.metrics_timer = self.fig.canvas.new_timer(interval=1000)
+        self.metrics_timer.add_callback(self.update_metrics_overlay)
+        self.metrics_timer.start()
+        self.update_metrics_overlay()
+
+    def update_metrics_overlay(self):
+        text = '\n'.join(metrics.REGISTRY.summary_lines())
+        if self.metrics_overlay is None or text == self.metrics_overlay.get_text():
+            return
+        self.metrics_overlay.set_text(text)
+        logger.info("metrics: %s", text.replace('\n', '; '))
+        self.blit_overlays()
+
+    @metrics.timed(RENDER_SECONDS, 'refresh_screen')
     def refresh_screen(self):
-        self.ax.cla()
-        self.ax.set_facecolor('black')
-        for node in self.nodes.values():
-            pos = node['pos']
-            size = get_marker_size(node['layer'])
-            color = get_node_color(node['layer'])
-            scatter = self.ax.scatter(pos[0], pos[1], s=size, c=[color], picker=True)
-            node['artist'] = scatter
-            # Optionally, adjust label font size based on number of nodes
-            self.ax.text(pos[0]+0.01, pos[1]+0.01, node['tag'], color='white', fontsize=8)
-            if node['parent'] in self.nodes:
-                parent_pos = self.nodes[node['parent']]['pos']
-                self.ax.plot([parent_pos[0], pos[0]], [parent_pos[1], pos[1]], color='white', linewidth=2)
+        remap = self.nodes.maybe_compact()
+        if remap is not None and self.layout is not None:
+            self.layout.remap(remap)
+        self.rebuild_layers()
         self.adjust_view()
         self.fig.canvas.draw()
     
@@ -410,6 +1058,7 @@ class VSMNetwork:
 # -----------------------------------------------------------------------------
 
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
     network = VSMNetwork()
     network.run()
 